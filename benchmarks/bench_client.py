@@ -0,0 +1,181 @@
+"""Measure the client's hot path against a local mock Hutoma server.
+
+Each scenario makes requests through a fresh client pointed at
+:class:`mock_server.MockHutomaServer` and reports the requests per second,
+the latency percentiles recorded by the client's stats, the errors raised
+once retries were exhausted and the peak memory allocated meanwhile.
+
+- request_json: one thread fetching a different AI each time (cache misses)
+- cache: one thread fetching the same AI list (cache hits)
+- threads: several threads fetching different AIs
+- batch: ``chat_many`` asking questions concurrently
+- rate_limit: one thread under ``api_request_delay``, to compare the rate
+  achieved with the rate configured
+- answers: one thread under ``api_request_delay`` asking the questions of
+  ``training_material/complex`` over and over, in varying case, with the
+  chat answer cache on; the latency percentiles are those of the requests
+  actually sent
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/bench_client.py [--requests N] [--threads N]
+        [--latency SECONDS] [--payload-size N] [--error-rate FRACTION]
+        [--redirect-rate FRACTION] [--no-memory] [--phases] [scenario ...]
+
+Tracking memory slows Python down; pass --no-memory for throughput figures
+that can be compared with those of other runs.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import io
+import os
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+from hutoma import HutomaUserKey
+from hutoma.errors import HutomaException
+from requests.exceptions import RequestException
+
+from mock_server import MockHutomaServer
+
+FAILURES = (HutomaException, RequestException)
+
+
+def get_ai(session, index):
+    """Fetch an AI, returning 1 if it failed after the retries."""
+    try:
+        session.get_ai('ai-{0}'.format(index))
+    except FAILURES:
+        return 1
+    return 0
+
+
+def request_json(session, options):
+    return sum(get_ai(session, index) for index in range(options.requests))
+
+
+def cache(session, options):
+    errors = 0
+    for _ in range(options.requests):
+        try:
+            session.get_ai_list()
+        except FAILURES:
+            errors += 1
+    return errors
+
+
+def threads(session, options):
+    with ThreadPoolExecutor(options.threads) as executor:
+        return sum(executor.map(lambda index: get_ai(session, index),
+                                range(options.requests)))
+
+
+def batch(session, options):
+    questions = ('Question {0}?'.format(index)
+                 for index in range(options.requests))
+    results = session.chat_many('benchmark', questions, options.threads)
+    return sum(1 for result in results if result.error is not None)
+
+
+def rate_limit(session, options):
+    return request_json(session, options)
+
+
+def answers(session, options):
+    path = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'training_material', 'complex',
+        'source.txt')
+    with io.open(path, encoding='utf-8') as source:
+        questions = [line.strip() for line in source if line.strip()]
+    errors = 0
+    for index in range(options.requests):
+        question = questions[index % len(questions)]
+        try:
+            session.chat('benchmark', question.upper() if index % 2 else
+                         question + '?')
+        except FAILURES:
+            errors += 1
+    return errors
+
+
+SCENARIOS = [request_json, cache, threads, batch, rate_limit, answers]
+
+
+def run(scenario, server, options):
+    settings = server.client_settings()
+    settings.update(api_request_delay=0, log_requests=0,
+                    pool_maxsize=max(10, options.threads))
+    if scenario in (rate_limit, answers):
+        settings.update(api_request_delay=options.delay,
+                        api_request_burst=1)
+    if scenario is answers:
+        settings.update(chat_cache_timeout=60)
+    session = HutomaUserKey('benchmark', user_key='benchmark', **settings)
+    session.handler.clear_cache()
+    if options.memory:
+        tracemalloc.start()
+    started = timer()
+    errors = scenario(session, options)
+    elapsed = timer() - started
+    peak = tracemalloc.get_traced_memory()[1] if options.memory else 0
+    tracemalloc.stop()
+    totals = [histograms['total'] for histograms in
+              session.stats.snapshot().values() if 'total' in histograms]
+    total = max(totals, key=lambda summary: summary['count'])
+    print('{0:<14} {1:>9.1f} {2:>9.2f} {3:>9.2f} {4:>9.2f} {5:>7} {6:>9}'
+          .format(scenario.__name__, options.requests / elapsed,
+                  total['p50'] * 1e3, total['p95'] * 1e3, total['p99'] * 1e3,
+                  errors, peak // 1024 if options.memory else '-'))
+    if scenario is rate_limit:
+        print('{0:<14} configured {1:.1f} requests/s'.format(
+            '', 1.0 / options.delay))
+    if options.phases:
+        print(session.stats.format())
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help='the scenarios to run, by default all of them')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='the seconds the server delays each response')
+    parser.add_argument('--payload-size', type=int, default=100,
+                        help='the number of AIs in the AI list')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--redirect-rate', type=float, default=0.0)
+    parser.add_argument('--delay', type=float, default=0.01,
+                        help='the api_request_delay of rate_limit')
+    parser.add_argument('--no-memory', dest='memory', action='store_false')
+    parser.add_argument('--phases', action='store_true',
+                        help='print the latency of each request phase')
+    options = parser.parse_args()
+    names = [scenario.__name__ for scenario in SCENARIOS]
+    for name in options.scenarios:
+        if name not in names:
+            parser.error('unknown scenario {0}; choose from {1}'.format(
+                name, ', '.join(names)))
+    names = options.scenarios or names
+
+    with MockHutomaServer(options.latency, options.payload_size,
+                          options.error_rate, options.redirect_rate) as server:
+        print('{0} requests, {1} threads, {2:.1f} ms latency, {3:.0%} errors, '
+              '{4:.0%} redirects'.format(
+                  options.requests, options.threads, options.latency * 1e3,
+                  options.error_rate, options.redirect_rate))
+        print('{0:<14} {1:>9} {2:>9} {3:>9} {4:>9} {5:>7} {6:>9}'.format(
+            'scenario', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors',
+            'peak KiB'))
+        for scenario in SCENARIOS:
+            if scenario.__name__ in names:
+                run(scenario, server, options)
+
+
+if __name__ == '__main__':
+    main()
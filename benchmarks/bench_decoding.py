@@ -0,0 +1,80 @@
+"""Compare the JSON decoding of large ai_list responses.
+
+The previous pipeline ran a regular expression replacing HTML entities over
+the whole response text before parsing it. The current one parses the body
+bytes directly and only replaces entities in string values when the response
+is not declared as JSON.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/bench_decoding.py [number of AIs]
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import json
+import re
+import sys
+from timeit import repeat
+
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from six.moves import html_entities  # pylint: disable=F0401
+
+from hutoma.internal import _decode_json
+
+
+def ai_list_response(count, content_type):
+    """Return a response listing `count` AIs."""
+    ais = [{'aiid': '36f96e07-1dd8-4b71-a77b-{0:012d}'.format(index),
+            'name': 'AI number {0}'.format(index),
+            'description': 'Answers questions about Q&amp;A, sky &amp; sea',
+            'created_on': '2016-11-21T10:00:00Z',
+            'is_private': False,
+            'personality': 0,
+            'confidence': 0.4,
+            'ai_status': 'training_completed'} for index in range(count)]
+    payload = {'status': {'code': 200, 'errorType': 'Success.'},
+               'ai_list': ais}
+    response = Response()
+    response.status_code = 200
+    response.headers = CaseInsensitiveDict({'Content-Type': content_type})
+    response.encoding = 'utf-8'
+    response._content = json.dumps(payload).encode('utf-8')
+    return response
+
+
+def previous_pipeline(response):
+    """Decode a response the way BaseHutoma._request used to."""
+    def decode(match):
+        return chr(html_entities.name2codepoint[match.group(1)])
+    return json.loads(re.sub('&([^;]+);', decode, response.text))
+
+
+def measure(label, function, response):
+    best = min(repeat(lambda: function(response), number=5, repeat=5)) / 5
+    size = len(response.content) / 1e6
+    print('{0:<40} {1:8.2f} ms {2:8.1f} MB/s'.format(label, best * 1e3,
+                                                   size / best))
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    json_response = ai_list_response(count, 'application/json')
+    text_response = ai_list_response(count, 'text/html; charset=utf-8')
+    print('ai_list of {0} AIs, {1:.1f} MB'.format(
+        count, len(json_response.content) / 1e6))
+    # Reading `text` caches nothing on the response, so every run decodes
+    previous = measure('previous: regex over text + json.loads',
+                       previous_pipeline, json_response)
+    current = measure('current: application/json', _decode_json,
+                      json_response)
+    measure('current: text/html (unescape strings)', _decode_json,
+            text_response)
+    print('application/json savings: {0:.0%}'.format(1 - current / previous))
+
+
+if __name__ == '__main__':
+    main()
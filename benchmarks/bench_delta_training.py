@@ -0,0 +1,104 @@
+"""Time re-uploading a training corpus after small edits.
+
+A generated corpus is uploaded to :class:`mock_server.MockHutomaServer`
+with a manifest, then uploaded again:
+
+* unchanged, which only hashes the files;
+* with 1% of pairs appended, which uploads those pairs alone;
+* with 1% of pairs removed, which uploads nothing and raises
+  :class:`hutoma.errors.TrainingPairsRemoved`.
+
+For each, the upload mode, the chunks and pairs uploaded and the time taken
+are reported, together with the speed at which the files were hashed.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/bench_delta_training.py [--pairs N]
+        [--latency SECONDS]
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+from timeit import default_timer as timer
+
+from hutoma import HutomaUserKey
+from hutoma.errors import TrainingPairsRemoved
+from hutoma.training import DeltaTrainingUpload, file_digest
+
+from mock_server import MockHutomaServer
+
+SETTINGS = {'api_request_delay': 0, 'log_requests': 0,
+            'user_key': 'benchmark', 'circuit_failure_rate': 0}
+
+
+def write_corpus(directory, numbers):
+    source_path = os.path.join(directory, 'source.txt')
+    target_path = os.path.join(directory, 'target.txt')
+    with io.open(source_path, 'w', encoding='utf-8') as source, \
+            io.open(target_path, 'w', encoding='utf-8') as target:
+        for number in numbers:
+            source.write('What is the colour of thing number {0}?\n'
+                         .format(number))
+            target.write('Thing number {0} is as blue as the sky over the '
+                         'sea.\n'.format(number))
+    return source_path, target_path
+
+
+def run(label, session, paths, manifest_path):
+    upload = DeltaTrainingUpload(session, 'benchmark', paths[0], paths[1],
+                                 manifest_path)
+    started = timer()
+    try:
+        upload.run()
+    except TrainingPairsRemoved:
+        pass  # Reported by the mode of the upload
+    elapsed = timer() - started
+    print('{0:<10} {1:<10} {2:>7} {3:>9} {4:>9} {5:>9.3f} s'.format(
+        label, upload.mode, upload.uploaded, upload.added, upload.removed,
+        elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--pairs', type=int, default=500000)
+    parser.add_argument('--latency', type=float, default=0.01)
+    options = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    manifest_path = os.path.join(directory, 'manifest')
+    pairs = options.pairs
+    try:
+        with MockHutomaServer(options.latency) as server:
+            session = HutomaUserKey('benchmark', **dict(
+                SETTINGS, **server.client_settings()))
+            print('{0:<10} {1:<10} {2:>7} {3:>9} {4:>9} {5:>11}'.format(
+                'run', 'mode', 'chunks', 'added', 'removed', 'time'))
+            paths = write_corpus(directory, range(pairs))
+            run('first', session, paths, manifest_path)
+            run('unchanged', session, paths, manifest_path)
+            paths = write_corpus(directory, range(pairs + pairs // 100))
+            run('appended', session, paths, manifest_path)
+            paths = write_corpus(directory, range(pairs // 100,
+                                                  pairs + pairs // 100))
+            run('removed', session, paths, manifest_path)
+
+        size = sum(os.path.getsize(path) for path in paths)
+        started = timer()
+        for path in paths:
+            file_digest(path)
+        elapsed = timer() - started
+        print('hashed {0:.1f} MiB at {1:.0f} MiB/s; manifest {2} KiB'.format(
+            size / 2.0 ** 20, size / 2.0 ** 20 / elapsed,
+            os.path.getsize(manifest_path) // 1024))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
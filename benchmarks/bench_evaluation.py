@@ -0,0 +1,90 @@
+"""Compare scoring the answers of an evaluation in processes and in a thread.
+
+A corpus of questions with long expected answers is evaluated against
+:class:`mock_server.MockHutomaServer`, whose answers are long as well, first
+scoring in the calling thread, as evaluations do by default, and then in a
+pool of processes. Raise --answer-words to find the length of answers from
+which the processes pay off.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/bench_evaluation.py [--questions N]
+        [--answer-words N] [--processes N] [--concurrency N]
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import io
+import os
+import random
+import shutil
+import tempfile
+from timeit import default_timer as timer
+
+from hutoma import HutomaUserKey
+
+from mock_server import MockHutomaServer
+
+WORDS = ('the sky is blue and the sea is deep while clouds drift over hills '
+         'where rivers run to a quiet town').split()
+
+
+def sentence(rand, words):
+    return ' '.join(rand.choice(WORDS) for _ in range(words))
+
+
+def write_corpus(directory, questions, words, rand):
+    """Write a source and target file pair and return their paths."""
+    paths = [os.path.join(directory, name)
+             for name in ('source.txt', 'target.txt')]
+    with io.open(paths[0], 'w', encoding='utf-8') as source, \
+            io.open(paths[1], 'w', encoding='utf-8') as target:
+        for index in range(questions):
+            source.write('question number {0}\n'.format(index))
+            target.write(sentence(rand, words) + '\n')
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--questions', type=int, default=400)
+    parser.add_argument('--answer-words', type=int, default=80)
+    parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                        help='the scoring processes, by default one per CPU')
+    parser.add_argument('--concurrency', type=int, default=8)
+    options = parser.parse_args()
+
+    rand = random.Random(0)
+    directory = tempfile.mkdtemp()
+    try:
+        source, target = write_corpus(directory, options.questions,
+                                      options.answer_words, rand)
+        answer = sentence(rand, options.answer_words)
+        with MockHutomaServer(answer=answer) as server:
+            session = HutomaUserKey('benchmark', user_key='benchmark',
+                                    api_request_delay=0, log_requests=0,
+                                    pool_maxsize=options.concurrency,
+                                    **server.client_settings())
+            print('{0} questions, answers of {1} words'.format(
+                options.questions, options.answer_words))
+            for label, processes in (('thread', 0),
+                                     ('processes', options.processes)):
+                session.handler.clear_cache()  # Ask every question again
+                results = os.path.join(directory, label + '.jsonl')
+                started = timer()
+                summary = session.evaluate('benchmark', source, target,
+                                           results, options.concurrency,
+                                           processes)
+                elapsed = timer() - started
+                print('{0:<10} {1:>8.2f} s {2:>8.1f} questions/s  mean edit '
+                      'similarity {3:.3f}'.format(
+                          label, elapsed, summary['scored'] / elapsed,
+                          summary['edit_similarity']))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
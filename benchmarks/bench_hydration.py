@@ -0,0 +1,91 @@
+"""Time fetching the details of every AI of a long AI list.
+
+The AIs listed by :class:`mock_server.MockHutomaServer` are hydrated:
+
+* serially, calling `get_ai` for each AI of the list;
+* lazily, one AI at a time, when each AI object made from the list is
+  accessed on its own;
+* lazily from :meth:`.get_ais`, where the first access prefetches them all;
+* eagerly with :meth:`.hydrate_ais`;
+* with :meth:`.hydrate_ais` again, from the cache.
+
+The cache is cleared before each run but the last. The rate limit is
+disabled; with a request delay the fetches are spread by the limiter
+whatever their concurrency.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/bench_hydration.py [--ais N]
+        [--latency SECONDS] [--concurrency N]
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+from timeit import default_timer as timer
+
+from hutoma import HutomaUserKey
+from hutoma.objects import AI
+
+from mock_server import MockHutomaServer
+
+SETTINGS = {'api_request_delay': 0, 'api_request_burst': 1000,
+            'log_requests': 0, 'user_key': 'benchmark',
+            'circuit_failure_rate': 0}
+
+
+def serial(session, _):
+    for item in session.get_ai_list()['ai_list']:
+        session.get_ai(item['aiid'])
+
+
+def lazy_single(session, _):
+    for item in session.get_ai_list()['ai_list']:
+        AI(session, item).timezone  # pylint: disable=W0106
+
+
+def lazy_batched(session, concurrency):
+    for ai in session.get_ais(concurrency=concurrency):
+        ai.timezone  # pylint: disable=W0106
+
+
+def eager(session, concurrency):
+    session.get_ais(hydrate=True, concurrency=concurrency)
+
+
+def run(label, function, session, server, concurrency, clear=True):
+    if clear:
+        session.handler.clear_cache()
+    before = server.counts.get('ai', 0)
+    started = timer()
+    function(session, concurrency)
+    elapsed = timer() - started
+    print('{0:<22} {1:>9.3f} s {2:>6} requests'.format(
+        label, elapsed, server.counts.get('ai', 0) - before))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ais', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='the seconds the server delays each response')
+    parser.add_argument('--concurrency', type=int, default=16)
+    options = parser.parse_args()
+
+    with MockHutomaServer(options.latency, payload_size=options.ais) \
+            as server:
+        session = HutomaUserKey('benchmark', **dict(
+            SETTINGS, **server.client_settings()))
+        run('serial get_ai', serial, session, server, options.concurrency)
+        run('lazy, one at a time', lazy_single, session, server,
+            options.concurrency)
+        run('lazy, prefetched', lazy_batched, session, server,
+            options.concurrency)
+        run('hydrate_ais', eager, session, server, options.concurrency)
+        run('hydrate_ais, cached', eager, session, server,
+            options.concurrency, clear=False)
+
+
+if __name__ == '__main__':
+    main()
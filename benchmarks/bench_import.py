@@ -0,0 +1,120 @@
+"""Measure the time taken to import hutoma and to construct clients.
+
+Each run imports hutoma in a fresh interpreter under ``python -X importtime``
+after importing requests and six, which any program using the client pays
+for anyway, and reports the time spent importing hutoma's own modules. The
+median of the runs is compared with the target and the script exits with
+status 1 when the target is missed, so that it can guard against
+regressions. Reading the configuration and the platform string at import
+used to take around 40 ms on top of requests.
+
+The time to construct the first client, which reads the hutoma.ini files,
+and the following ones is reported as well.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/bench_import.py [--runs N] [--target-ms MS]
+        [--top N]
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONSTRUCT = '''
+from timeit import default_timer as timer
+from hutoma import HutomaUserKey
+start = timer()
+HutomaUserKey('bench_import')
+first = timer() - start
+start = timer()
+for _ in range(1000):
+    HutomaUserKey('bench_import')
+print(first * 1e3, timer() - start)  # ms, and seconds per 1000 = ms each
+'''
+
+
+def python(*args):
+    """Run the interpreter from the repository and return its output."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [path for path in [env.get('PYTHONPATH')] if path])
+    process = subprocess.Popen((sys.executable,) + args, cwd=ROOT, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    if process.returncode:
+        raise SystemExit(err.decode('utf-8', 'replace'))
+    return out.decode('utf-8'), err.decode('utf-8')
+
+
+def import_times():
+    """Return the total and a dict of module -> self time in ms of hutoma."""
+    _, err = python('-X', 'importtime', '-c', 'import requests, six; '
+                    'import hutoma')
+    total, modules = None, {}
+    for line in err.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        try:
+            own, cumulative = int(own) / 1e3, int(cumulative) / 1e3
+        except ValueError:  # The header
+            continue
+        name = name.strip()
+        if name.split('.')[0] == 'hutoma':
+            modules[name] = own
+        if name == 'hutoma':
+            total = cumulative
+    return total, modules
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=9)
+    parser.add_argument('--target-ms', type=float, default=30.0,
+                        help='the most the median import may take')
+    parser.add_argument('--top', type=int, default=8,
+                        help='the number of slowest hutoma modules to list')
+    options = parser.parse_args()
+
+    python('-c', 'import hutoma')  # Write the bytecode caches
+    totals, own = [], defaultdict(list)
+    for _ in range(options.runs):
+        total, modules = import_times()
+        totals.append(total)
+        for name, duration in modules.items():
+            own[name].append(duration)
+    print('import hutoma: median {0:.1f} ms, best {1:.1f} ms over {2} runs '
+          '(target {3:.1f} ms)'.format(median(totals), min(totals),
+                                       options.runs, options.target_ms))
+    slowest = sorted(((median(durations), name)
+                      for name, durations in own.items()), reverse=True)
+    for duration, name in slowest[:options.top]:
+        print('  {0:>7.2f} ms  {1}'.format(duration, name))
+
+    out, _ = python('-c', CONSTRUCT)
+    first, other = [float(value) for value in out.split()]
+    print('HutomaUserKey(): first {0:.2f} ms, then {1:.3f} ms each'.format(
+        first, other))
+    if median(totals) > options.target_ms:
+        print('import time target missed')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
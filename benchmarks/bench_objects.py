@@ -0,0 +1,72 @@
+"""Compare the memory and time used by HutomaObject and CompactObject.
+
+Both kinds of objects are built from the same parsed JSON dicts, as the
+JSON object hook does. The memory reported per object excludes the parsed
+dicts themselves, which the JSON parser allocates either way.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/bench_objects.py [number of objects]
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import json
+import sys
+import tracemalloc
+from timeit import default_timer as timer
+
+from hutoma import HutomaUserKey
+from hutoma.objects import AI, CompactAI
+
+
+def ai_dicts(count):
+    """Return `count` freshly parsed AI dicts."""
+    return [json.loads(json.dumps({
+        'aiid': '36f96e07-1dd8-4b71-a77b-{0:012d}'.format(index),
+        'name': 'AI number {0}'.format(index),
+        'description': 'Answers questions about the sky and the sea',
+        'created_on': '2016-11-21T10:00:00Z',
+        'is_private': False,
+        'personality': 0,
+        'confidence': 0.4,
+        'ai_status': 'training_completed'})) for index in range(count)]
+
+
+def measure(label, build, count):
+    dicts = ai_dicts(count)
+    tracemalloc.start()
+    start = timer()
+    objects = [build(json_dict) for json_dict in dicts]
+    elapsed = timer() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    access = timer()
+    for obj in objects:
+        obj.name, obj.ai_status  # pylint: disable=W0104
+    access = timer() - access
+    print('{0:<36} {1:7.0f} B/object {2:7.2f} us/build {3:6.2f} us/read'
+          .format(label, size / count, elapsed / count * 1e6,
+                  access / count * 1e6))
+    return size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    session = HutomaUserKey('benchmark', user_key='benchmark')
+    print('{0} AI objects'.format(count))
+    session.config.store_json_result = True
+    stored = measure('AI, store_json_result=True',
+                     lambda data: AI(session, data), count)
+    session.config.store_json_result = False
+    measure('AI, store_json_result=False',
+            lambda data: AI(session, data), count)
+    compact = measure('CompactAI', lambda data: CompactAI(session, data),
+                      count)
+    print('CompactAI uses {0:.0%} less memory than AI with the default '
+          'settings'.format(1 - float(compact) / stored))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Record a workload against the mock server and replay it offline.
+
+The workload mixes chat questions, AI lookups and AI lists. It is first run
+through a :class:`.RecordingHandler` against
+:class:`mock_server.MockHutomaServer`, then replayed by a
+:class:`.ReplayHandler` without any server: at the recorded latency, and
+with no latency at all, which measures the CPU time the client itself
+spends per request. The response cache is disabled so that every call is
+sent.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/bench_replay.py [--requests N]
+        [--latency SECONDS] [--profile]
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import cProfile
+import os
+import pstats
+import shutil
+import tempfile
+from timeit import default_timer as timer
+
+from hutoma import HutomaUserKey
+from hutoma.replay import Archive, RecordingHandler, ReplayHandler
+
+from mock_server import MockHutomaServer
+
+SETTINGS = {'api_request_delay': 0, 'log_requests': 0, 'cache_timeout': 0,
+            'user_key': 'benchmark', 'circuit_failure_rate': 0}
+
+
+def workload(session, requests):
+    for index in range(requests):
+        if index % 4 == 0:
+            session.get_ai('ai-{0}'.format(index % 50))
+        elif index % 4 == 1:
+            session.get_ai_list()
+        else:
+            session.chat('benchmark', 'Question {0}?'.format(index % 100))
+
+
+def run(label, session, requests, profile=False):
+    profiler = cProfile.Profile() if profile else None
+    started = timer()
+    if profiler is not None:
+        profiler.enable()
+    workload(session, requests)
+    if profiler is not None:
+        profiler.disable()
+    elapsed = timer() - started
+    print('{0:<16} {1:>9.1f} req/s {2:>9.3f} ms/req'.format(
+        label, requests / elapsed, elapsed * 1e3 / requests))
+    if profiler is not None:
+        pstats.Stats(profiler).sort_stats('tottime').print_stats(12)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='the seconds the server delays each response')
+    parser.add_argument('--profile', action='store_true',
+                        help='profile the replay without latency')
+    options = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'traffic.jsonl')
+    try:
+        with MockHutomaServer(options.latency, payload_size=20) as server:
+            settings = dict(SETTINGS, **server.client_settings())
+            with Archive(path) as archive:
+                session = HutomaUserKey('benchmark',
+                                        handler=RecordingHandler(archive),
+                                        **settings)
+                run('record', session, options.requests)
+                domain = server.domain
+        with Archive(path) as archive:
+            print('archive: {0} responses, {1} KiB'.format(
+                len(archive), os.path.getsize(path) // 1024))
+        settings = dict(SETTINGS, api_domain=domain, api_scheme='http')
+        for label, time_scale in (('replay', 1.0),
+                                  ('replay, no wait', 0)):
+            with Archive(path) as archive:
+                session = HutomaUserKey(
+                    'benchmark', handler=ReplayHandler(archive, time_scale),
+                    **settings)
+                run(label, session, options.requests,
+                    options.profile and not time_scale)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Compare downloading the audio of the speak route buffered and streamed.
+
+The audio of :class:`mock_server.MockHutomaServer` is downloaded:
+
+* as text, the way ``_request`` returns response bodies;
+* as bytes, buffered whole in the response;
+* streamed by :meth:`.HutomaUserKey.speak` to a file.
+
+For each, the time until the first bytes of the audio are available, the
+time to download all of it and the peak memory allocated meanwhile are
+reported.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/bench_speak.py [--kib N] [--latency SECONDS]
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import io
+import os
+import tracemalloc
+from timeit import default_timer as timer
+
+from hutoma import HutomaUserKey
+
+from mock_server import MockHutomaServer
+
+TEXT = 'The sky is blue.'
+
+
+def as_text(session, output):
+    url = session.config['speak'].format(aiid='benchmark')
+    output.write(session._request(  # pylint: disable=W0212
+        url, params={'q': TEXT}).encode('utf-8', 'surrogateescape'))
+
+
+def as_bytes(session, output):
+    url = session.config['speak'].format(aiid='benchmark')
+    output.write(session._request(  # pylint: disable=W0212
+        url, params={'q': TEXT}, raw_response=True).content)
+
+
+def streamed(session, output):
+    session.speak('benchmark', TEXT, output)
+
+
+class Output(object):
+    """A file object that records when it is first written to."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.first = None
+
+    def write(self, data):
+        if self.first is None:
+            self.first = timer()
+        return self.stream.write(data)
+
+
+def measure(function, session):
+    """Return the seconds to the first bytes and to all, and the peak bytes."""
+    with io.open(os.devnull, 'wb') as devnull:
+        output = Output(devnull)
+        tracemalloc.start()
+        started = timer()
+        function(session, output)
+        elapsed = timer() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return output.first - started, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--kib', type=int, default=32768,
+                        help='the size of the audio in KiB')
+    parser.add_argument('--latency', type=float, default=0.0)
+    options = parser.parse_args()
+
+    with MockHutomaServer(options.latency, options.kib) as server:
+        session = HutomaUserKey('benchmark', user_key='benchmark',
+                                api_request_delay=0, log_requests=0,
+                                **server.client_settings())
+        print('{0:<10} {1:>14} {2:>10} {3:>12}'.format(
+            'mode', 'first bytes ms', 'total ms', 'peak KiB'))
+        for name, function in (('text', as_text), ('bytes', as_bytes),
+                               ('streamed', streamed)):
+            first, elapsed, peak = measure(function, session)
+            print('{0:<10} {1:>14.1f} {2:>10.1f} {3:>12}'.format(
+                name, first * 1e3, elapsed * 1e3, peak // 1024))
+        print()
+        print(session.stats.format())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Compare fetching a large AI list whole and streamed.
+
+The whole list is downloaded and parsed before the first AI is returned by
+``get_ai_list()``, while ``stream_json`` yields each AI dict as soon as it
+is parsed, and ``get_ai_list(stream=True)`` each AI object. For each, the
+time until the first AI is available, the
+time to go through all of them and the peak memory allocated meanwhile are
+reported.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/bench_streaming.py [--ais N]
+        [--latency SECONDS]
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import tracemalloc
+from timeit import default_timer as timer
+
+from hutoma import HutomaUserKey
+
+from mock_server import MockHutomaServer
+
+
+def whole(session):
+    return iter(session.get_ai_list()['ai_list'])
+
+
+def streamed(session):
+    return session.stream_json(session.config['ai_list'], 'ai_list')
+
+
+def streamed_ais(session):
+    return session.get_ai_list(stream=True)
+
+
+def measure(function, session):
+    """Return the seconds to the first AI and to all, and the peak bytes."""
+    tracemalloc.start()
+    started = timer()
+    ais = function(session)
+    next(ais)
+    first = timer() - started
+    count = 1 + sum(1 for _ in ais)
+    elapsed = timer() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, first, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ais', type=int, default=50000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    options = parser.parse_args()
+
+    with MockHutomaServer(options.latency, options.ais) as server:
+        session = HutomaUserKey('benchmark', user_key='benchmark',
+                                api_request_delay=0, log_requests=0,
+                                cache_timeout=0, **server.client_settings())
+        print('{0:<12} {1:>7} {2:>10} {3:>10} {4:>10}'.format(
+            'mode', 'AIs', 'first ms', 'total ms', 'peak KiB'))
+        for function in (whole, streamed, streamed_ais):
+            count, first, elapsed, peak = measure(function, session)
+            print('{0:<12} {1:>7} {2:>10.1f} {3:>10.1f} {4:>10}'.format(
+                function.__name__, count, first * 1e3, elapsed * 1e3,
+                peak // 1024))
+
+
+if __name__ == '__main__':
+    main()
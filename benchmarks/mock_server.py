@@ -0,0 +1,242 @@
+"""A local stand-in for the Hutoma API, used by the benchmarks.
+
+The server answers the routes of ``Config.API_PATHS`` with canned payloads.
+Its latency, the size of its payloads and the rate at which it fails with
+one of ``BaseHutoma.RETRY_CODES`` or redirects can be configured, so that
+the client can be measured under repeatable conditions.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/mock_server.py [--port PORT]
+        [--latency SECONDS]
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import json
+import random
+import time
+from threading import Lock, Thread
+
+from six.moves import BaseHTTPServer, socketserver  # pylint: disable=F0401
+from six.moves.urllib.parse import parse_qs, urlparse  # pylint: disable=F0401
+
+from hutoma import BaseHutoma, Config
+
+
+def ai_json(index):
+    """Return the JSON dict of an AI."""
+    return {'aiid': '36f96e07-1dd8-4b71-a77b-{0:012d}'.format(index),
+            'name': 'AI number {0}'.format(index),
+            'description': 'Answers questions about the sky and the sea',
+            'created_on': '2016-11-21T10:00:00Z',
+            'is_private': False,
+            'personality': 0,
+            'confidence': 0.4,
+            'ai_status': 'training_completed'}
+
+
+def _status(code=200, error_type='Success.'):
+    return {'code': code, 'errorType': error_type}
+
+
+class _ThreadingServer(socketserver.ThreadingMixIn,
+                       BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep connections alive
+    disable_nagle_algorithm = True  # Headers and body are written apart
+
+    def log_message(self, *_):
+        pass
+
+    def _reply(self, code, body, content_type='application/json',
+               headers=()):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        cookie = self.server.mock.cookie()
+        if cookie:
+            self.send_header('Set-Cookie', cookie)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        mock = self.server.mock
+        url = urlparse(self.path)
+        route, params = Config.parse_route(url.path)
+        outcome = mock.outcome()
+        mock.count(route)
+        if mock.latency:
+            time.sleep(mock.latency)
+        if outcome == 'error':
+            return self._reply(random.choice(BaseHutoma.RETRY_CODES),
+                               json.dumps({'status': _status(
+                                   503, 'Service unavailable.')}).encode())
+        if outcome == 'redirect' and 'redirected' not in url.query:
+            location = self.path + ('&' if url.query else '?') + \
+                'redirected=1'
+            return self._reply(302, b'', headers=[('Location', location)])
+        if route == 'speak':
+            return self._reply(200, mock.audio, 'audio/wav')
+        body = mock.payloads.get(route)
+        if body is None:
+            return self._reply(404, json.dumps({'status': _status(
+                404, 'Not found.')}).encode())
+        if route == 'chat':
+            question = parse_qs(url.query).get('q', [''])[0]
+            body = body.replace(b'{question}', json.dumps(question)
+                                .encode('utf-8')[1:-1])
+        elif route == 'ai':
+            body = body.replace(b'{aiid}', params['aiid'].encode('utf-8'))
+        self._reply(200, body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+
+class MockHutomaServer(object):
+    """A Hutoma API stand-in serving on localhost from a background thread.
+
+    :param latency: The seconds each response is delayed by.
+    :param payload_size: The number of AIs listed by the `ai_list` route.
+        The audio of the `speak` route is 1 KiB per AI.
+    :param error_rate: The fraction of requests failing with one of
+        ``BaseHutoma.RETRY_CODES``.
+    :param redirect_rate: The fraction of requests redirected once.
+    :param cookie_rate: The fraction of responses setting a cookie.
+    :param answer: The answer of the `chat` route to every question.
+    :param seed: The seed of the random errors and redirects.
+    :param port: The port to listen on, or 0 for any free port.
+
+    The server is started when it is used as a context manager or when
+    :meth:`start` is called. The number of requests received per route is
+    kept in `counts`.
+
+    """
+
+    def __init__(self, latency=0.0, payload_size=10, error_rate=0.0,
+                 redirect_rate=0.0, seed=0, port=0, cookie_rate=0.0,
+                 answer='Blue.'):
+        """Construct a MockHutomaServer. It is not started."""
+        self.latency = latency
+        self.error_rate = error_rate
+        self.redirect_rate = redirect_rate
+        self.cookie_rate = cookie_rate
+        self.cookies = 0
+        self.random = random.Random(seed)
+        self.lock = Lock()
+        self.counts = {}
+        self.payloads = {
+            'ai_list': json.dumps({
+                'status': _status(),
+                'ai_list': [ai_json(index) for index in range(payload_size)]
+            }).encode('utf-8'),
+            'ai': json.dumps({'status': _status(),
+                              'ai': dict(ai_json(0), aiid='{aiid}',
+                                         language='en-US',
+                                         timezone='Europe/London')})
+            .encode('utf-8'),
+            'folder': json.dumps({'status': _status(),
+                                  'files': []}).encode('utf-8'),
+            'chat': json.dumps({
+                'status': _status(),
+                'chatId': 'c5b6a2fd-1a7a-4a4e-86ea-9f6c1a3c27a0',
+                'result': {'query': '{question}', 'answer': answer,
+                           'score': 0.9, 'elapsed_time': 0.05}
+            }).encode('utf-8'),
+            'training': json.dumps({'status': _status()}).encode('utf-8')}
+        self.audio = b'RIFF' + b'\0' * (1024 * max(1, payload_size) - 4)
+        self.server = _ThreadingServer(('127.0.0.1', port), _Handler)
+        self.server.mock = self
+        self.thread = None
+
+    @property
+    def domain(self):
+        """Return the `api_domain` of the server."""
+        return '127.0.0.1:{0}'.format(self.server.server_address[1])
+
+    def client_settings(self):
+        """Return the Config settings pointing a client at the server."""
+        return {'api_domain': self.domain, 'api_scheme': 'http'}
+
+    def outcome(self):
+        """Draw whether the next request fails, is redirected or succeeds."""
+        with self.lock:
+            draw = self.random.random()
+        if draw < self.error_rate:
+            return 'error'
+        elif draw < self.error_rate + self.redirect_rate:
+            return 'redirect'
+        return 'ok'
+
+    def cookie(self):
+        """Return the Set-Cookie header of the next response, or None."""
+        if not self.cookie_rate:
+            return None
+        with self.lock:
+            if self.random.random() >= self.cookie_rate:
+                return None
+            self.cookies += 1
+            return 'visit{0}={0}; Path=/'.format(self.cookies % 10)
+
+    def count(self, route):
+        """Count a request received for `route`."""
+        with self.lock:
+            self.counts[route] = self.counts.get(route, 0) + 1
+
+    def start(self):
+        """Serve requests from a background thread."""
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving requests and close the socket."""
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--payload-size', type=int, default=10)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--redirect-rate', type=float, default=0.0)
+    options = parser.parse_args()
+    server = MockHutomaServer(options.latency, options.payload_size,
+                              options.error_rate, options.redirect_rate,
+                              port=options.port)
+    print('Serving on http://{0}/ (use api_domain: {0} and api_scheme: '
+          'http)'.format(server.domain))
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,33 @@
 from __future__ import print_function, unicode_literals
 
-import json
+import hashlib
 import os
-import platform
 import re
 import six
 import sys
+import time
 from hutoma import errors
+from hutoma.answers import AnswerCache, training_version
+from hutoma.cache import SQLiteCache
+from hutoma.circuit import CircuitBreakers
 from hutoma.handlers import DefaultHandler
 from hutoma.helpers import normalize_url
-from hutoma.internal import (_prepare_request, _raise_redirect_exceptions, _raise_response_exceptions)
-from hutoma.settings import CONFIG
+from hutoma.internal import (_decode_entities, _decode_json, _prepare_request,
+                             _raise_redirect_exceptions, _raise_response_exceptions)
+from hutoma.pool import shared_pool
+from hutoma.retry import RetryPolicy
+from hutoma.settings import site_settings
+from hutoma.stats import ClientStats
+from hutoma.streaming import CHUNK_SIZE, iter_json_items
 from requests import Session
 from requests.compat import urljoin
+from timeit import default_timer as timer
 from requests.utils import to_native_string
 from requests import Request
+from requests.exceptions import RequestException
+from threading import Lock
 # pylint: disable=F0401
-from six.moves import html_entities, http_cookiejar
+from six.moves import http_cookiejar
 from six.moves.urllib.parse import parse_qs, urlparse, urlunparse
 # pylint: enable=F0401
 from warnings import warn_explicit
@@ -33,6 +44,30 @@ else:
     CHR = unichr  # NOQA
 
 
+_PLATFORM_INFO = []
+
+
+def _platform_info():
+    """Return the platform part of the user-agent string.
+
+    It is computed once per process, as ``platform.platform`` may run
+    external commands.
+
+    """
+    if not _PLATFORM_INFO:
+        if os.environ.get('SERVER_SOFTWARE') is not None:
+            # Google App Engine information
+            # https://developers.google.com/appengine/docs/python/
+            info = os.environ.get('SERVER_SOFTWARE')
+        else:
+            # Standard platform information
+            import platform
+            info = platform.platform(True).encode('ascii', 'ignore')
+            info = info.decode('ascii')
+        _PLATFORM_INFO.append(info)
+    return _PLATFORM_INFO[0]
+
+
 class Config(object):  # pylint: disable=R0903
     """A class containing the configuration for a Hutoma site."""
 
@@ -43,6 +78,7 @@ class Config(object):  # pylint: disable=R0903
                  'speak':       'api/v1/{aiid}/speak',
                  'training':    'api/v1/{aiid}/training',
                  }
+    _route_patterns = None
 
     @staticmethod
     def ua_string(hutoma_info):
@@ -51,38 +87,53 @@ class Config(object):  # pylint: disable=R0903
         The user-agent string contains version and platform version info.
 
         """
-        if os.environ.get('SERVER_SOFTWARE') is not None:
-            # Google App Engine information
-            # https://developers.google.com/appengine/docs/python/
-            info = os.environ.get('SERVER_SOFTWARE')
-        else:
-            # Standard platform information
-            info = platform.platform(True).encode('ascii', 'ignore')
-
         return '{0} Hutoma/{1} Python/{2} {3}'.format(
-            hutoma_info, __version__, sys.version.split()[0], info)
+            hutoma_info, __version__, sys.version.split()[0], _platform_info())
 
     def __init__(self, site_name, **kwargs):
         """Initialize configuration."""
         def config_boolean(item):
+            if isinstance(item, bool):
+                return item
             return item and item.lower() in ('1', 'yes', 'true', 'on')
 
-        obj = dict(CONFIG.items(site_name))
+        obj = site_settings(site_name)
         # Overwrite configuration file settings with those given during
         # instantiation of the Hutoma instance.
         for key, value in kwargs.items():
             obj[key] = value
 
         self.api_domain = obj['api_domain']
-        self.api_url = 'https://' + self.api_domain
+        self.api_scheme = obj.get('api_scheme') or 'https'
+        self.api_url = self.api_scheme + '://' + self.api_domain
         self.api_request_delay = float(obj['api_request_delay'])
-        self.by_kind = {'ai_list':  objects.AIList,
-                        'ai':       objects.AI,
-                        'folder':   objects.Folder,
-                        'chat':     objects.Chat,
-                        'training': objects.Training}
+        self.api_request_burst = int(obj['api_request_burst'])
+        self.rate_limiter = obj['rate_limiter']
+        self.compact_objects = config_boolean(obj.get('compact_objects'))
+        if self.compact_objects:
+            self.by_kind = {'ai_list':  objects.CompactAIList,
+                            'ai':       objects.CompactAI,
+                            'folder':   objects.CompactFolder,
+                            'chat':     objects.CompactChat,
+                            'training': objects.CompactTraining}
+        else:
+            self.by_kind = {'ai_list':  objects.AIList,
+                            'ai':       objects.AI,
+                            'folder':   objects.Folder,
+                            'chat':     objects.Chat,
+                            'training': objects.Training}
         self.by_object = dict((value, key) for (key, value) in six.iteritems(self.by_kind))
         self.cache_timeout = float(obj['cache_timeout'])
+        self.cache_stale_timeout = float(obj['cache_stale_timeout'])
+        self.cache_stale_while_revalidate = config_boolean(
+            obj.get('cache_stale_while_revalidate'))
+        self.cache_max_entries = int(obj['cache_max_entries'])
+        self.cache_max_bytes = int(obj['cache_max_bytes'])
+        self.cache_backend = obj['cache_backend']
+        self.cache_path = obj.get('cache_path') or None
+        self.chat_cache_timeout = float(obj['chat_cache_timeout'])
+        self.chat_cache_max_entries = int(obj['chat_cache_max_entries'])
+        self.chat_cache_max_bytes = int(obj['chat_cache_max_bytes'])
         self.log_requests = int(obj['log_requests'])
         self.user_key = (obj.get('user_key') or os.getenv('user_key') or None)
         self.http_proxy = (obj.get('http_proxy') or os.getenv('http_proxy') or None)
@@ -92,21 +143,94 @@ class Config(object):  # pylint: disable=R0903
         self.validate_certs = config_boolean(obj.get('validate_certs'))
         self.store_json_result = config_boolean(obj.get('store_json_result'))
         self.timeout = float(obj['timeout'])
+        self.pool_settings = {
+            'pool_connections': int(obj['pool_connections']),
+            'pool_maxsize': int(obj['pool_maxsize']),
+            'pool_block': config_boolean(obj.get('pool_block')),
+            'max_retries': int(obj['pool_max_retries']),
+            'keep_alive': config_boolean(obj.get('keep_alive')),
+            'idle_timeout': float(obj['pool_idle_timeout'])}
+        self.circuit_settings = {
+            'failure_rate': float(obj['circuit_failure_rate']),
+            'slow_call_duration': float(obj['circuit_slow_call_duration']),
+            'min_calls': int(obj['circuit_min_calls']),
+            'window': int(obj['circuit_window']),
+            'reset_timeout': float(obj['circuit_reset_timeout']),
+            'probes': int(obj['circuit_probes'])}
+        budget = float(obj['retry_budget'])
+        self.retry_settings = {
+            'attempts': int(obj['retry_attempts']),
+            'backoff': float(obj['retry_backoff']),
+            'max_backoff': float(obj['retry_max_backoff']),
+            'budget': budget if budget >= 0 else None,
+            'connection_errors': config_boolean(
+                obj.get('retry_connection_errors'))}
 
     def __getitem__(self, key):
         url = urljoin(self.api_url, self.API_PATHS[key])
         return url
 
+    @classmethod
+    def parse_route(cls, url):
+        """Return the API_PATHS key matching `url` and its parameters.
 
-class BaseHutoma(object):
-    """A base class that allows access to Hutoma'ss API.
+        The key is 'other' when no path matches. The parameters are those
+        formatted into the path, e.g. `aiid`.
 
-    You should **not** directly instantiate instances of this class. Use
-    :class:`.Hutoma` instead.
+        """
+        if cls._route_patterns is None:
+            patterns = []
+            for key, path in sorted(cls.API_PATHS.items()):
+                parts = re.split(r'{(\w+)}', path.strip('/'))
+                pattern = ''.join(
+                    '(?P<{0}>[^/]+)'.format(part) if index % 2 else
+                    re.escape(part) for index, part in enumerate(parts))
+                patterns.append((key, re.compile(pattern + '$')))
+            cls._route_patterns = patterns
+        path = urlparse(url).path.strip('/')
+        for key, pattern in cls._route_patterns:
+            match = pattern.match(path)
+            if match:
+                return key, match.groupdict()
+        return 'other', {}
+
+    @classmethod
+    def route_for(cls, url):
+        """Return the API_PATHS key matching `url`, or 'other'."""
+        return cls.parse_route(url)[0]
+
+    @classmethod
+    def cache_tags(cls, url):
+        """Return the tags of the cached responses of `url`.
+
+        Responses are tagged with their route, as ``route:<key>``, and with
+        the AI they concern, as ``aiid:<aiid>``.
+
+        """
+        route, params = cls.parse_route(url)
+        tags = ['route:' + route]
+        if 'aiid' in params:
+            tags.append('aiid:' + params['aiid'])
+        return tags
+
+
+class _HutomaCore(object):
+    """The state and logic shared by the blocking and the asyncio clients.
+
+    It holds the configuration, handler, statistics and the HTTP session
+    whose headers and cookies requests are prepared with. It builds the
+    requests and parses the responses, while subclasses send them:
+    :class:`BaseHutoma` with blocking calls and :class:`.AsyncHutomaUserKey`
+    with coroutines.
+
+    An instance may be shared by many threads. The state of a request is kept
+    in local variables, and the cookie jar and the modhash are replaced
+    rather than modified so that they are read without locking.
 
     """
 
-    RETRY_CODES = [502, 503, 504]
+    RETRY_CODES = [429, 502, 503, 504]
+    default_handler = DefaultHandler
     update_checked = False
 
     def __init__(self, user_agent, site_name=None, handler=None, **kwargs):
@@ -132,7 +256,21 @@ class BaseHutoma(object):
                 'The keyword `bot` in your user_agent may be problematic.', UserWarning, '', 0)
 
         self.config = Config(site_name or os.getenv('HUTOMA_SITE') or 'hutoma', **kwargs)
-        self.handler = handler or DefaultHandler()
+        self.stats = ClientStats()
+        self.circuits = CircuitBreakers(**self.config.circuit_settings)
+        self.retry_policy = RetryPolicy(codes=self.RETRY_CODES,
+                                        **self.config.retry_settings)
+        self.answer_cache = None
+        if self.config.chat_cache_timeout > 0:
+            self.answer_cache = AnswerCache(
+                self.config.chat_cache_timeout,
+                self.config.chat_cache_max_entries,
+                self.config.chat_cache_max_bytes)
+        self.handler = handler or self.default_handler(
+            max_entries=self.config.cache_max_entries,
+            max_bytes=self.config.cache_max_bytes,
+            cache=self._cache_backend(),
+            pool=shared_pool(**self.config.pool_settings))
         self.http = Session()
         self.http.headers['User-Agent'] = self.config.ua_string(user_agent)
         self.http.headers['user_key'] = self.config.user_key
@@ -152,8 +290,174 @@ class BaseHutoma(object):
                 self.http.proxies['http'] = self.config.http_proxy
             if self.config.https_proxy:
                 self.http.proxies['https'] = self.config.https_proxy
+        self._cookies_lock = Lock()
         self.modhash = None
 
+    def _cache_backend(self):
+        """Return the cache backend set in the configuration.
+
+        None is returned for the `memory` backend, which uses the cache shared
+        by the handlers of this process.
+
+        """
+        if self.config.cache_backend == 'memory':
+            return None
+        elif self.config.cache_backend == 'sqlite':
+            if not self.config.cache_path:
+                raise errors.ClientException(
+                    'The sqlite cache backend requires a cache_path.')
+            return SQLiteCache(self.config.cache_path,
+                               self.config.cache_max_entries,
+                               self.config.cache_max_bytes)
+        raise errors.ClientException('Unknown cache backend: {0}'.format(
+            self.config.cache_backend))
+
+    def _update_cookies(self, cookies):
+        """Add `cookies` to the cookies sent with the requests.
+
+        The jar is copied and replaced, so that requests being prepared in
+        other threads keep reading a jar that does not change.
+
+        """
+        if not cookies:
+            return
+        with self._cookies_lock:
+            jar = self.http.cookies.copy()
+            jar.update(cookies)
+            self.http.cookies = jar
+
+    def _observe_training(self, request, response):
+        """Evict the cached answers of an AI whose model may have changed.
+
+        A `training` response with a new training version, or the upload of
+        training material, makes the answers of the AI stale.
+
+        """
+        aiid = self.config.parse_route(request.url)[1].get('aiid')
+        if request.method != 'GET':
+            self.answer_cache.invalidate(aiid)
+            return
+        try:
+            data = _decode_json(response)
+        except ValueError:
+            return
+        self.answer_cache.set_version(aiid, training_version(data))
+
+    def _build_request(self, url, params, data, auth, files, method,
+                       raw_response):
+        """Return the request, cache key items and handler arguments."""
+        request = _prepare_request(self, url, params, data, auth, files, method)
+        route = self.config.route_for(url)
+        if isinstance(request.data, dict):
+            data = request.data  # With the fields added by _prepare_request
+
+        # Prepare extra arguments
+        key_items = []
+        for key_value in (params, data, request.cookies, auth):
+            if isinstance(key_value, dict):
+                key_items.append(tuple(key_value.items()))
+            elif isinstance(key_value, http_cookiejar.CookieJar):
+                key_items.append(tuple(key_value.get_dict().items()))
+            else:
+                key_items.append(key_value)
+        if request.method != 'GET':
+            # A DELETE is not answered with the response of a GET
+            key_items.append(request.method)
+        # Responses are only shared by the clients using the same user key
+        user_key = request.headers.get('user_key') or ''
+        key_items.append(hashlib.sha1(user_key.encode('utf-8')).hexdigest())
+        kwargs = {'_rate_domain': self.config.api_domain,
+                  '_rate_delay': self.config.api_request_delay,
+                  '_rate_burst': self.config.api_request_burst,
+                  '_rate_limiter': self.config.rate_limiter,
+                  '_circuit': self.circuits.get(route),
+                  '_cache_ignore': bool(files) or raw_response,
+                  '_cache_timeout': int(self.config.cache_timeout),
+                  '_cache_stale': self.config.cache_stale_timeout,
+                  '_cache_swr': self.config.cache_stale_while_revalidate,
+                  '_cache_tags': self.config.cache_tags(url)}
+
+        return (request, key_items, kwargs)
+
+    def _json_hutoma_objecter(self, json_data):
+        """Return an appropriate HutomaObject from json_data when possible."""
+        try:
+            object_class = self.config.by_kind[json_data['kind']]
+        except KeyError:
+            if 'json' in json_data:
+                if len(json_data) != 1:
+                    msg = 'Unknown object type: {0}'.format(json_data)
+                    warn_explicit(msg, UserWarning, '', 0)
+                return json_data['json']
+        else:
+            return object_class.from_api_response(self, json_data['data'])
+        return json_data
+
+    def evict(self, urls):
+        """Evict url(s) from the cache.
+
+        :param urls: An iterable containing normalized urls.
+        :returns: The number of items removed from the cache.
+
+        """
+        if isinstance(urls, six.string_types):
+            urls = (urls,)
+        return self.handler.evict(urls)
+
+    def evict_tags(self, tags):
+        """Evict the responses cached with any of `tags` from the cache.
+
+        :param tags: An iterable of tags, see :meth:`.Config.cache_tags`.
+        :returns: The number of items removed from the cache.
+
+        """
+        if isinstance(tags, six.string_types):
+            tags = (tags,)
+        return self.handler.evict_tags(tags)
+
+    def evict_prefix(self, prefix):
+        """Evict the responses of the urls starting with `prefix`.
+
+        :param prefix: A url prefix, which is normalized like urls are.
+        :returns: The number of items removed from the cache.
+
+        """
+        return self.handler.evict_prefix(prefix)
+
+    def evict_ai(self, aiid):
+        """Evict the responses made stale by a change to an AI.
+
+        These are the responses concerning the AI, such as its `ai` and
+        `folder` responses, and the AI lists.
+
+        :returns: The number of items removed from the cache.
+
+        """
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate(aiid)
+        return self.evict_tags(('aiid:' + aiid, 'route:ai_list'))
+
+    def _parse_json(self, response, url, as_objects):
+        """Return the JSON processed from a response."""
+        hook = self._json_hutoma_objecter if as_objects else None
+        started = timer()
+        data = _decode_json(response, hook)
+        self.stats.record(self.config.route_for(url), 'decode',
+                          timer() - started)
+        # Update the modhash
+        if isinstance(data, dict) and 'data' in data and 'modhash' in data['data']:
+            self.modhash = data['data']['modhash']
+        return data
+
+
+class BaseHutoma(_HutomaCore):
+    """A base class that allows access to Hutoma'ss API.
+
+    You should **not** directly instantiate instances of this class. Use
+    :class:`.Hutoma` instead.
+
+    """
+
     def _request(self, url, params=None, data=None, files=None, auth=None,
                  timeout=None, raw_response=False, retry_on_error=True,
                  method=None):
@@ -168,99 +472,87 @@ class BaseHutoma(object):
             can take.
         :param raw_response: return the response object rather than the
             response body
-        :param retry_on_error: if True retry the request, if it fails, for up
-            to 3 attempts
+        :param retry_on_error: if True retry the request, if it fails, as the
+            retry_policy allows
         :returns: either the response body or the response object
 
         """
-        def build_key_items(url, params, data, auth, files, method):
-            request = _prepare_request(self, url, params, data, auth, files, method)
-
-            # Prepare extra arguments
-            key_items = []
-            for key_value in (params, data, request.cookies, auth):
-                if isinstance(key_value, dict):
-                    key_items.append(tuple(key_value.items()))
-                elif isinstance(key_value, http_cookiejar.CookieJar):
-                    key_items.append(tuple(key_value.get_dict().items()))
-                else:
-                    key_items.append(key_value)
-            kwargs = {'_rate_domain': self.config.api_domain,
-                      '_rate_delay': int(self.config.api_request_delay),
-                      '_cache_ignore': bool(files) or raw_response,
-                      '_cache_timeout': int(self.config.cache_timeout)}
-
-            return (request, key_items, kwargs)
-
-        def decode(match):
-            return CHR(html_entities.name2codepoint[match.group(1)])
+        timeout = self.config.timeout if timeout is None else timeout
+        started = timer()
+        request, key_items, kwargs = self._build_request(
+            url, params, data, auth, files, method, raw_response)
+        self.stats.record(self.config.route_for(url), 'prepare',
+                          timer() - started)
+        response = self._send(request, key_items, kwargs, timeout,
+                              retry_on_error)
+        if raw_response:
+            return response
+        else:
+            return _decode_entities(response.text)
+
+    def _send(self, request, key_items, kwargs, timeout, retry_on_error):
+        """Send a request built by _build_request and return the response.
+
+        Redirects are followed and, if `retry_on_error` is True, failed
+        attempts are retried as the `retry_policy` decides.
 
+        """
         def handle_redirect():
             response = None
             url = request.url
+            hops = 0
             while url:  # Manually handle 302 redirects
+                hop_started = timer()
                 request.url = url
                 kwargs['_cache_key'] = (normalize_url(request.url),
                                         tuple(key_items))
+                timings = {}
                 response = self.handler.request(
                     request=request.prepare(),
                     proxies=self.http.proxies,
                     timeout=timeout,
-                    verify=self.http.validate_certs, **kwargs)
+                    verify=self.http.validate_certs, _timings=timings,
+                    **kwargs)
+                self.stats.record_timings(route, timings)
+                if hops:
+                    self.stats.record(route, 'redirect', timer() - hop_started)
+                hops += 1
 
                 if self.config.log_requests >= 2:
                     msg = 'status: {0}\n'.format(response.status_code)
                     sys.stderr.write(msg)
                 url = _raise_redirect_exceptions(response)
                 assert url != request.url
+                if url and kwargs.get('stream'):
+                    response.close()  # Release the connection
             return response
 
-        timeout = self.config.timeout if timeout is None else timeout
-        request, key_items, kwargs = build_key_items(url, params, data,
-                                                     auth, files, method)
-
-        remaining_attempts = 3 if retry_on_error else 1
+        route = self.config.route_for(request.url)
+        started = timer()
+        self.retry_policy.started()
+        attempt = 1
         while True:
+            attempt_started = timer()
             try:
                 response = handle_redirect()
                 _raise_response_exceptions(response)
-                self.http.cookies.update(response.cookies)
-                if raw_response:
-                    return response
-                else:
-                    return re.sub('&([^;]+);', decode, response.text)
-
-            except errors.HTTPException as error:
-                remaining_attempts -= 1
-                # pylint: disable=W0212
-                if error._raw.status_code not in self.RETRY_CODES or \
-                        remaining_attempts == 0:
+                self._update_cookies(response.cookies)
+                if route == 'training' and self.answer_cache is not None:
+                    self._observe_training(request, response)
+                self.stats.record(route, 'total', timer() - started)
+                return response
+
+            except (errors.HTTPException, RequestException) as error:
+                delay = None
+                if retry_on_error:
+                    delay = self.retry_policy.delay(error, request.method,
+                                                    attempt)
+                if delay is None:
+                    self.stats.record(route, 'total', timer() - started)
                     raise
-
-    def _json_hutoma_objecter(self, json_data):
-        """Return an appropriate HutomaObject from json_data when possible."""
-        try:
-            object_class = self.config.by_kind[json_data['kind']]
-        except KeyError:
-            if 'json' in json_data:
-                if len(json_data) != 1:
-                    msg = 'Unknown object type: {0}'.format(json_data)
-                    warn_explicit(msg, UserWarning, '', 0)
-                return json_data['json']
-        else:
-            return object_class.from_api_response(self, json_data['data'])
-        return json_data
-
-    def evict(self, urls):
-        """Evict url(s) from the cache.
-
-        :param urls: An iterable containing normalized urls.
-        :returns: The number of items removed from the cache.
-
-        """
-        if isinstance(urls, six.string_types):
-            urls = (urls,)
-        return self.handler.evict(urls)
+                self.stats.record(route, 'retry', timer() - attempt_started)
+                attempt += 1
+                time.sleep(delay)
 
     # @decorators.oauth_generator
     def get_content(self, url, params=None):
@@ -268,6 +560,7 @@ class BaseHutoma(object):
         return self.request_json(url, params=params)
 
     # @decorators.raise_api_exceptions
+
     def request(self, url, params=None, data=None, retry_on_error=False,
                 method=None):
         """Make a HTTP request and return the response.
@@ -275,8 +568,8 @@ class BaseHutoma(object):
         :param url: the url to grab content from.
         :param params: a dictionary containing the GET data to put in the url
         :param data: a dictionary containing the extra data to submit
-        :param retry_on_error: if True retry the request, if it fails, for up
-            to 3 attempts
+        :param retry_on_error: if True retry the request, if it fails, as the
+            retry_policy allows
         :param method: The HTTP method to use in the request.
         :returns: The HTTP response.
         """
@@ -284,6 +577,7 @@ class BaseHutoma(object):
                              retry_on_error=retry_on_error, method=method)
 
     # @decorators.raise_api_exceptions
+
     def request_json(self, url, params=None, data=None, as_objects=True,
                      retry_on_error=True, method=None):
         """Get the JSON processed from a page.
@@ -292,27 +586,120 @@ class BaseHutoma(object):
         :param params: a dictionary containing the GET data to put in the url
         :param data: a dictionary containing the extra data to submit
         :param as_objects: if True return reddit objects else raw json dict.
-        :param retry_on_error: if True retry the request, if it fails, for up
-            to 3 attempts
+        :param retry_on_error: if True retry the request, if it fails, as the
+            retry_policy allows
         :returns: JSON processed page
 
         """
-        response = self._request(url, params, data, method=method, retry_on_error=retry_on_error)
-        hook = self._json_hutoma_objecter if as_objects else None
-        # Request url just needs to be available for the objecter to use
-        self._request_url = url  # pylint: disable=W0201
+        started = timer()
+        request, key_items, kwargs = self._build_request(
+            url, params, data, None, None, method, False)
+        self.stats.record(self.config.route_for(url), 'prepare',
+                          timer() - started)
+        response = self._send(request, key_items, kwargs, self.config.timeout,
+                              retry_on_error)
+        return self._parse_json(response, url, as_objects)
+
+    def stream_json(self, url, key, kind=None, params=None,
+                    retry_on_error=True):
+        """Return an iterator over the items of a list of a JSON response.
+
+        The response is streamed and parsed as it is downloaded, see
+        :func:`.iter_json_items`, so the first items are available before
+        the whole body is, and the memory used does not grow with the length
+        of the list. Streamed responses are not cached. The request is made
+        before returning; its body is read as the iterator is consumed.
 
-        if response == '':
-            # Some of the v1 urls don't return anything, even when they're
-            # successful.
-            return response
+        :param url: the url to grab content from.
+        :param key: The name of the list whose items are yielded, e.g.
+            `ai_list`.
+        :param kind: If given, the key of `by_kind` of the class, such as
+            `ai`, of the objects made from the items; otherwise the items
+            are returned as dictionaries.
+        :param params: a dictionary containing the GET data to put in the url
+        :param retry_on_error: if True retry the request, if it fails, as the
+            retry_policy allows
 
-        data = json.loads(response, object_hook=hook)
-        delattr(self, '_request_url')
-        # Update the modhash
-        if isinstance(data, dict) and 'data' in data and 'modhash' in data['data']:
-            self.modhash = data['data']['modhash']
-        return data
+        """
+        started = timer()
+        request, key_items, kwargs = self._build_request(
+            url, params, None, None, None, 'GET', True)
+        kwargs['stream'] = True
+        route = self.config.route_for(url)
+        self.stats.record(route, 'prepare', timer() - started)
+        response = self._send(request, key_items, kwargs, self.config.timeout,
+                              retry_on_error)
+        return self._iter_json_items(response, route, key, kind)
+
+    def _iter_json_items(self, response, route, key, kind):
+        object_class = self.config.by_kind[kind] if kind else None
+        items = iter_json_items(response, key)
+        decoding = 0.0
+        try:
+            while True:
+                started = timer()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                finally:
+                    decoding += timer() - started
+                if object_class is not None:
+                    item = object_class.from_api_response(self, item)
+                yield item
+        finally:
+            response.close()
+            self.stats.record(route, 'decode', decoding)
+
+    def stream_content(self, url, params=None, chunk_size=CHUNK_SIZE,
+                       retry_on_error=True):
+        """Return an iterator over the body of a response, in bytes.
+
+        The body is read `chunk_size` bytes at a time as the iterator is
+        consumed, the last chunk being shorter, and is neither decoded nor
+        cached. The request is made before returning. The time from its
+        start to the first bytes of the body is recorded in `stats` as the
+        `first_byte` phase; with urllib3 1, which cannot return only the
+        bytes already received, the time to the start of the iteration is
+        recorded instead.
+
+        :param url: the url to grab content from.
+        :param params: a dictionary containing the GET data to put in the url
+        :param chunk_size: The number of bytes read at once.
+        :param retry_on_error: if True retry the request, if it fails, as the
+            retry_policy allows
+
+        """
+        started = timer()
+        request, key_items, kwargs = self._build_request(
+            url, params, None, None, None, 'GET', True)
+        kwargs['stream'] = True
+        route = self.config.route_for(url)
+        self.stats.record(route, 'prepare', timer() - started)
+        response = self._send(request, key_items, kwargs, self.config.timeout,
+                              retry_on_error)
+        return self._iter_content(response, route, chunk_size, started)
+
+    def _iter_content(self, response, route, chunk_size, started):
+        try:
+            raw = response.raw
+            read1 = getattr(raw, 'read1', None)
+            unread = response._content is False  # pylint: disable=W0212
+            if unread and read1 is not None:
+                # Time the first bytes received rather than the first chunk
+                chunk = read1(chunk_size, decode_content=True)
+                self.stats.record(route, 'first_byte', timer() - started)
+                if chunk and len(chunk) < chunk_size:
+                    chunk += raw.read(chunk_size - len(chunk),
+                                      decode_content=True)
+                if chunk:
+                    yield chunk
+            else:  # A body already read, or urllib3 < 2 without read1
+                self.stats.record(route, 'first_byte', timer() - started)
+            for chunk in response.iter_content(chunk_size):
+                yield chunk
+        finally:
+            response.close()
 
 
 class HutomaUserKey(BaseHutoma):
@@ -330,8 +717,17 @@ class HutomaUserKey(BaseHutoma):
         self._unique_count = 1
         self.user_key = '16066e791af0db0855c3152fc83d649a'
 
-    def get_ai_list(self, *args, **kwargs):
+    def get_ai_list(self, stream=False):
+        """Return the AI list.
+
+        :param stream: If True return an iterator over the AIs of the list,
+            as objects, which are parsed as the response is downloaded. See
+            :meth:`stream_json`.
+
+        """
         key = 'ai_list'
+        if stream:
+            return self.stream_json(self.config[key], key, 'ai')
         return self.get_content(self.config[key])
 
     def get_ai(self, aiid):
@@ -339,4 +735,189 @@ class HutomaUserKey(BaseHutoma):
         url = self.config[key].format(aiid=aiid)
         return self.get_content(url)
 
+    def get_ais(self, hydrate=False, concurrency=8):
+        """Return the AIs of the AI list as objects.
+
+        The list only holds a summary of each AI. The AIs are grouped in an
+        :class:`.AIPrefetch`, so that the first access to a detail missing
+        from the summary of one of them fetches the details of all of them,
+        `concurrency` at a time, rather than of one AI per access.
+
+        :param hydrate: If True fetch the details of the AIs before
+            returning, see :meth:`hydrate_ais`.
+        :param concurrency: The maximum number of requests in flight at once.
+
+        """
+        from hutoma.hydration import AIPrefetch
+        object_class = self.config.by_kind['ai']
+        data = self.get_ai_list()
+        items = data.get('ai_list') if isinstance(data, dict) else None
+        ais = [object_class.from_api_response(
+            self, item if isinstance(item, dict) else {'aiid': item})
+            for item in items or ()]
+        if hydrate:
+            return self.hydrate_ais(ais, concurrency)
+        prefetch = AIPrefetch(self, concurrency)
+        for ai in ais:
+            if isinstance(ai, objects.HutomaObject):
+                prefetch.add(ai)
+        return ais
+
+    def hydrate_ais(self, ais, concurrency=8):
+        """Fetch the details of many AIs concurrently.
+
+        The responses are cached like those of :meth:`get_ai`. See
+        :func:`.hydrate`.
+
+        :param ais: An iterable of AI objects, such as those returned by
+            :meth:`get_ais`, or of AI ids.
+        :param concurrency: The maximum number of requests in flight at once.
+        :returns: The list of the hydrated AI objects, in order. The first
+            error raised fetching an AI is raised once all were fetched.
+
+        """
+        from hutoma.hydration import hydrate
+        object_class = self.config.by_kind['ai']
+        ais = [object_class.from_api_response(self, {'aiid': ai})
+               if isinstance(ai, six.string_types) else ai for ai in ais]
+        for error in hydrate(self, ais, concurrency):
+            if error is not None:
+                raise error
+        return ais
+
+    def chat(self, aiid, question, chat_id=None, retry_on_error=True):
+        """Return the answer of an AI to `question`.
+
+        When `chat_cache_timeout` is set, answers to questions asked outside
+        of a conversation are cached, see :class:`.AnswerCache`, and the
+        `chatId` of a cached answer is that of the first time it was asked.
+
+        :param aiid: The id of the AI to chat with.
+        :param question: The question to ask.
+        :param chat_id: An optional id used to continue a conversation.
+        :param retry_on_error: if True retry the request, if it fails, as the
+            retry_policy allows
+
+        """
+        cache = None if chat_id else self.answer_cache
+        hook = self._json_hutoma_objecter
+        if cache is not None:
+            key = cache.key(aiid, question)
+            answer = cache.get(key, hook)
+            if answer is not None:
+                return answer
+        url = self.config['chat'].format(aiid=aiid)
+        params = {'q': question}
+        if chat_id:
+            params['chatId'] = chat_id
+        if cache is None:
+            return self.request_json(url, params=params,
+                                     retry_on_error=retry_on_error)
+        # The answer is cached as JSON, before it is made into objects
+        answer = self.request_json(url, params=params, as_objects=False,
+                                   retry_on_error=retry_on_error)
+        return cache.set(key, answer, hook)
+
+    def speak(self, aiid, text, output=None, chunk_size=CHUNK_SIZE):
+        """Return the audio of an AI speaking `text` as it is downloaded.
+
+        The audio is streamed, see :meth:`stream_content`, so only one chunk
+        of it is held in memory at a time.
+
+        :param aiid: The id of the AI to speak with.
+        :param text: The text to speak.
+        :param output: A file object opened in binary mode to write the audio
+            to.
+        :param chunk_size: The number of bytes read at once.
+        :returns: The number of bytes written to `output`, or, without
+            `output`, an iterator over the chunks of the audio.
+
+        """
+        url = self.config['speak'].format(aiid=aiid)
+        chunks = self.stream_content(url, params={'q': text},
+                                     chunk_size=chunk_size)
+        if output is None:
+            return chunks
+        size = 0
+        for chunk in chunks:
+            output.write(chunk)
+            size += len(chunk)
+        return size
+
+    def get_training(self, aiid):
+        """Return the training status of an AI."""
+        url = self.config['training'].format(aiid=aiid)
+        return self.get_content(url)
+
+    def chat_many(self, aiid, questions, concurrency=4, ordered=True,
+                  retry_on_error=True):
+        """Return a :class:`.ChatBatch` asking an AI many questions.
+
+        Iterating over the batch yields a :class:`.ChatResult` per question,
+        either in the order of `questions` or, when `ordered` is False, as
+        they complete. At most `concurrency` requests are in flight at once.
+        Throughput statistics are available in the batch's `stats` attribute.
+
+        :param aiid: The id of the AI to chat with.
+        :param questions: An iterable of questions. It is consumed lazily.
+
+        """
+        from hutoma.batch import ChatBatch
+        return ChatBatch(self, aiid, questions, concurrency, ordered,
+                         retry_on_error)
+
+    def evaluate(self, aiid, source_path, target_path, results_path,
+                 concurrency=4, processes=0):
+        """Score the answers of an AI against a source and target file pair.
+
+        See :class:`.Evaluation`; running it again with the same
+        `results_path` only asks the questions that were not scored yet.
+
+        :param aiid: The id of the AI to evaluate.
+        :param source_path: The path of the file of questions, one per line.
+        :param target_path: The path of the file of expected answers.
+        :param results_path: The path of the JSON lines file of results.
+        :param concurrency: The maximum number of questions asked at once.
+        :param processes: The number of scoring processes, or 0 to score in
+            the calling thread.
+        :returns: The summary of the evaluation, see
+            :meth:`.Evaluation.summary`.
+
+        """
+        from hutoma.evaluation import Evaluation
+        return Evaluation(self, aiid, source_path, target_path, results_path,
+                          concurrency, processes).run()
+
+    def upload_training_files(self, aiid, source_path, target_path,
+                              concurrency=2, state_path=None,
+                              manifest_path=None):
+        """Upload a source and target file pair to train an AI.
+
+        The files are streamed and uploaded in chunks of at most
+        MAX_FILE_SIZE bytes; see :class:`.TrainingUpload`. When
+        `manifest_path` is given, only the pairs added since the last upload
+        with the same manifest are uploaded, or none when the files did not
+        change; see :class:`.DeltaTrainingUpload`. If pairs were removed or
+        edited since that upload, :class:`.TrainingPairsRemoved` is raised.
+
+        :param aiid: The id of the AI to train.
+        :param source_path: The path of the file of questions, one per line.
+        :param target_path: The path of the file of answers, one per line.
+        :param concurrency: The maximum number of chunks uploaded at once.
+        :param state_path: The path of a file recording the progress of the
+            upload. When given, running the upload again with the same files
+            only uploads the chunks that failed or were not reached.
+        :param manifest_path: The path of a file recording the pairs
+            uploaded to the AI.
+        :returns: The number of chunks uploaded.
+
+        """
+        from hutoma.training import DeltaTrainingUpload, TrainingUpload
+        if manifest_path:
+            return DeltaTrainingUpload(self, aiid, source_path, target_path,
+                                       manifest_path, concurrency,
+                                       state_path).run()
+        return TrainingUpload(self, aiid, source_path, target_path,
+                              concurrency, state_path).run()
+
 from hutoma import objects  # NOQA
\ No newline at end of file
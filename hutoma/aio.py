@@ -0,0 +1,599 @@
+"""Asyncio bindings for the Hutoma API.
+
+This module requires Python 3.7 or later and the optional ``aiohttp``
+package, installed with ``pip install aiohttp``. It provides
+:class:`AsyncHutomaUserKey`, whose API methods are coroutines that can be
+multiplexed on a single event loop, along with the asynchronous counterparts
+of the handlers found in :mod:`hutoma.handlers`.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import asyncio
+import sys
+import time
+import weakref
+from functools import wraps
+from timeit import default_timer as timer
+
+try:
+    import aiohttp
+except ImportError:
+    raise ImportError('hutoma.aio requires the optional aiohttp package: '
+                      'pip install aiohttp')
+from requests import Response
+from requests.cookies import morsel_to_cookie
+from requests.exceptions import (ConnectionError,  # pylint: disable=W0622
+                                 RequestException, Timeout)
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from six.moves.urllib.parse import urlparse  # pylint: disable=F0401
+
+from hutoma import _HutomaCore, errors
+from hutoma.cache import (ResponseCache, add_conditions, deserialize_entry,
+                          deserialize_response, has_validators,
+                          refresh_response, serialize_response)
+from hutoma.handlers import _hybridmethod, _is_failure
+from hutoma.helpers import normalize_url
+from hutoma.internal import (_decode_entities, _raise_redirect_exceptions,
+                             _raise_response_exceptions)
+from hutoma.ratelimit import limiter_for
+
+
+def _build_response(request, raw, body):
+    """Return a ``requests.Response`` built from an aiohttp response.
+
+    Converting the response allows the existing exception, redirect and cache
+    helpers to be shared with the synchronous client.
+
+    """
+    response = Response()
+    response.status_code = raw.status
+    response.reason = raw.reason
+    response.headers = CaseInsensitiveDict(raw.headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = str(raw.url)
+    response.request = request
+    response._content = body  # pylint: disable=W0212
+    for morsel in raw.cookies.values():
+        response.cookies.set_cookie(morsel_to_cookie(morsel))
+    return response
+
+
+class AsyncRateLimitHandler(object):
+    """The base handler that provides rate limiting on an event loop."""
+
+    # Return the limiter for a domain; replace to plug in another limiter
+    limiter_for = staticmethod(limiter_for)
+
+    @staticmethod
+    def rate_limit(function):
+        """Return a decorator that enforces API request limit guidelines.
+
+        This is the coroutine equivalent of
+        :meth:`.RateLimitHandler.rate_limit`. Limiters are shared with the
+        synchronous handlers, so both clients draw from the same quota, and
+        `_circuit` is handled alike.
+
+        """
+        @wraps(function)
+        async def wrapped(cls, _rate_domain, _rate_delay, _rate_burst=1,
+                          _rate_limiter='token_bucket', _circuit=None,
+                          **kwargs):
+            if _circuit is not None:
+                _circuit.check()
+            limiter = cls.limiter_for(_rate_domain, _rate_delay, _rate_burst,
+                                      _rate_limiter)
+            delay = limiter.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            timings = kwargs.get('_timings')
+            if timings is not None:
+                timings['rate_limit_wait'] = max(delay, 0)
+            if _circuit is None:
+                return await function(cls, **kwargs)
+            # The probe is only claimed once the call is made
+            probe = _circuit.acquire()
+            started = timer()
+            try:
+                response = await function(cls, **kwargs)
+            except Exception:
+                _circuit.record(False, timer() - started, probe)
+                raise
+            except BaseException:
+                _circuit.cancel(probe)  # Interrupted or cancelled
+                raise
+            _circuit.record(not _is_failure(response), timer() - started,
+                            probe)
+            return response
+        return wrapped
+
+    @classmethod
+    def evict(cls, urls):  # pylint: disable=W0613
+        """Method utilized to evict entries for the given urls.
+
+        :param urls: An iterable containing normalized urls.
+        :returns: The number of items removed from the cache.
+
+        By default this method returns False as a cache need not be present.
+
+        """
+        return 0
+
+    @classmethod
+    def evict_tags(cls, tags):  # pylint: disable=W0613
+        """Method utilized to evict entries stored with the given tags.
+
+        :param tags: An iterable of tags.
+        :returns: The number of items removed from the cache.
+
+        """
+        return 0
+
+    @classmethod
+    def evict_prefix(cls, prefix):  # pylint: disable=W0613
+        """Method utilized to evict entries whose url starts with `prefix`.
+
+        :returns: The number of items removed from the cache.
+
+        """
+        return 0
+
+    def __init__(self, pool=None):
+        """Initialize the handler.
+
+        The ``aiohttp.ClientSession`` is created on first use as it must be
+        bound to a running event loop.
+
+        :param pool: A :class:`.ConnectionPool` whose settings are applied to
+            the aiohttp connector. Its connections are not used.
+
+        """
+        self.http = None
+        self.pool_settings = pool.settings if pool else {}
+
+    async def close(self):
+        """Close the HTTP session."""
+        if self.http is not None:
+            await self.http.close()
+            self.http = None
+
+    async def request(self, request, proxies, timeout, verify, _timings=None,
+                      **_):
+        """Responsible for dispatching the request and returning the result.
+
+        Network level exceptions should be raised and only
+        ``requests.Response`` should be returned.
+
+        :param request: A ``requests.PreparedRequest`` object containing all
+            the data necessary to perform the request.
+        :param proxies: A dictionary of proxy settings to be utilized for the
+            request.
+        :param timeout: Specifies the maximum time that the actual HTTP request
+            can take.
+        :param verify: Specifies if SSL certificates should be validated.
+        :param _timings: A dictionary in which the handlers record the
+            duration of the phases of the request, such as `network`.
+
+        ``**_`` should be added to the method call to ignore the extra
+        arguments intended for the cache handler.
+
+        aiohttp's connection errors and timeouts are raised as their
+        ``requests`` equivalents, so that the retry policy treats them alike.
+
+        """
+        if self.http is None:
+            settings = self.pool_settings
+            connector = aiohttp.TCPConnector(
+                limit=(settings.get('pool_connections', 10) *
+                       settings.get('pool_maxsize', 10)),
+                limit_per_host=settings.get('pool_maxsize', 10),
+                force_close=not settings.get('keep_alive', True),
+                keepalive_timeout=settings.get('idle_timeout') or None)
+            # Cookies are tracked by the client, not by the HTTP session
+            self.http = aiohttp.ClientSession(
+                connector=connector, cookie_jar=aiohttp.DummyCookieJar())
+        proxy = (proxies or {}).get(urlparse(request.url).scheme)
+        started = timer()
+        try:
+            async with self.http.request(
+                    request.method, request.url, headers=dict(request.headers),
+                    data=request.body, proxy=proxy, allow_redirects=False,
+                    ssl=None if verify else False,
+                    timeout=aiohttp.ClientTimeout(total=timeout)) as raw:
+                body = await raw.read()
+        except asyncio.TimeoutError as exc:
+            raise Timeout(exc, request=request)
+        except aiohttp.ClientError as exc:
+            raise ConnectionError(exc, request=request)
+        if _timings is not None:
+            _timings['network'] = timer() - started
+        return _build_response(request, raw, body)
+AsyncRateLimitHandler.request = AsyncRateLimitHandler.rate_limit(
+    AsyncRateLimitHandler.request)
+
+
+class AsyncSingleFlight(object):
+    """Deduplicates concurrent coroutine calls that share a key.
+
+    This is the coroutine equivalent of :class:`.SingleFlight`. Calls are
+    tracked per event loop.
+
+    """
+
+    def __init__(self):
+        """Construct an AsyncSingleFlight with no outstanding calls."""
+        self._calls = weakref.WeakKeyDictionary()  # loop -> {key: future}
+        self.calls = self.coalesced = 0
+
+    async def do(self, key, function, *args, **kwargs):
+        """Return the result of `function`, sharing it with concurrent callers.
+
+        :param key: The key identifying identical calls.
+        :param function: The coroutine function to call when no identical call
+            is outstanding. Additional arguments are passed to it.
+
+        """
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        if key in calls:
+            self.coalesced += 1
+            return await asyncio.shield(calls[key])
+        self.calls += 1
+        calls[key] = future = loop.create_future()
+        try:
+            result = await function(*args, **kwargs)
+        except Exception as error:  # pylint: disable=W0703
+            future.set_exception(error)
+            future.exception()  # Do not warn when nobody else was waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del calls[key]
+            if not future.done():  # The leader was cancelled
+                future.cancel()
+
+    def stats(self):
+        """Return a dictionary of the call counters."""
+        return {'calls': self.calls,
+                'coalesced': self.coalesced,
+                'in_flight': sum(len(calls) for calls in
+                                 list(self._calls.values()))}
+
+
+class AsyncDefaultHandler(AsyncRateLimitHandler):
+    """Extends the AsyncRateLimitHandler to add caching support."""
+
+    cache = ResponseCache()
+    cache_hit_callback = None
+
+    @staticmethod
+    def with_cache(function):
+        """Return a decorator that interacts with a handler's cache.
+
+        This is the coroutine equivalent of :meth:`.DefaultHandler.with_cache`.
+        Stale responses are revalidated in the background by tasks of the
+        running event loop.
+
+        """
+        @wraps(function)
+        async def wrapped(cls, _cache_key, _cache_ignore, _cache_timeout,
+                          _cache_stale=0, _cache_swr=False, _cache_tags=(),
+                          **kwargs):
+            async def fetch(call_kwargs, cached=None):
+                """Perform the request and cache a successful result."""
+                if cached is not None:
+                    add_conditions(call_kwargs['request'], cached)
+                result = await function(cls, **call_kwargs)
+                if cached is not None and result.status_code == 304:
+                    result = refresh_response(cached, result)
+                # The handlers don't call `raise_for_status` so we need to
+                # ignore status codes that will result in an exception that
+                # should not be cached.
+                if result.status_code in (200, 302):
+                    keep = _cache_timeout
+                    if _cache_stale and (_cache_swr or has_validators(result)):
+                        keep += _cache_stale
+                    cls.cache.set(_cache_key, serialize_response(
+                        result, time.time() + _cache_timeout), keep,
+                        _cache_tags)
+                return result
+
+            async def refresh(cached):
+                """Revalidate a stale response in the background."""
+                call_kwargs = dict(kwargs, request=kwargs['request'].copy())
+                call_kwargs.pop('_timings', None)
+                try:
+                    await fetch(call_kwargs, cached)
+                except Exception:  # pylint: disable=W0703
+                    pass  # The stale response is served until refreshed
+                finally:
+                    cls.refreshing.pop(_cache_key, None)
+
+            if _cache_ignore:
+                return await function(cls, **kwargs)
+            started = timer()
+            data = cls.cache.get(_cache_key)
+            timings = kwargs.get('_timings')
+            if timings is not None:
+                timings['cache_lookup'] = timer() - started
+            is_get = kwargs['request'].method == 'GET'
+            cached = None
+            if data is not None:
+                cached, fresh_until = deserialize_entry(data,
+                                                        kwargs['request'])
+                if fresh_until is None or time.time() < fresh_until:
+                    if cls.cache_hit_callback:
+                        cls.cache_hit_callback(_cache_key)
+                    return cached
+                if not is_get:
+                    cached = None
+                elif _cache_swr:
+                    task = cls.refreshing.get(_cache_key)
+                    if task is None or task.done():
+                        # The reference keeps the task from being collected
+                        cls.refreshing[_cache_key] = asyncio.ensure_future(
+                            refresh(deserialize_response(data)))
+                    return cached
+                elif not has_validators(cached):
+                    cached = None
+            if not is_get:
+                return await fetch(kwargs)
+            return await cls.in_flight.do(_cache_key, fetch, kwargs, cached)
+        return wrapped
+
+    def __init__(self, max_entries=None, max_bytes=None, cache=None,
+                 pool=None):
+        """Initialize the handler and apply the cache bounds.
+
+        The parameters match those of :class:`.DefaultHandler`.
+
+        """
+        super(AsyncDefaultHandler, self).__init__(pool)
+        self.in_flight = AsyncSingleFlight()
+        # The key -> task of responses revalidated in the background
+        self.refreshing = {}
+        if cache is not None:
+            self.cache = cache
+        self.cache.resize(max_entries, max_bytes)
+
+    @_hybridmethod
+    def clear_cache(self):
+        """Remove all items from the cache."""
+        self.cache.clear()
+
+    @_hybridmethod
+    def evict(self, urls):
+        """Remove items from cache matching URLs.
+
+        Return the number of items removed.
+
+        """
+        return self.cache.evict_urls(set(normalize_url(url) for url in urls))
+
+    @_hybridmethod
+    def evict_tags(self, tags):
+        """Remove items from cache stored with any of the tags.
+
+        Return the number of items removed.
+
+        """
+        return self.cache.evict_tags(set(tags))
+
+    @_hybridmethod
+    def evict_prefix(self, prefix):
+        """Remove items from cache whose url starts with `prefix`.
+
+        Return the number of items removed.
+
+        """
+        return self.cache.evict_prefix(normalize_url(prefix))
+AsyncDefaultHandler.request = AsyncDefaultHandler.with_cache(
+    AsyncRateLimitHandler.request)
+
+
+class AsyncHutomaUserKey(_HutomaCore):
+    """Provides asyncio bindings for basic functions of Hutoma's API.
+
+    All API methods are coroutines. The client shares its configuration,
+    request building and cookie handling with :class:`.HutomaUserKey`, but
+    only provides the API methods listed here; the others, such as
+    `chat_many` or `upload_training_files`, are only available in the
+    blocking client. The client can be used as an asynchronous context
+    manager to close its HTTP session on exit. Unless another handler is
+    given, an :class:`AsyncDefaultHandler` is used::
+
+        async with AsyncHutomaUserKey('my-app') as hutoma:
+            ais = await hutoma.get_ai_list()
+
+    """
+
+    default_handler = AsyncDefaultHandler
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    async def close(self):
+        """Close the handler's HTTP session."""
+        await self.handler.close()
+
+    async def _request(self, url, params=None, data=None, files=None,
+                       auth=None, timeout=None, raw_response=False,
+                       retry_on_error=True, method=None):
+        """Given a page url and a dict of params, open and return the page.
+
+        The parameters match those of :meth:`.BaseHutoma._request`.
+
+        """
+        timeout = self.config.timeout if timeout is None else timeout
+        started = timer()
+        request, key_items, kwargs = self._build_request(
+            url, params, data, auth, files, method, raw_response)
+        self.stats.record(self.config.route_for(url), 'prepare',
+                          timer() - started)
+        response = await self._send(request, key_items, kwargs, timeout,
+                                    retry_on_error)
+        if raw_response:
+            return response
+        else:
+            return _decode_entities(response.text)
+
+    async def _send(self, request, key_items, kwargs, timeout, retry_on_error):
+        """Send a request built by _build_request and return the response.
+
+        Redirects are followed and, if `retry_on_error` is True, failed
+        attempts are retried as the `retry_policy` decides.
+
+        """
+        async def handle_redirect():
+            response = None
+            url = request.url
+            hops = 0
+            while url:  # Manually handle 302 redirects
+                hop_started = timer()
+                request.url = url
+                kwargs['_cache_key'] = (normalize_url(request.url),
+                                        tuple(key_items))
+                timings = {}
+                response = await self.handler.request(
+                    request=request.prepare(),
+                    proxies=self.http.proxies,
+                    timeout=timeout,
+                    verify=self.http.validate_certs, _timings=timings,
+                    **kwargs)
+                self.stats.record_timings(route, timings)
+                if hops:
+                    self.stats.record(route, 'redirect', timer() - hop_started)
+                hops += 1
+
+                if self.config.log_requests >= 2:
+                    msg = 'status: {0}\n'.format(response.status_code)
+                    sys.stderr.write(msg)
+                url = _raise_redirect_exceptions(response)
+                assert url != request.url
+            return response
+
+        route = self.config.route_for(request.url)
+        started = timer()
+        self.retry_policy.started()
+        attempt = 1
+        while True:
+            attempt_started = timer()
+            try:
+                response = await handle_redirect()
+                _raise_response_exceptions(response)
+                self._update_cookies(response.cookies)
+                if route == 'training' and self.answer_cache is not None:
+                    self._observe_training(request, response)
+                self.stats.record(route, 'total', timer() - started)
+                return response
+
+            except (errors.HTTPException, RequestException) as error:
+                delay = None
+                if retry_on_error:
+                    delay = self.retry_policy.delay(error, request.method,
+                                                    attempt)
+                if delay is None:
+                    self.stats.record(route, 'total', timer() - started)
+                    raise
+                self.stats.record(route, 'retry', timer() - attempt_started)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def get_content(self, url, params=None):
+        """Return hutoma content from a URL."""
+        return await self.request_json(url, params=params)
+
+    async def request(self, url, params=None, data=None, retry_on_error=False,
+                      method=None):
+        """Make a HTTP request and return the response.
+
+        The parameters match those of :meth:`.BaseHutoma.request`.
+
+        """
+        return await self._request(url, params, data, raw_response=True,
+                                   retry_on_error=retry_on_error,
+                                   method=method)
+
+    async def request_json(self, url, params=None, data=None, as_objects=True,
+                           retry_on_error=True, method=None):
+        """Get the JSON processed from a page.
+
+        The parameters match those of :meth:`.BaseHutoma.request_json`.
+
+        """
+        started = timer()
+        request, key_items, kwargs = self._build_request(
+            url, params, data, None, None, method, False)
+        self.stats.record(self.config.route_for(url), 'prepare',
+                          timer() - started)
+        response = await self._send(request, key_items, kwargs,
+                                    self.config.timeout, retry_on_error)
+        return self._parse_json(response, url, as_objects)
+
+    async def get_ai_list(self):
+        key = 'ai_list'
+        return await self.get_content(self.config[key])
+
+    async def get_ai(self, aiid):
+        key = 'ai'
+        url = self.config[key].format(aiid=aiid)
+        return await self.get_content(url)
+
+    async def chat(self, aiid, question, chat_id=None):
+        """Return the answer of an AI to `question`.
+
+        :param aiid: The id of the AI to chat with.
+        :param question: The question to ask.
+        :param chat_id: An optional id used to continue a conversation.
+
+        Answers are cached like those of :meth:`.HutomaUserKey.chat`.
+
+        """
+        cache = None if chat_id else self.answer_cache
+        hook = self._json_hutoma_objecter
+        if cache is not None:
+            key = cache.key(aiid, question)
+            answer = cache.get(key, hook)
+            if answer is not None:
+                return answer
+        url = self.config['chat'].format(aiid=aiid)
+        params = {'q': question}
+        if chat_id:
+            params['chatId'] = chat_id
+        if cache is None:
+            return await self.get_content(url, params=params)
+        answer = await self.request_json(url, params=params, as_objects=False)
+        return cache.set(key, answer, hook)
+
+    async def speak(self, aiid, text):
+        """Return the audio body, as bytes, of an AI speaking `text`."""
+        url = self.config['speak'].format(aiid=aiid)
+        response = await self._request(url, params={'q': text},
+                                       raw_response=True)
+        return response.content
+
+    async def get_training(self, aiid):
+        """Return the training status of an AI."""
+        url = self.config['training'].format(aiid=aiid)
+        return await self.get_content(url)
+
+    async def upload_training(self, aiid, training_file):
+        """Upload a training file to an AI.
+
+        :param aiid: The id of the AI to train.
+        :param training_file: A file object, or bytes, containing the training
+            material.
+
+        """
+        url = self.config['training'].format(aiid=aiid)
+        response = await self._request(url, files={'file': training_file},
+                                       raw_response=True,
+                                       retry_on_error=False)
+        return self._parse_json(response, url, as_objects=True)
@@ -0,0 +1,137 @@
+"""A cache of the answers of AIs to chat questions.
+
+Many questions, such as greetings, are asked over and over. The answer of
+an AI only depends on the question and on the model the AI was trained into,
+so answers are cached by AI, training version and normalized question rather
+than by request url. Answers found in the cache are returned without making
+a request, and thus without waiting on the rate limiter.
+
+The training version of an AI is learned from the responses of its
+`training` route: when it changes, or when training material is uploaded,
+the answers cached for the AI are evicted.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import json
+import re
+from hutoma.cache import ResponseCache
+from threading import Lock
+
+PUNCTUATION_RE = re.compile(r'[\s?!.,;:]+$', re.UNICODE)
+
+
+def normalize_question(question):
+    """Return `question` without case, extra whitespace or end punctuation.
+
+    "Hello!", "hello" and "  HELLO ?" are thus the same question.
+
+    """
+    return PUNCTUATION_RE.sub('', ' '.join(question.lower().split()))
+
+
+def training_version(data):
+    """Return what identifies the model described by a `training` response.
+
+    The `status` member describes the request rather than the AI and is
+    ignored; any other change, such as a new training status or progress,
+    is a new version.
+
+    """
+    if isinstance(data, dict):
+        data = dict((key, value) for key, value in data.items()
+                    if key != 'status')
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')) \
+        .hexdigest()
+
+
+class AnswerCache(object):
+    """A bounded in-memory cache of chat answers.
+
+    Look answers up with the key returned by :meth:`key`, and store them with
+    the same key: an answer whose AI got a new training version in between is
+    not stored.
+
+    :param timeout: The seconds answers are kept.
+    :param max_entries: The maximum number of answers to keep, or 0 for no
+        limit.
+    :param max_bytes: The maximum total size of the answers, as JSON, or 0 for
+        no limit.
+
+    """
+
+    def __init__(self, timeout, max_entries=0, max_bytes=0):
+        """Construct an empty AnswerCache."""
+        self.timeout = timeout
+        self.cache = ResponseCache(max_entries, max_bytes)
+        self.lock = Lock()
+        self.versions = {}  # aiid -> training version
+
+    def key(self, aiid, question):
+        """Return the key of the answer of `aiid` to `question`."""
+        return (aiid, self.versions.get(aiid), normalize_question(question))
+
+    def get(self, key, object_hook=None):
+        """Return a copy of the answer stored for `key`, or None.
+
+        :param object_hook: A function making objects of the JSON objects of
+            the answer, as for ``json.loads``.
+
+        """
+        value = self.cache.get(key)
+        return None if value is None else json.loads(
+            value, object_hook=object_hook)
+
+    def set(self, key, answer, object_hook=None):
+        """Store `answer` for `key` unless the AI's version has changed.
+
+        :param answer: The answer as decoded JSON, without objects, which
+            cannot be serialized.
+        :param object_hook: A function making objects of the JSON objects of
+            the answer returned, as for :meth:`get`.
+        :returns: A copy of the answer, or the answer itself when there is
+            no `object_hook`.
+
+        """
+        value = json.dumps(answer)
+        with self.lock:
+            if self.versions.get(key[0]) == key[1]:
+                self.cache.set(key, value, self.timeout)
+        if object_hook is None:
+            return answer
+        return json.loads(value, object_hook=object_hook)
+
+    def set_version(self, aiid, version):
+        """Record the training version of `aiid`.
+
+        :returns: The number of answers evicted because the version changed.
+
+        """
+        with self.lock:
+            if aiid in self.versions and self.versions[aiid] == version:
+                return 0
+            self.versions[aiid] = version
+            return self.cache.evict_urls((aiid,))
+
+    def invalidate(self, aiid):
+        """Forget the training version and evict the answers of `aiid`.
+
+        :returns: The number of answers evicted.
+
+        """
+        with self.lock:
+            self.versions.pop(aiid, None)
+            return self.cache.evict_urls((aiid,))
+
+    def clear(self):
+        """Evict all answers."""
+        with self.lock:
+            self.versions = {}
+            self.cache.clear()
+
+    def stats(self):
+        """Return a dictionary of the cache counters."""
+        return {'entries': len(self.cache), 'bytes': self.cache.size,
+                'hits': self.cache.hits, 'misses': self.cache.misses}
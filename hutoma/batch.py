@@ -0,0 +1,121 @@
+"""Batch requests sent concurrently through a Hutoma client."""
+
+from __future__ import print_function, unicode_literals
+
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Lock
+from timeit import default_timer as timer
+
+ChatResult = namedtuple('ChatResult', 'index question answer error')
+ChatResult.__doc__ = """The outcome of one question of a :class:`ChatBatch`.
+
+`answer` is the answer as returned by :meth:`.HutomaUserKey.chat`, or None
+when asking raised `error`.
+
+"""
+
+
+class BatchStats(object):
+    """Throughput statistics of a batch."""
+
+    def __init__(self):
+        """Construct empty statistics."""
+        self.lock = Lock()
+        self.submitted = self.completed = self.errors = 0
+        self.started = self.finished = None
+
+    @property
+    def elapsed(self):
+        """Return the seconds spent on the batch so far."""
+        if self.started is None:
+            return 0
+        return (self.finished or timer()) - self.started
+
+    @property
+    def throughput(self):
+        """Return the number of completed requests per second."""
+        elapsed = self.elapsed
+        return self.completed / elapsed if elapsed else 0
+
+    def __repr__(self):
+        return ('<BatchStats completed={0} errors={1} elapsed={2:.3f}s '
+                'throughput={3:.1f}/s>'.format(self.completed, self.errors,
+                                               self.elapsed, self.throughput))
+
+
+class ChatBatch(object):
+    """Iterate over the answers of an AI to many questions.
+
+    Questions are consumed lazily and at most `concurrency` requests are in
+    flight at any time. Each question is asked with the session's
+    :meth:`~.HutomaUserKey.chat`, so answers are cached and decoded as they
+    are for a single question, and a failing question yields a
+    :class:`ChatResult` with its `error` set rather than aborting the batch.
+    In order, the answers completed ahead of an earlier one are held until
+    it completes, while further requests keep the window full.
+
+    :param session: The :class:`.BaseHutoma` client to send requests with.
+    :param aiid: The id of the AI to chat with.
+    :param questions: An iterable of questions.
+    :param concurrency: The maximum number of requests in flight.
+    :param ordered: If True results are yielded in the order of `questions`,
+        otherwise as soon as they complete.
+    :param retry_on_error: if True retry a request, if it fails, as the
+        session's retry_policy allows
+
+    """
+
+    def __init__(self, session, aiid, questions, concurrency=4, ordered=True,
+                 retry_on_error=True):
+        """Construct a ChatBatch. No request is made until it is iterated."""
+        self.session = session
+        self.aiid = aiid
+        self.questions = questions
+        self.concurrency = max(1, concurrency)
+        self.ordered = ordered
+        self.retry_on_error = retry_on_error
+        self.stats = BatchStats()
+
+    def __iter__(self):
+        def ask(index, question):
+            try:
+                answer = self.session.chat(
+                    self.aiid, question, retry_on_error=self.retry_on_error)
+                result = ChatResult(index, question, answer, None)
+            except Exception as error:  # pylint: disable=W0703
+                result = ChatResult(index, question, None, error)
+            with self.stats.lock:
+                self.stats.completed += 1
+                if result.error is not None:
+                    self.stats.errors += 1
+            return result
+
+        self.stats.started = timer()
+        pending = set()
+        held = {}  # index -> result completed ahead of its turn
+        following = 0  # The index of the next result yielded in order
+        questions = enumerate(self.questions)
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            def submit():
+                for index, question in questions:
+                    pending.add(executor.submit(ask, index, question))
+                    self.stats.submitted += 1
+                    if len(pending) >= self.concurrency:
+                        break
+
+            submit()
+            while pending:
+                done = wait(pending, return_when=FIRST_COMPLETED)[0]
+                pending.difference_update(done)
+                submit()
+                for future in done:
+                    result = future.result()
+                    if not self.ordered:
+                        yield result
+                        continue
+                    held[result.index] = result
+                    while following in held:
+                        yield held.pop(following)
+                        following += 1
+        self.stats.finished = timer()
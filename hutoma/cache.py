@@ -0,0 +1,670 @@
+"""Cache backends used by the handlers to store responses.
+
+Responses are stored serialized, as returned by :func:`serialize_response`,
+so that backends can be shared between processes. A backend provides the
+methods of :class:`CacheBackend`.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import json
+import os
+import six
+import time
+from collections import OrderedDict
+from heapq import heapify, heappop, heappush
+from itertools import count
+from requests import Response
+from requests.cookies import create_cookie
+from requests.structures import CaseInsensitiveDict
+from threading import Event, Lock, local
+from timeit import default_timer as timer
+
+
+def serialize_response(response, fresh_until=None):
+    """Return the status, headers, cookies and body of a response as bytes.
+
+    :param fresh_until: The time, as returned by ``time.time()``, after which
+        the response is stale and should be revalidated, or None if it is
+        fresh for as long as it is cached.
+
+    """
+    meta = {'status': response.status_code,
+            'reason': response.reason,
+            'url': response.url,
+            'encoding': response.encoding,
+            'headers': list(response.headers.items()),
+            'cookies': [(cookie.name, cookie.value, cookie.domain, cookie.path)
+                        for cookie in response.cookies],
+            'fresh_until': fresh_until}
+    return json.dumps(meta).encode('utf-8') + b'\n' + (response.content or b'')
+
+
+def deserialize_entry(data, request=None):
+    """Return the response and `fresh_until` time serialized in `data`.
+
+    :param data: The output of :func:`serialize_response`.
+    :param request: The ``requests.PreparedRequest`` to attach to the
+        response.
+
+    """
+    meta, body = data.split(b'\n', 1)
+    meta = json.loads(meta.decode('utf-8'))
+    response = Response()
+    response.status_code = meta['status']
+    response.reason = meta['reason']
+    response.url = meta['url']
+    response.encoding = meta['encoding']
+    response.headers = CaseInsensitiveDict(meta['headers'])
+    for name, value, domain, path in meta['cookies']:
+        response.cookies.set_cookie(
+            create_cookie(name, value, domain=domain, path=path))
+    response.request = request
+    response._content = body  # pylint: disable=W0212
+    response._content_consumed = True  # pylint: disable=W0212
+    return response, meta.get('fresh_until')
+
+
+def deserialize_response(data, request=None):
+    """Return a ``requests.Response`` from the output of serialize_response.
+
+    :param data: The serialized response.
+    :param request: The ``requests.PreparedRequest`` to attach to the
+        response.
+
+    """
+    return deserialize_entry(data, request)[0]
+
+
+VALIDATORS = (('ETag', 'If-None-Match'),
+              ('Last-Modified', 'If-Modified-Since'))
+# Headers of a 304 response that update those of the cached response
+REFRESHED_HEADERS = ('Cache-Control', 'Date', 'ETag', 'Expires',
+                     'Last-Modified')
+
+
+def has_validators(response):
+    """Return True if `response` can be revalidated with a conditional GET."""
+    return any(header in response.headers for header, _ in VALIDATORS)
+
+
+def add_conditions(request, cached):
+    """Make `request` conditional on the validators of a cached response."""
+    for header, condition in VALIDATORS:
+        if header in cached.headers:
+            request.headers[condition] = cached.headers[header]
+
+
+def refresh_response(cached, not_modified):
+    """Update a cached response from a 304 response and return it."""
+    for header in REFRESHED_HEADERS:
+        if header in not_modified.headers:
+            cached.headers[header] = not_modified.headers[header]
+    cached.cookies.update(not_modified.cookies)
+    return cached
+
+
+def _key_digest(key):
+    """Return a string identifying a cache key in a shared store."""
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+
+class CacheBackend(object):
+    """The interface of the cache backends used by the handlers.
+
+    Keys are tuples whose first item is the normalized url of the request.
+    Values are serialized responses. Tags are strings, such as
+    ``aiid:<aiid>``, grouping the entries to evict together.
+
+    """
+
+    def get(self, key):
+        """Return the value stored for `key`, or None when absent."""
+        raise NotImplementedError
+
+    def set(self, key, value, timeout, tags=()):
+        """Store `value` for `key` for `timeout` seconds, with `tags`."""
+        raise NotImplementedError
+
+    def resize(self, max_entries=None, max_bytes=None):
+        """Change the bounds of the cache, evicting entries if needed."""
+
+    def clear(self):
+        """Remove all items from the cache."""
+        raise NotImplementedError
+
+    def evict_urls(self, urls):
+        """Remove the entries for the given normalized urls.
+
+        Return the number of items removed.
+
+        """
+        raise NotImplementedError
+
+    def evict_tags(self, tags):
+        """Remove the entries stored with any of the given tags.
+
+        Return the number of items removed.
+
+        """
+        raise NotImplementedError
+
+    def evict_prefix(self, prefix):
+        """Remove the entries whose normalized url starts with `prefix`.
+
+        Return the number of items removed.
+
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """Return a dictionary of the cache counters."""
+        return {}
+
+
+class ResponseCache(CacheBackend):
+    """A thread-safe in-memory LRU cache whose entries expire after a timeout.
+
+    Entries are indexed by the normalized url of their key and by their tags,
+    so that evicting by url or tag costs time proportional to the entries
+    evicted rather than to the size of the cache; evicting by url prefix scans
+    the urls only. Lookups and insertions are O(1); expired entries are
+    removed from an expiry heap in O(log n) each.
+
+    :param max_entries: The maximum number of entries to keep, or 0 for no
+        limit.
+    :param max_bytes: The maximum total size of the entries to keep, or 0 for
+        no limit.
+    :param sizeof: A function returning the size of a value in bytes.
+
+    """
+
+    def __init__(self, max_entries=0, max_bytes=0, sizeof=len):
+        """Construct an empty ResponseCache."""
+        self.lock = Lock()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()  # key -> (value, expires, size, tags)
+        self._expiry = []  # heap of (expires, sequence, key)
+        self._sequence = count()
+        self._by_url = {}  # normalized url -> set of keys
+        self._by_tag = {}  # tag -> set of keys
+        self.size = 0
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __contains__(self, key):
+        with self.lock:
+            self._expire(timer())
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expire(self, now):
+        """Remove the entries that have expired by `now`."""
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, _, key = heappop(self._expiry)
+            entry = self._entries.get(key)
+            # Heap items of replaced or removed entries are skipped
+            if entry is not None and entry[1] == expires:
+                self._remove(key)
+                self.expirations += 1
+
+    def _remove(self, key):
+        """Remove `key` from the cache and its indices."""
+        _, _, size, tags = self._entries.pop(key)
+        self.size -= size
+        keys = self._by_url.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_url[key[0]]
+        for tag in tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def _shrink(self):
+        """Evict least recently used entries until within the bounds."""
+        while self._entries and (
+                (self.max_entries and len(self._entries) > self.max_entries) or
+                (self.max_bytes and self.size > self.max_bytes)):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        # Drop dead heap items once they outnumber the live entries
+        if len(self._expiry) > 2 * len(self._entries) + 64:
+            self._expiry = [item for item in self._expiry
+                            if item[2] in self._entries and
+                            self._entries[item[2]][1] == item[0]]
+            heapify(self._expiry)
+
+    def get(self, key):
+        """Return the value stored for `key`, or None when absent."""
+        with self.lock:
+            self._expire(timer())
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[key] = entry  # Mark as most recently used
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, timeout, tags=()):
+        """Store `value` for `key` for `timeout` seconds, with `tags`."""
+        size = self.sizeof(value)
+        tags = tuple(tags)
+        with self.lock:
+            now = timer()
+            self._expire(now)
+            if key in self._entries:
+                self._remove(key)
+            expires = now + timeout
+            self._entries[key] = (value, expires, size, tags)
+            self._by_url.setdefault(key[0], set()).add(key)
+            for tag in tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            self.size += size
+            heappush(self._expiry, (expires, next(self._sequence), key))
+            self._shrink()
+
+    def resize(self, max_entries=None, max_bytes=None):
+        """Change the bounds of the cache, evicting entries if needed."""
+        with self.lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            self._shrink()
+
+    def clear(self):
+        """Remove all items from the cache."""
+        with self.lock:
+            self._entries = OrderedDict()
+            self._expiry = []
+            self._by_url = {}
+            self._by_tag = {}
+            self.size = 0
+
+    def evict_urls(self, urls):
+        """Remove the entries for the given normalized urls.
+
+        Return the number of items removed.
+
+        """
+        retval = 0
+        with self.lock:
+            for url in urls:
+                for key in list(self._by_url.get(url, ())):
+                    self._remove(key)
+                    retval += 1
+        return retval
+
+    def evict_tags(self, tags):
+        """Remove the entries stored with any of the given tags.
+
+        Return the number of items removed.
+
+        """
+        retval = 0
+        with self.lock:
+            for tag in tags:
+                for key in list(self._by_tag.get(tag, ())):
+                    self._remove(key)
+                    retval += 1
+        return retval
+
+    def evict_prefix(self, prefix):
+        """Remove the entries whose normalized url starts with `prefix`.
+
+        Return the number of items removed.
+
+        """
+        retval = 0
+        with self.lock:
+            for url in [url for url in self._by_url if url.startswith(prefix)]:
+                for key in list(self._by_url[url]):
+                    self._remove(key)
+                    retval += 1
+        return retval
+
+    def stats(self):
+        """Return a dictionary of the cache counters."""
+        with self.lock:
+            return {'entries': len(self._entries),
+                    'bytes': self.size,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'expirations': self.expirations}
+
+
+
+class SQLiteCache(CacheBackend):
+    """A cache stored in a SQLite database on the local disk.
+
+    Several processes on the same host can share the cache by using the same
+    database path. When `max_entries` or `max_bytes` is exceeded, the entries
+    closest to expiring are removed first.
+
+    :param path: The path of the database file.
+    :param max_entries: The maximum number of entries to keep, or 0 for no
+        limit.
+    :param max_bytes: The maximum total size of the stored responses, or 0
+        for no limit. The total is kept up to date by triggers as entries are
+        stored and removed, so it is not recomputed on every store.
+
+    """
+
+    def __init__(self, path, max_entries=0, max_bytes=0):
+        """Construct a SQLiteCache, creating the database when needed."""
+        import sqlite3  # Only imported when this backend is used
+        self._sqlite3 = sqlite3
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = local()
+        self._lock = Lock()
+        self.hits = self.misses = 0
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                               'key TEXT PRIMARY KEY, url TEXT, '
+                               'expires REAL, value BLOB)')
+            connection.execute('CREATE INDEX IF NOT EXISTS responses_url '
+                               'ON responses (url)')
+            connection.execute('CREATE INDEX IF NOT EXISTS responses_expires '
+                               'ON responses (expires)')
+            connection.execute('CREATE TABLE IF NOT EXISTS tags ('
+                               'tag TEXT, key TEXT, expires REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS tags_tag '
+                               'ON tags (tag)')
+            connection.execute('CREATE INDEX IF NOT EXISTS tags_expires '
+                               'ON tags (expires)')
+            connection.execute('CREATE INDEX IF NOT EXISTS tags_key '
+                               'ON tags (key)')
+            connection.execute('CREATE TABLE IF NOT EXISTS totals '
+                               '(bytes INTEGER)')
+            connection.execute('INSERT INTO totals SELECT COALESCE(SUM('
+                               'LENGTH(value)), 0) FROM responses WHERE NOT '
+                               'EXISTS (SELECT 1 FROM totals)')
+            connection.execute('CREATE TRIGGER IF NOT EXISTS responses_insert '
+                               'AFTER INSERT ON responses BEGIN UPDATE totals '
+                               'SET bytes = bytes + LENGTH(new.value); END')
+            connection.execute('CREATE TRIGGER IF NOT EXISTS responses_delete '
+                               'AFTER DELETE ON responses BEGIN UPDATE totals '
+                               'SET bytes = bytes - LENGTH(old.value); END')
+
+    def _connection(self):
+        """Return the connection of the current thread and process."""
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = self._sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM responses WHERE key = ? AND expires > ?',
+            (_key_digest(key), time.time())).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return bytes(row[0])
+
+    def set(self, key, value, timeout, tags=()):
+        now = time.time()
+        digest = _key_digest(key)
+        with self._connection() as connection:
+            connection.execute('DELETE FROM responses WHERE expires <= ?',
+                               (now,))
+            connection.execute('DELETE FROM tags WHERE expires <= ?', (now,))
+            # A replaced row would not fire the delete trigger
+            connection.execute('DELETE FROM responses WHERE key = ?',
+                               (digest,))
+            connection.execute(
+                'INSERT INTO responses VALUES (?, ?, ?, ?)',
+                (digest, key[0], now + timeout,
+                 self._sqlite3.Binary(value)))
+            # Tags of evicted entries are left to expire; they only ever
+            # match keys that are no longer stored.
+            connection.execute('DELETE FROM tags WHERE key = ?', (digest,))
+            connection.executemany('INSERT INTO tags VALUES (?, ?, ?)',
+                                   [(tag, digest, now + timeout)
+                                    for tag in tags])
+            if self.max_entries:
+                connection.execute(
+                    'DELETE FROM responses WHERE key IN (SELECT key FROM '
+                    'responses ORDER BY expires DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,))
+            if self.max_bytes:
+                self._evict_bytes(connection)
+
+    def _evict_bytes(self, connection):
+        """Remove the entries closest to expiring beyond `max_bytes`."""
+        (size,) = connection.execute('SELECT bytes FROM totals').fetchone()
+        while size > self.max_bytes:
+            row = connection.execute(
+                'SELECT key, LENGTH(value) FROM responses ORDER BY expires '
+                'LIMIT 1').fetchone()
+            if row is None:
+                break
+            connection.execute('DELETE FROM responses WHERE key = ?',
+                               (row[0],))
+            size -= row[1]
+
+    def resize(self, max_entries=None, max_bytes=None):
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+
+    def clear(self):
+        self._count_and_clear()
+
+    def evict_urls(self, urls):
+        with self._connection() as connection:
+            return sum(connection.execute(
+                'DELETE FROM responses WHERE url = ?', (url,)).rowcount
+                for url in urls)
+
+    def evict_tags(self, tags):
+        with self._connection() as connection:
+            retval = 0
+            for tag in tags:
+                retval += connection.execute(
+                    'DELETE FROM responses WHERE key IN '
+                    '(SELECT key FROM tags WHERE tag = ?)', (tag,)).rowcount
+                connection.execute('DELETE FROM tags WHERE tag = ?', (tag,))
+            return retval
+
+    def evict_prefix(self, prefix):
+        if not prefix:
+            return self._count_and_clear()
+        # The urls starting with prefix sort between it and its successor
+        end = prefix[:-1] + six.unichr(ord(prefix[-1]) + 1)
+        with self._connection() as connection:
+            return connection.execute(
+                'DELETE FROM responses WHERE url >= ? AND url < ?',
+                (prefix, end)).rowcount
+
+    def _count_and_clear(self):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM tags')
+            return connection.execute('DELETE FROM responses').rowcount
+
+    def stats(self):
+        connection = self._connection()
+        (entries,) = connection.execute(
+            'SELECT COUNT(*) FROM responses').fetchone()
+        (size,) = connection.execute('SELECT bytes FROM totals').fetchone()
+        return {'entries': entries, 'bytes': size, 'hits': self.hits,
+                'misses': self.misses}
+
+
+class KeyValueCache(CacheBackend):
+    """Adapts a memcached or Redis style client to a cache backend.
+
+    The client must provide ``get(key)``, ``set(key, value, timeout)``,
+    ``add(key, value, timeout)``, ``append(key, value)``, ``incr(key, delta)``
+    and ``delete(key)``, as the common memcached clients do, where a timeout
+    of 0 means the value does not expire. Redis clients need a small wrapper
+    to map these onto ``set``, ``set(nx=True)``, ``append`` and ``incrby``. A
+    generation number stored alongside the entries is incremented to clear
+    the cache, and the keys of the entries are appended to an index per url
+    and per tag to evict by url or tag. Evicting by prefix clears the whole
+    cache.
+
+    :param client: The client of the key-value store.
+    :param prefix: A prefix added to all keys, to share a store with other
+        applications.
+
+    """
+
+    def __init__(self, client, prefix='hutoma:'):
+        """Construct a KeyValueCache using `client`."""
+        self.client = client
+        self.prefix = prefix
+        self._lock = Lock()
+        self.hits = self.misses = 0
+
+    def _generation(self):
+        return int(self.client.get(self.prefix + 'generation') or 0)
+
+    def _index_key(self, generation, kind, name):
+        """Return the key of the index of entry keys for a url or tag."""
+        return '{0}{1}:{2}:{3}'.format(self.prefix, generation, kind,
+                                       _key_digest(name))
+
+    def _entry_key(self, generation, key):
+        return '{0}{1}:{2}'.format(self.prefix, generation,
+                                   _key_digest(key))
+
+    def get(self, key):
+        value = self.client.get(self._entry_key(self._generation(), key))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return value
+
+    def set(self, key, value, timeout, tags=()):
+        generation = self._generation()
+        entry_key = self._entry_key(generation, key)
+        self.client.set(entry_key, value, int(timeout) or 1)
+        # The key is appended to the indices, which concurrent stores cannot
+        # overwrite. An index lives twice as long as the entry creating it,
+        # to outlive the entries appended to it later on.
+        for index_key in [self._index_key(generation, 'url', key[0])] + [
+                self._index_key(generation, 'tag', tag) for tag in tags]:
+            self.client.add(index_key, '', 2 * int(timeout) or 2)
+            self.client.append(index_key, entry_key + ' ')
+
+    def clear(self):
+        key = self.prefix + 'generation'
+        if self.client.incr(key, 1) is None and \
+                not self.client.add(key, '1', 0):
+            self.client.incr(key, 1)  # Added by another client meanwhile
+
+    def _evict_indices(self, index_keys):
+        retval = 0
+        for index_key in index_keys:
+            entry_keys = self.client.get(index_key) or b''
+            if isinstance(entry_keys, bytes):
+                entry_keys = entry_keys.decode('utf-8')
+            for entry_key in set(entry_keys.split()):
+                retval += 1
+                self.client.delete(entry_key)
+            self.client.delete(index_key)
+        return retval
+
+    def evict_urls(self, urls):
+        generation = self._generation()
+        return self._evict_indices(self._index_key(generation, 'url', url)
+                                   for url in urls)
+
+    def evict_tags(self, tags):
+        generation = self._generation()
+        return self._evict_indices(self._index_key(generation, 'tag', tag)
+                                   for tag in tags)
+
+    def evict_prefix(self, prefix):
+        # Key-value stores cannot list keys by prefix, so all entries are
+        # dropped; the number removed is unknown.
+        self.clear()
+        return 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class _Call(object):
+    """An outstanding call tracked by :class:`SingleFlight`."""
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Deduplicates concurrent calls that share a key.
+
+    While a call for a key is outstanding, other callers using the same key
+    wait for it to finish and receive its result, or its exception, instead of
+    making the call themselves.
+
+    """
+
+    def __init__(self):
+        """Construct a SingleFlight with no outstanding calls."""
+        self.lock = Lock()
+        self._calls = {}
+        self.calls = self.coalesced = 0
+
+    def do(self, key, function, *args, **kwargs):
+        """Return the result of `function`, sharing it with concurrent callers.
+
+        :param key: The key identifying identical calls.
+        :param function: The function to call when no identical call is
+            outstanding. Additional arguments are passed to it.
+
+        """
+        with self.lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function(*args, **kwargs)
+        except Exception as error:  # pylint: disable=W0703
+            call.error = error
+            raise
+        finally:
+            with self.lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """Return a dictionary of the call counters."""
+        with self.lock:
+            return {'calls': self.calls,
+                    'coalesced': self.coalesced,
+                    'in_flight': len(self._calls)}
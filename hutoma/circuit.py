@@ -0,0 +1,167 @@
+"""Circuit breakers failing requests fast while an endpoint is down.
+
+A breaker is closed while its endpoint is healthy. It opens when too many of
+the recent calls failed or were slow, and then fails calls immediately with
+:class:`.CircuitOpen` rather than waiting on the rate limiter and on the
+request timeout. After `reset_timeout` seconds it is half-open: a few probe
+calls are let through, and the breaker closes again if they all succeed or
+reopens if one fails.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+from collections import deque
+from hutoma.errors import CircuitOpen
+from threading import Lock
+from timeit import default_timer as timer
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitBreaker(object):
+    """A circuit breaker over the last `window` calls to an endpoint.
+
+    :param name: The name of the endpoint, used in errors.
+    :param failure_rate: The fraction of failed or slow calls, among the last
+        `window` calls, at which the breaker opens.
+    :param slow_call_duration: The seconds after which a call counts as
+        slow, or 0 to ignore durations.
+    :param min_calls: The number of calls needed before the breaker may open.
+    :param window: The number of recent calls considered.
+    :param reset_timeout: The seconds the breaker stays open.
+    :param probes: The number of calls let through while half-open.
+
+    """
+
+    def __init__(self, name, failure_rate=0.5, slow_call_duration=0,
+                 min_calls=10, window=20, reset_timeout=30.0, probes=1):
+        """Construct a closed CircuitBreaker."""
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_duration = slow_call_duration
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.probes = max(1, probes)
+        self.lock = Lock()
+        self.calls = deque(maxlen=window)  # True for the calls that failed
+        self.state = CLOSED
+        self.opened_at = None
+        self.probing = self.probed = 0
+        self.opened = self.rejected = 0
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.opened += 1
+        self.calls.clear()
+
+    def check(self):
+        """Raise :class:`.CircuitOpen` if the breaker is open.
+
+        No probe is claimed, so callers may check before waiting to make a
+        call, and :meth:`acquire` once the call is made.
+
+        """
+        with self.lock:
+            if self.state == OPEN:
+                retry_in = self.opened_at + self.reset_timeout - timer()
+                if retry_in > 0:
+                    self.rejected += 1
+                    raise CircuitOpen(self.name, retry_in)
+
+    def acquire(self):
+        """Return True if the call is a probe, or raise :class:`.CircuitOpen`.
+
+        The value returned must be passed to :meth:`record`, or to
+        :meth:`cancel` if the call is interrupted before its outcome is known.
+
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return False
+            now = timer()
+            if self.state == OPEN:
+                retry_in = self.opened_at + self.reset_timeout - now
+                if retry_in > 0:
+                    self.rejected += 1
+                    raise CircuitOpen(self.name, retry_in)
+                self.state = HALF_OPEN
+                self.probing = self.probed = 0
+            if self.probing + self.probed >= self.probes:
+                self.rejected += 1
+                raise CircuitOpen(self.name, 0)
+            self.probing += 1
+            return True
+
+    def record(self, success, duration, probe=False):
+        """Record the outcome of a call let through by :meth:`acquire`."""
+        failed = not success or (self.slow_call_duration and
+                                 duration > self.slow_call_duration)
+        with self.lock:
+            if probe:
+                if self.state != HALF_OPEN:
+                    return
+                self.probing -= 1
+                if failed:
+                    self._open(timer())
+                else:
+                    self.probed += 1
+                    if self.probed >= self.probes:
+                        self.state = CLOSED
+            elif self.state == CLOSED:
+                # Calls started before the breaker opened are ignored
+                self.calls.append(failed)
+                if len(self.calls) >= self.min_calls and \
+                        sum(self.calls) >= self.failure_rate * len(self.calls):
+                    self._open(timer())
+
+    def cancel(self, probe):
+        """Release a call let through by :meth:`acquire` without an outcome."""
+        with self.lock:
+            if probe and self.state == HALF_OPEN:
+                self.probing -= 1
+
+    def snapshot(self):
+        """Return a dictionary describing the state of the breaker."""
+        with self.lock:
+            calls = len(self.calls)
+            return {'state': self.state,
+                    'calls': calls,
+                    'failure_rate': (float(sum(self.calls)) / calls
+                                     if calls else 0.0),
+                    'opened': self.opened,
+                    'rejected': self.rejected}
+
+
+class CircuitBreakers(object):
+    """The circuit breakers of a client, one per route of API_PATHS.
+
+    The keyword arguments are those of :class:`CircuitBreaker`. If
+    `failure_rate` is 0 no breakers are used.
+
+    """
+
+    def __init__(self, **settings):
+        """Construct a CircuitBreakers without breakers."""
+        self.settings = settings
+        self.enabled = bool(settings.get('failure_rate'))
+        self.lock = Lock()
+        self.breakers = {}  # route -> CircuitBreaker
+
+    def get(self, route):
+        """Return the breaker of `route`, or None if breakers are disabled."""
+        if not self.enabled:
+            return None
+        with self.lock:
+            breaker = self.breakers.get(route)
+            if breaker is None:
+                breaker = self.breakers[route] = CircuitBreaker(
+                    route, **self.settings)
+            return breaker
+
+    def snapshot(self):
+        """Return a dictionary of route -> breaker state."""
+        with self.lock:
+            breakers = list(self.breakers.items())
+        return dict((route, breaker.snapshot()) for route, breaker in breakers)
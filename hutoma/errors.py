@@ -9,7 +9,6 @@ specific exceptions.
 
 from __future__ import print_function, unicode_literals
 
-import inspect
 import six
 import sys
 
@@ -70,6 +69,48 @@ class ValidAIRequired(ClientException):
         super(ValidAIRequired, self).__init__(message)
 
 
+class TrainingDataMismatch(ClientException):
+    """Indicates that the source and target training files are not aligned."""
+
+    def __init__(self, line, message=None):
+        """Construct a TrainingDataMismatch exception.
+
+        :param line: The number of the first line that is not aligned.
+        :param message: A custom message to associate with the exception.
+
+        """
+        if not message:
+            message = ('Source and target training files are not aligned at '
+                       'line {0}').format(line)
+        super(TrainingDataMismatch, self).__init__(message)
+        self.line = line
+
+
+class TrainingPairsRemoved(ClientException):
+    """Indicates that pairs were removed since the last training upload.
+
+    The API cannot remove pairs from an AI, so the training files must be
+    uploaded again in full, e.g. to an AI retrained from scratch.
+
+    """
+
+    def __init__(self, added, removed, message=None):
+        """Construct a TrainingPairsRemoved exception.
+
+        :param added: The number of pairs added since the last upload.
+        :param removed: The number of pairs removed since the last upload.
+        :param message: A custom message to associate with the exception.
+
+        """
+        if not message:
+            message = ('{0} training pairs were removed since the last upload '
+                       'and cannot be removed from the AI; upload all the '
+                       'pairs again without a manifest').format(removed)
+        super(TrainingPairsRemoved, self).__init__(message)
+        self.added = added
+        self.removed = removed
+
+
 class HTTPException(HutomaException):
     """Base class for HTTP related exceptions."""
 
@@ -123,6 +164,36 @@ class RedirectException(HutomaException):
         return self.message
 
 
+class CircuitOpen(HutomaException):
+    """Raised instead of making a request while its endpoint is failing.
+
+    Contains a `retry_in` attribute for the number of seconds until requests
+    to the endpoint are attempted again.
+
+    """
+
+    def __init__(self, route, retry_in, message=None):
+        """Construct a CircuitOpen exception.
+
+        :param route: The API_PATHS key of the failing endpoint.
+        :param retry_in: The seconds until the circuit breaker lets a probe
+            request through.
+        :param message: A custom message to associate with the exception.
+
+        """
+        if not message:
+            message = ('Requests to `{0}` are failing; not retrying for '
+                       '{1:.1f} seconds').format(route, retry_in)
+        super(CircuitOpen, self).__init__()
+        self.route = route
+        self.retry_in = retry_in
+        self.message = message
+
+    def __str__(self):
+        """Return the message of the error."""
+        return self.message
+
+
 class APIException(HutomaException):
     """Base exception class for a Hutoma API error message exception.
 
@@ -211,11 +282,9 @@ class RateLimitExceeded(APIException):
 
 
 def _build_error_mapping():
-    def predicate(obj):
-        return inspect.isclass(obj) and hasattr(obj, 'ERROR_TYPE')
-
     tmp = {}
-    for _, obj in inspect.getmembers(sys.modules[__name__], predicate):
-        tmp[obj.ERROR_TYPE] = obj
+    for obj in list(vars(sys.modules[__name__]).values()):
+        if isinstance(obj, type) and hasattr(obj, 'ERROR_TYPE'):
+            tmp[obj.ERROR_TYPE] = obj
     return tmp
 ERROR_MAPPING = _build_error_mapping()
@@ -0,0 +1,255 @@
+"""Score the answers of an AI against training material.
+
+Every question of a source file, like those in ``training_material/``, is
+asked to the AI and its answer is compared with the line of the target file.
+Questions are asked concurrently through a :class:`.ChatBatch`, while the
+calling thread scores the answers as they arrive. Scoring may instead be
+spread over a pool of processes, which only pays off when comparing the
+answers costs more than asking the questions. A JSON line per question is appended to a results file as soon as
+it is scored, so that an interrupted evaluation resumes where it left off
+when it is run again with the same results file.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import io
+import json
+import os
+import re
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from hutoma.training import iter_training_pairs
+
+SCORES = ('exact', 'token_overlap', 'edit_similarity')
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    """Return `text` in lower case with its whitespace collapsed."""
+    return ' '.join(text.lower().split())
+
+
+def token_overlap(answer, expected):
+    """Return the F1 score of the words of `answer` and `expected`."""
+    answer = Counter(TOKEN_RE.findall(answer.lower()))
+    expected = Counter(TOKEN_RE.findall(expected.lower()))
+    if not answer or not expected:
+        return float(answer == expected)
+    common = sum((answer & expected).values())
+    if not common:
+        return 0.0
+    precision = float(common) / sum(answer.values())
+    recall = float(common) / sum(expected.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def edit_similarity(answer, expected):
+    """Return 1 minus the edit distance relative to the longest text.
+
+    The distance is the Levenshtein distance between the words of the
+    texts, which is much cheaper than between their characters. Identical
+    texts score 1.0 and texts sharing no word in place 0.0.
+
+    """
+    answer = TOKEN_RE.findall(answer.lower())
+    expected = TOKEN_RE.findall(expected.lower())
+    if answer == expected:
+        return 1.0
+    if len(answer) < len(expected):
+        answer, expected = expected, answer
+    previous = list(range(len(expected) + 1))
+    for row, word in enumerate(answer, 1):
+        current = [row]
+        for column, other in enumerate(expected, 1):
+            current.append(min(previous[column] + 1, current[column - 1] + 1,
+                               previous[column - 1] + (word != other)))
+        previous = current
+    return 1.0 - float(previous[-1]) / len(answer)
+
+
+def score(answer, expected):
+    """Return a dictionary of score name -> score of `answer`."""
+    return {'exact': float(normalize(answer) == normalize(expected)),
+            'token_overlap': token_overlap(answer, expected),
+            'edit_similarity': edit_similarity(answer, expected)}
+
+
+def score_records(records):
+    """Add the scores to a list of result records and return it.
+
+    When scoring processes are used this is the function they run; a list of
+    records is scored per call to amortize the cost of sending them to a
+    process.
+
+    """
+    for record in records:
+        record.update(score(record['answer'], record['expected']))
+    return records
+
+
+def chat_answer(response):
+    """Return the answer text of a chat response, or '' if it has none."""
+    result = response.get('result') if isinstance(response, dict) else None
+    answer = result.get('answer') if isinstance(result, dict) else None
+    return answer or ''
+
+
+class Evaluation(object):
+    """Ask an AI every question of a source file and score its answers.
+
+    Each line of the results file is a JSON object with the `line` number,
+    `question`, `expected` answer and `answer` of a question together with
+    its scores, see :func:`score`, or with an `error` when the question could
+    not be asked. When the file exists, the questions it holds a scored
+    result for are not asked again; failed questions are.
+
+    :param session: The :class:`.BaseHutoma` client to chat with.
+    :param aiid: The id of the AI to evaluate.
+    :param source_path: The path of the file of questions, one per line.
+    :param target_path: The path of the file of expected answers.
+    :param results_path: The path of the JSON lines file of results.
+    :param concurrency: The maximum number of questions asked at once.
+    :param processes: The number of scoring processes, or 0 to score in the
+        calling thread while the batch's threads ask the questions.
+    :param chunk_size: The number of answers sent to a process at once.
+
+    When scoring processes are used on platforms that spawn them, such as
+    Windows, the evaluation must be run from a ``if __name__ == '__main__'``
+    block.
+
+    """
+
+    def __init__(self, session, aiid, source_path, target_path, results_path,
+                 concurrency=4, processes=0, chunk_size=32):
+        """Construct an Evaluation. No question is asked until it is run."""
+        self.session = session
+        self.aiid = aiid
+        self.source_path = source_path
+        self.target_path = target_path
+        self.results_path = results_path
+        self.concurrency = max(1, concurrency)
+        self.processes = processes
+        self.chunk_size = max(1, chunk_size)
+        self.questions = self.skipped = self.scored = self.errors = 0
+        self.totals = dict.fromkeys(SCORES, 0.0)
+
+    def _count(self, record):
+        if 'error' in record:
+            self.errors += 1
+            return
+        self.scored += 1
+        for name in SCORES:
+            self.totals[name] += record[name]
+
+    def _load_results(self):
+        """Return the scored records of a previous run, by line number.
+
+        A line left incomplete by an interrupted run is cut off the file.
+
+        """
+        if not os.path.exists(self.results_path):
+            return {}
+        results = {}
+        with io.open(self.results_path, 'rb+') as results_file:
+            end = 0
+            for line in results_file:
+                if not line.endswith(b'\n'):
+                    break
+                end += len(line)
+                record = json.loads(line.decode('utf-8'))
+                if 'error' not in record:
+                    results[record['line']] = record
+            results_file.truncate(end)
+        return results
+
+    def _pending(self, done, expected):
+        """Yield the questions to ask, keeping their expected answers."""
+        position = 0
+        for number, (question, answer) in enumerate(
+                iter_training_pairs(self.source_path, self.target_path), 1):
+            if not question.strip():
+                continue
+            self.questions += 1
+            record = done.get(number)
+            if record is not None and record['question'] == question:
+                self.skipped += 1
+                self._count(record)
+                continue
+            expected[position] = (number, answer)
+            position += 1
+            yield question
+
+    def run(self):
+        """Ask the questions without a scored result and score the answers.
+
+        :returns: The summary of the whole evaluation, see :meth:`summary`.
+
+        """
+        done = self._load_results()
+        expected = {}  # position in the batch -> (line, expected answer)
+        batch = self.session.chat_many(
+            self.aiid, self._pending(done, expected), self.concurrency,
+            ordered=False)
+        processes = self.processes
+        executor = ProcessPoolExecutor(processes) if processes > 0 else None
+        scoring = set()
+        chunk = []
+        with io.open(self.results_path, 'ab') as results_file:
+            def write(records):
+                for record in records:
+                    self._count(record)
+                    results_file.write(json.dumps(record).encode('utf-8') +
+                                       b'\n')
+                results_file.flush()
+
+            def submit(records):
+                if executor is None:
+                    write(score_records(records))
+                    return
+                scoring.add(executor.submit(score_records, records))
+                # Bound the answers held in memory while processes catch up
+                while len(scoring) > 2 * processes:
+                    finished = wait(scoring, return_when=FIRST_COMPLETED)[0]
+                    for future in finished:
+                        scoring.remove(future)
+                        write(future.result())
+
+            try:
+                for result in batch:
+                    number, answer = expected.pop(result.index)
+                    record = {'line': number, 'question': result.question,
+                              'expected': answer}
+                    if result.error is not None:
+                        record['error'] = '{0}: {1}'.format(
+                            type(result.error).__name__, result.error)
+                        write([record])
+                        continue
+                    record['answer'] = chat_answer(result.answer)
+                    chunk.append(record)
+                    if len(chunk) >= self.chunk_size:
+                        submit(chunk)
+                        chunk = []
+                if chunk:
+                    submit(chunk)
+                for future in list(scoring):
+                    write(future.result())
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+        return self.summary()
+
+    def summary(self):
+        """Return a dictionary summarizing the evaluation.
+
+        It holds the number of `questions`, of those `skipped` because a
+        previous run scored them, of `scored` answers and of `errors`, and
+        the mean of every score over the scored answers.
+
+        """
+        retval = {'questions': self.questions, 'skipped': self.skipped,
+                  'scored': self.scored, 'errors': self.errors}
+        for name in SCORES:
+            retval[name] = (self.totals[name] / self.scored
+                            if self.scored else 0.0)
+        return retval
@@ -1,57 +1,102 @@
 from __future__ import print_function, unicode_literals
 
-import socket
-import sys
 import time
 from functools import wraps
-from .errors import ClientException
+from .cache import (ResponseCache, SingleFlight, add_conditions,
+                    deserialize_entry, deserialize_response, has_validators,
+                    refresh_response, serialize_response)
 from .helpers import normalize_url
-from requests import Session
-from six import text_type
-from six.moves import cPickle  # pylint: disable=F0401
-from threading import Lock
+from .pool import shared_pool
+from .ratelimit import limiter_for
+from six import create_bound_method, text_type
+from threading import Lock, Thread
 from timeit import default_timer as timer
 
 
+class _hybridmethod(object):
+    """A method bound to the instance it is looked up on, or else its class.
+
+    The cache methods of the handlers act on the cache of the instance, which
+    may have one of its own, and still act on the cache shared by the
+    instances when called on the class, e.g. ``DefaultHandler.clear_cache()``,
+    as they did when they were classmethods.
+
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.__doc__ = function.__doc__
+
+    def __get__(self, instance, owner):
+        return create_bound_method(self.function,
+                                   owner if instance is None else instance)
+
+
+def _is_failure(response):
+    """Return True if `response` shows that the server is struggling."""
+    return response.status_code >= 500 or response.status_code == 429
+
+
 class RateLimitHandler(object):
     """The base handler that provides thread-safe rate limiting enforcement.
 
-    While this handler is threadsafe, the Client is not thread safe when the same
-    `Hutoma` instance is being utilized from multiple threads.
+    The handler, like the `Hutoma` instances using it, may be used from
+    multiple threads at once.
 
     """
 
-    last_call = {}  # Stores a two-item list: [lock, previous_call_time]
-    rl_lock = Lock()  # lock used for adding items to last_call
+    # Return the limiter for a domain; replace to plug in another limiter
+    limiter_for = staticmethod(limiter_for)
 
     @staticmethod
     def rate_limit(function):
         """Return a decorator that enforces API request limit guidelines.
 
         We are allowed to make a API request every api_request_delay seconds as
-        specified in praw.ini. This value may differ from reddit to reddit. For
-        reddit.com it is 2. Any function decorated with this will be forced to
-        delay _rate_delay seconds from the calling of the last function
-        decorated with this before executing.
+        specified in hutoma.ini, with bursts of up to api_request_burst
+        requests. Any function decorated with this reserves a slot from the
+        domain's limiter and sleeps until that slot is due before executing.
+        No lock is held while sleeping or executing, so requests to the same
+        domain may be in flight concurrently within the limit.
+
+        When a :class:`.CircuitBreaker` is given as `_circuit`, it is checked
+        before reserving a slot, so that requests to a failing endpoint fail
+        fast instead of waiting. A half-open breaker's probe is claimed when
+        the request is sent, and the outcome of the request is recorded.
 
         This decorator must be applied to a RateLimitHandler class method or
-        instance method as it assumes `rl_lock` and `last_call` are available.
+        instance method as it assumes `limiter_for` is available.
 
         """
         @wraps(function)
-        def wrapped(cls, _rate_domain, _rate_delay, **kwargs):
-            cls.rl_lock.acquire()
-            lock_last = cls.last_call.setdefault(_rate_domain, [Lock(), 0])
-            with lock_last[0]:  # Obtain the domain specific lock
-                cls.rl_lock.release()
-                # Sleep if necessary, then perform the request
-                now = timer()
-                delay = lock_last[1] + _rate_delay - now
-                if delay > 0:
-                    now += delay
-                    time.sleep(delay)
-                lock_last[1] = now
+        def wrapped(cls, _rate_domain, _rate_delay, _rate_burst=1,
+                    _rate_limiter='token_bucket', _circuit=None, **kwargs):
+            if _circuit is not None:
+                _circuit.check()
+            limiter = cls.limiter_for(_rate_domain, _rate_delay, _rate_burst,
+                                      _rate_limiter)
+            delay = limiter.reserve()
+            if delay > 0:
+                time.sleep(delay)
+            timings = kwargs.get('_timings')
+            if timings is not None:
+                timings['rate_limit_wait'] = max(delay, 0)
+            if _circuit is None:
                 return function(cls, **kwargs)
+            # The probe is only claimed once the call is made
+            probe = _circuit.acquire()
+            started = timer()
+            try:
+                response = function(cls, **kwargs)
+            except Exception:
+                _circuit.record(False, timer() - started, probe)
+                raise
+            except BaseException:
+                _circuit.cancel(probe)  # Interrupted or cancelled
+                raise
+            _circuit.record(not _is_failure(response), timer() - started,
+                            probe)
+            return response
         return wrapped
 
     @classmethod
@@ -66,19 +111,38 @@ class RateLimitHandler(object):
         """
         return 0
 
-    def __del__(self):
-        """Cleanup the HTTP session."""
-        if self.http:
-            try:
-                self.http.close()
-            except:  # Never fail  pylint: disable=W0702
-                pass
+    @classmethod
+    def evict_tags(cls, tags):  # pylint: disable=W0613
+        """Method utilized to evict entries stored with the given tags.
+
+        :param tags: An iterable of tags.
+        :returns: The number of items removed from the cache.
+
+        """
+        return 0
+
+    @classmethod
+    def evict_prefix(cls, prefix):  # pylint: disable=W0613
+        """Method utilized to evict entries whose url starts with `prefix`.
+
+        :returns: The number of items removed from the cache.
+
+        """
+        return 0
 
-    def __init__(self):
-        """Establish the HTTP session."""
-        self.http = Session()  # Each instance should have its own session
+    def __init__(self, pool=None):
+        """Establish the HTTP session.
+
+        :param pool: The :class:`.ConnectionPool` to send requests with. By
+            default the pool with default settings shared by the process is
+            used.
+
+        """
+        self.pool = pool or shared_pool()
+        self.http = self.pool.http
 
-    def request(self, request, proxies, timeout, verify, **_):
+    def request(self, request, proxies, timeout, verify, _timings=None,
+                stream=False, **_):
         """Responsible for dispatching the request and returning the result.
 
         Network level exceptions should be raised and only
@@ -91,76 +155,166 @@ class RateLimitHandler(object):
         :param timeout: Specifies the maximum time that the actual HTTP request
             can take.
         :param verify: Specifies if SSL certificates should be validated.
+        :param _timings: A dictionary in which the handlers record the
+            duration of the phases of the request, such as `network`.
+        :param stream: If True only the headers are read before returning;
+            the body is read as it is consumed.
 
         ``**_`` should be added to the method call to ignore the extra
         arguments intended for the cache handler.
 
         """
-        return self.http.send(request, proxies=proxies, timeout=timeout,
-                              allow_redirects=False, verify=verify)
+        started = timer()
+        response = self.send(request, proxies=proxies, timeout=timeout,
+                             allow_redirects=False, verify=verify,
+                             stream=stream)
+        if _timings is not None:
+            _timings['network'] = timer() - started
+        return response
+
+    def send(self, request, **kwargs):
+        """Send a ``requests.PreparedRequest`` and return its response.
+
+        The keyword arguments are those of ``requests.Session.send``. Override
+        this method to plug in another transport, such as
+        :class:`.ReplayHandler` does.
+
+        """
+        return self.pool.send(request, **kwargs)
 RateLimitHandler.request = RateLimitHandler.rate_limit(RateLimitHandler.request)
 
 
 class DefaultHandler(RateLimitHandler):
-    """Extends the RateLimitHandler to add thread-safe caching support."""
+    """Extends the RateLimitHandler to add thread-safe caching support.
+
+    Unless another cache backend is given, the in-memory cache shared by all
+    instances of the handler is used. Each instance coalesces its own
+    concurrent requests and background revalidations, so handlers never wait
+    on, or are served, the requests of another handler.
+
+    """
 
-    ca_lock = Lock()
-    cache = {}
+    cache = ResponseCache()
     cache_hit_callback = None
-    timeouts = {}
 
     @staticmethod
     def with_cache(function):
         """Return a decorator that interacts with a handler's cache.
 
+        Responses are fresh for `_cache_timeout` seconds. Those that can be
+        revalidated, or all of them when `_cache_swr` is True, are then kept
+        stale for up to `_cache_stale` more seconds. A stale response with an
+        ETag or Last-Modified header is revalidated with a conditional GET,
+        and a 304 response refreshes the cached response instead of
+        downloading it again. When `_cache_swr` is True, stale responses are
+        returned immediately and revalidated in the background.
+
         This decorator must be applied to a DefaultHandler class method or
-        instance method as it assumes `cache`, `ca_lock` and `timeouts` are
-        available.
+        instance method as it assumes `cache`, `in_flight` and `refreshing`
+        are available.
 
         """
         @wraps(function)
-        def wrapped(cls, _cache_key, _cache_ignore, _cache_timeout, **kwargs):
-            def clear_timeouts():
-                """Clear the cache of timed out results."""
-                for key in list(cls.timeouts):
-                    if timer() - cls.timeouts[key] > _cache_timeout:
-                        del cls.timeouts[key]
-                        del cls.cache[key]
+        def wrapped(cls, _cache_key, _cache_ignore, _cache_timeout,
+                    _cache_stale=0, _cache_swr=False, _cache_tags=(),
+                    **kwargs):
+            def fetch(call_kwargs, cached=None):
+                """Perform the request and cache a successful result."""
+                if cached is not None:
+                    add_conditions(call_kwargs['request'], cached)
+                result = function(cls, **call_kwargs)
+                if cached is not None and result.status_code == 304:
+                    result = refresh_response(cached, result)
+                # The handlers don't call `raise_for_status` so we need to
+                # ignore status codes that will result in an exception that
+                # should not be cached.
+                if result.status_code in (200, 302):
+                    keep = _cache_timeout
+                    if _cache_stale and (_cache_swr or has_validators(result)):
+                        keep += _cache_stale
+                    cls.cache.set(_cache_key, serialize_response(
+                        result, time.time() + _cache_timeout), keep,
+                        _cache_tags)
+                return result
+
+            def refresh(cached):
+                """Revalidate a stale response in the background."""
+                call_kwargs = dict(kwargs, request=kwargs['request'].copy())
+                call_kwargs.pop('_timings', None)
+                try:
+                    fetch(call_kwargs, cached)
+                except Exception:  # pylint: disable=W0703
+                    pass  # The stale response is served until refreshed
+                finally:
+                    with cls.refreshing_lock:
+                        cls.refreshing.discard(_cache_key)
 
             if _cache_ignore:
                 return function(cls, **kwargs)
-            with cls.ca_lock:
-                clear_timeouts()
-                if _cache_key in cls.cache:
+            started = timer()
+            data = cls.cache.get(_cache_key)
+            timings = kwargs.get('_timings')
+            if timings is not None:
+                timings['cache_lookup'] = timer() - started
+            is_get = kwargs['request'].method == 'GET'
+            cached = None
+            if data is not None:
+                cached, fresh_until = deserialize_entry(data,
+                                                        kwargs['request'])
+                if fresh_until is None or time.time() < fresh_until:
                     if cls.cache_hit_callback:
                         cls.cache_hit_callback(_cache_key)
-                    return cls.cache[_cache_key]
-            # Releasing the lock before actually making the request allows for
-            # the possibility of more than one thread making the same request
-            # to get through. Without having domain-specific caching (under the
-            # assumption only one request to a domain can be made at a
-            # time), there isn't a better way to handle this.
-            result = function(cls, **kwargs)
-            # The handlers don't call `raise_for_status` so we need to ignore
-            # status codes that will result in an exception that should not be
-            # cached.
-            if result.status_code not in (200, 302):
-                return result
-            with cls.ca_lock:
-                cls.timeouts[_cache_key] = timer()
-                cls.cache[_cache_key] = result
-                return result
+                    return cached
+                if not is_get:
+                    cached = None
+                elif _cache_swr:
+                    with cls.refreshing_lock:
+                        start = _cache_key not in cls.refreshing
+                        cls.refreshing.add(_cache_key)
+                    if start:
+                        thread = Thread(target=refresh, args=(
+                            deserialize_response(data),))
+                        thread.daemon = True
+                        thread.start()
+                    return cached
+                elif not has_validators(cached):
+                    cached = None
+            if not is_get:
+                return fetch(kwargs)
+            # Concurrent identical GETs wait for the first one to complete
+            # rather than all being sent.
+            return cls.in_flight.do(_cache_key, fetch, kwargs, cached)
         return wrapped
 
-    @classmethod
-    def clear_cache(cls):
+    def __init__(self, max_entries=None, max_bytes=None, cache=None,
+                 pool=None):
+        """Establish the HTTP session and apply the cache bounds.
+
+        :param max_entries: The maximum number of responses to cache, or 0 for
+            no limit. When the cache is shared, this applies to all instances.
+        :param max_bytes: The maximum size of the cached response bodies, or 0
+            for no limit. When the cache is shared, this applies to all
+            instances.
+        :param cache: A :class:`.CacheBackend` to use instead of the shared
+            in-memory cache.
+        :param pool: The :class:`.ConnectionPool` to send requests with.
+
+        """
+        super(DefaultHandler, self).__init__(pool)
+        self.in_flight = SingleFlight()
+        self.refreshing = set()  # The keys being revalidated in the background
+        self.refreshing_lock = Lock()
+        if cache is not None:
+            self.cache = cache
+        self.cache.resize(max_entries, max_bytes)
+
+    @_hybridmethod
+    def clear_cache(self):
         """Remove all items from the cache."""
-        with cls.ca_lock:
-            cls.cache = {}
-            cls.timeouts = {}
+        self.cache.clear()
 
-    @classmethod
-    def evict(cls, urls):
+    @_hybridmethod
+    def evict(self, urls):
         """Remove items from cache matching URLs.
 
         Return the number of items removed.
@@ -168,13 +322,23 @@ class DefaultHandler(RateLimitHandler):
         """
         if isinstance(urls, text_type):
             urls = [urls]
-        urls = set(normalize_url(url) for url in urls)
-        retval = 0
-        with cls.ca_lock:
-            for key in list(cls.cache):
-                if key[0] in urls:
-                    retval += 1
-                    del cls.cache[key]
-                    del cls.timeouts[key]
-        return retval
+        return self.cache.evict_urls(set(normalize_url(url) for url in urls))
+
+    @_hybridmethod
+    def evict_tags(self, tags):
+        """Remove items from cache stored with any of the tags.
+
+        Return the number of items removed.
+
+        """
+        return self.cache.evict_tags(set(tags))
+
+    @_hybridmethod
+    def evict_prefix(self, prefix):
+        """Remove items from cache whose url starts with `prefix`.
+
+        Return the number of items removed.
+
+        """
+        return self.cache.evict_prefix(normalize_url(prefix))
 DefaultHandler.request = DefaultHandler.with_cache(RateLimitHandler.request)
@@ -0,0 +1,150 @@
+"""Fetch the details of many AIs at once.
+
+The `ai_list` route only lists a summary of each AI; its details come from
+the `ai` route, one request per AI. :func:`hydrate` makes those requests
+concurrently, with a bounded number in flight, and adds the details to the
+AI objects. The responses go through the client's cache as usual, so AIs
+hydrated once are served from the cache the next time.
+
+An :class:`AIPrefetch` groups the AIs of a list so that the first lazy
+access to a detail of one of them hydrates them all, rather than each AI
+fetching its own details in turn.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+from concurrent.futures import ThreadPoolExecutor
+from hutoma.objects import CompactObject
+from threading import Event, Lock
+
+
+def fetch_ai(session, aiid):
+    """Return the JSON dict of the details of the AI `aiid`."""
+    url = session.config['ai'].format(aiid=aiid)
+    response = session.request_json(url, as_objects=False)
+    if isinstance(response, dict) and isinstance(response.get('ai'), dict):
+        return response['ai']
+    return response
+
+
+def _update(ai, json_dict):
+    """Add the details in `json_dict` to the AI object `ai`."""
+    # pylint: disable=W0212
+    if isinstance(ai, CompactObject):
+        ai.json_dict.update(json_dict)
+        ai._converted = None
+        return
+    ai._populate(json_dict, True)
+    ai._has_fetched = True
+
+
+def hydrate(session, ais, concurrency=8):
+    """Fetch the details of `ais` concurrently and add them to the objects.
+
+    An error fetching an AI does not stop the others from being fetched.
+
+    :param session: The :class:`.BaseHutoma` client to fetch with.
+    :param ais: A list of :class:`.AI` or :class:`.CompactAI` objects.
+    :param concurrency: The maximum number of requests in flight at once.
+    :returns: A list of the exception raised fetching each AI, or None for
+        the AIs that were fetched, in the order of `ais`.
+
+    """
+    def fetch(ai):
+        try:
+            _update(ai, fetch_ai(session, ai.aiid))
+        except Exception as error:  # pylint: disable=W0703
+            return error
+        return None
+
+    if concurrency <= 1 or len(ais) <= 1:
+        return [fetch(ai) for ai in ais]
+    with ThreadPoolExecutor(min(concurrency, len(ais))) as executor:
+        return list(executor.map(fetch, ais))
+
+
+class _Claim(object):
+    """The AIs of a group claimed by the thread fetching them."""
+
+    def __init__(self):
+        self.done = Event()
+        self.errors = {}  # id of an AI -> exception raised fetching it
+
+
+class AIPrefetch(object):
+    """The AIs of a list, whose details are fetched together.
+
+    :class:`.AI` objects added to the group fetch their details through it:
+    the first one to need them hydrates all the AIs of the group that are
+    not hydrated yet, `concurrency` at a time. AIs that failed to be fetched
+    are fetched again when next needed.
+
+    The lock of the group is only held to claim the AIs to fetch, never
+    while fetching them: threads needing an AI claimed by another thread
+    wait for that thread, and others go on claiming the rest of the group.
+
+    :param session: The :class:`.BaseHutoma` client to fetch with.
+    :param concurrency: The maximum number of requests in flight at once.
+
+    """
+
+    def __init__(self, session, concurrency=8):
+        """Construct an empty AIPrefetch."""
+        self.session = session
+        self.concurrency = concurrency
+        self.lock = Lock()
+        self.pending = []
+        self.claims = {}  # id of an AI being fetched -> _Claim
+
+    def add(self, ai):
+        """Add an :class:`.AI` to the group."""
+        # pylint: disable=W0212
+        object.__setattr__(ai, '_prefetch', self)
+        with self.lock:
+            self.pending.append(ai)
+
+    def fetch(self, ai):
+        """Hydrate `ai` together with the other pending AIs of the group.
+
+        Raise the exception raised fetching `ai`, if any.
+
+        """
+        # pylint: disable=W0212
+        while not ai._has_fetched:
+            with self.lock:
+                claim = self.claims.get(id(ai))
+                if claim is None:
+                    claim = _Claim()
+                    claimed = [ai] + [other for other in self.pending
+                                      if not other._has_fetched and
+                                      other is not ai and
+                                      id(other) not in self.claims]
+                    for other in claimed:
+                        self.claims[id(other)] = claim
+                    self.pending = [other for other in self.pending
+                                    if id(other) not in self.claims]
+                else:
+                    claimed = None
+            if claimed is None:
+                claim.done.wait()
+            else:
+                self._hydrate(claimed, claim)
+            error = claim.errors.get(id(ai))
+            if error is not None:
+                raise error
+
+    def _hydrate(self, claimed, claim):
+        """Fetch the `claimed` AIs and release them."""
+        errors = [None] * len(claimed)
+        try:
+            errors = hydrate(self.session, claimed, self.concurrency)
+        finally:
+            with self.lock:
+                for other, error in zip(claimed, errors):
+                    del self.claims[id(other)]
+                    if error is not None:
+                        claim.errors[id(other)] = error
+                    if not other._has_fetched:  # pylint: disable=W0212
+                        self.pending.append(other)
+            claim.done.set()
@@ -1,4 +1,5 @@
 from __future__ import print_function, unicode_literals
+import json
 import re
 import six
 import sys
@@ -6,6 +7,73 @@ from requests import Request, codes, exceptions
 from requests.compat import urljoin
 from .errors import (HTTPException, Forbidden, NotFound)
 
+ENTITY_RE = re.compile('&([^;&]+);')
+
+
+def _decode_entities(text):
+    """Return text with its named HTML entities replaced.
+
+    Unknown entities are left as they are.
+
+    """
+    if '&' not in text:
+        return text
+    from six.moves import html_entities  # pylint: disable=F0401
+
+    def decode(match):
+        codepoint = html_entities.name2codepoint.get(match.group(1))
+        return match.group(0) if codepoint is None else six.unichr(codepoint)
+    return ENTITY_RE.sub(decode, text)
+
+
+def _unescape(value):
+    """Return a JSON value with the HTML entities of its strings replaced.
+
+    Objects are left as they are; they are unescaped by the hook returned
+    by :func:`_unescape_hook` as they are parsed.
+
+    """
+    if isinstance(value, six.string_types):
+        return _decode_entities(value)
+    elif isinstance(value, list):
+        return [_unescape(item) for item in value]
+    return value
+
+
+def _unescape_hook(object_hook=None):
+    """Return an object hook replacing HTML entities before `object_hook`."""
+    def unescape_hook(obj):
+        for key, value in obj.items():
+            if isinstance(value, (six.string_types, list)):
+                obj[key] = _unescape(value)
+        return object_hook(obj) if object_hook else obj
+    return unescape_hook
+
+
+def _decode_json(response, object_hook=None):
+    """Return the JSON processed from the body of a response.
+
+    The body is parsed straight from its bytes. Responses that are not
+    declared as JSON may contain HTML entities, which are then replaced in
+    the string values only, before `object_hook` sees them. An empty body
+    is returned as ''.
+
+    """
+    body = response.content
+    if not body:
+        # Some of the v1 urls don't return anything, even when they're
+        # successful.
+        return ''
+    if response.encoding and response.encoding.lower() not in ('utf-8',
+                                                              'utf8'):
+        body = body.decode(response.encoding)
+    elif six.PY3 and sys.version_info < (3, 6):
+        body = body.decode('utf-8')  # json only accepts bytes since 3.6
+    content_type = response.headers.get('content-type', '')
+    if 'json' in content_type:
+        return json.loads(body, object_hook=object_hook)
+    return _unescape(json.loads(body, object_hook=_unescape_hook(object_hook)))
+
 
 def _prepare_request(session, url, params, data, auth, files, method=None):
     """Return a requests Request object that can be "prepared"."""
@@ -40,10 +108,12 @@ def _prepare_request(session, url, params, data, auth, files, method=None):
 
     if isinstance(data, dict):
         if not auth:
+            data = dict(data)  # The caller's dict may be shared by threads
             data.setdefault('api_type', 'json')
-            if session.modhash:
-                data.setdefault('uh', session.modhash)
-    else:
+            modhash = session.modhash
+            if modhash:
+                data.setdefault('uh', modhash)
+    elif not files:  # Uploads are multipart encoded by requests
         request.headers.setdefault('Content-Type', 'application/json')
 
     request.data = data
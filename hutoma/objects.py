@@ -9,7 +9,7 @@ from warnings import warn_explicit
 
 from .errors import ClientException
 
-HUTOMA_KEYS = ('AIID')
+HUTOMA_KEYS = ('AIID',)
 
 class HutomaObject(object):
 
@@ -27,8 +27,8 @@ class HutomaObject(object):
         json_dict).
 
         """
-        self._info_url = info_url or hutoma_session.config['info']
-        self.hutoma_session = hutoma_session
+        self._info_url = info_url
+        self.hutoma_session = self.session = hutoma_session
         self._underscore_names = underscore_names
         self._uniq = uniq
         self._has_fetched = self._populate(json_dict, fetch)
@@ -40,7 +40,7 @@ class HutomaObject(object):
 
     def __getattr__(self, attr):
         """Return the value of the `attr` attribute."""
-        if attr != '__setstate__' and not self._has_fetched:
+        if not attr.startswith('__') and not self._has_fetched:
             self._has_fetched = self._populate(None, True)
             return getattr(self, attr)
         msg = '\'{0}\' has no attribute \'{1}\''.format(type(self), attr)
@@ -86,8 +86,6 @@ class HutomaObject(object):
     
     def _get_json_dict(self):
         # (disabled for entire function) pylint: disable=W0212
-        scope = self.session.has_scope
-
         params = {'uniq': self._uniq} if self._uniq else {}
         response = self.session.request_json(
             self._info_url, params=params, as_objects=False)
@@ -136,13 +134,15 @@ class Editable(HutomaObject):
     def delete(self):
         """Delete this object.
 
+        The responses made stale by the deletion are evicted from the cache,
+        see :meth:`.evict_ai`.
+
         :returns: The json response from the server.
 
         """
-        url = self.session.config['del']
-        data = {'id': self.fullname}
-        response = self.session.request_json(url, data=data)
-        self.session.evict(self.session.config['user'])
+        url = self.session.config['ai'].format(aiid=self.aiid)
+        response = self.session.request_json(url, method='DELETE')
+        self.session.evict_ai(self.aiid)
         return response
 
     def edit(self, text):
@@ -164,11 +164,43 @@ class AIList(HutomaObject):
 
 
 class AI(Editable):
-    """A moderator action."""
+    """An AI.
+
+    An AI made from a summary, such as an item of the AI list, fetches its
+    details on first access to an attribute it lacks. When it was added to
+    an :class:`.AIPrefetch`, the details of the other AIs of the group are
+    fetched at the same time.
+
+    """
 
     def __init__(self, session, json_dict=None, fetch=False):
-        """Construct an instance of the ModAction object."""
+        """Construct an AI from its JSON dict or from its id."""
+        if isinstance(json_dict, six.string_types):
+            json_dict = {'aiid': json_dict}
         super(AI, self).__init__(session, json_dict, fetch)
+        self._has_fetched = fetch
+
+    def __getattr__(self, attr):
+        """Return the value of the `attr` attribute."""
+        prefetch = self.__dict__.get('_prefetch')
+        if prefetch is not None and not attr.startswith('__') and \
+                not self.__dict__.get('_has_fetched', True):
+            prefetch.fetch(self)
+            return getattr(self, attr)
+        return super(AI, self).__getattr__(attr)
+
+    def __getstate__(self):
+        """Needed for `pickle`; the prefetch group is not pickled."""
+        state = dict(self.__dict__)
+        state.pop('_prefetch', None)
+        return state
+
+    def _get_json_dict(self):
+        aiid = self.__dict__.get('aiid')
+        if not aiid:
+            return {}
+        from hutoma.hydration import fetch_ai
+        return fetch_ai(self.session, aiid)
 
 
 class Folder(Editable):
@@ -184,4 +216,102 @@ class Speak(HutomaObject):
 
 
 class Training(HutomaObject):
-    pass
\ No newline at end of file
+    pass
+
+
+class CompactObject(object):
+    """A compact, read-only view over the JSON dict of a Hutoma object.
+
+    Unlike :class:`HutomaObject`, no attribute is copied from the JSON dict:
+    attributes are looked up in the dict when accessed, and values that need
+    converting (such as ids in HUTOMA_KEYS) are converted on first access
+    only. Instances use ``__slots__`` and share the parsed dict, so they cost
+    little more than the dict itself.
+
+    Compact objects are used when `compact_objects` is set in hutoma.ini.
+
+    """
+
+    __slots__ = ('session', 'json_dict', '_converted')
+
+    @classmethod
+    def from_api_response(cls, hutoma_session, json_dict):
+        """Return an instance of the appropriate class from the json_dict."""
+        return cls(hutoma_session, json_dict)
+
+    def __init__(self, hutoma_session, json_dict):
+        """Create a view over the dict of attributes returned by the API."""
+        self.session = hutoma_session
+        self.json_dict = json_dict if json_dict is not None else {}
+        self._converted = None
+
+    def __eq__(self, other):
+        """Return whether the other instance equals the current."""
+        return (type(self) is type(other) and
+                self.json_dict == other.json_dict)
+
+    def __ne__(self, other):
+        """Return whether the other instance differs from the current."""
+        return not self == other
+
+    def __getattr__(self, attr):
+        """Return the value of the `attr` attribute."""
+        if attr in CompactObject.__slots__ or attr.startswith('__'):
+            # Unset slots, e.g. while unpickling
+            msg = '\'{0}\' has no attribute \'{1}\''.format(type(self), attr)
+            raise AttributeError(msg)
+        converted = self._converted
+        if converted is not None and attr in converted:
+            return converted[attr]
+        try:
+            value = self.json_dict[attr]
+        except (KeyError, TypeError):
+            msg = '\'{0}\' has no attribute \'{1}\''.format(type(self), attr)
+            raise AttributeError(msg)
+        if attr in HUTOMA_KEYS and value and not isinstance(value, bool):
+            value = None if value == '[deleted]' else CompactAI(
+                self.session, {'aiid': value})
+            if self._converted is None:
+                self._converted = {}
+            self._converted[attr] = value
+        return value
+
+    def __dir__(self):
+        return sorted(set(dir(type(self))) | set(self.json_dict))
+
+    def __getstate__(self):
+        """Needed for `pickle`; the session is not pickled."""
+        return self.json_dict
+
+    def __setstate__(self, state):
+        self.session = None
+        self.json_dict = state
+        self._converted = None
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(type(self).__name__,
+                                  self.json_dict.get('aiid', ''))
+
+
+class CompactAIList(CompactObject):
+    __slots__ = ()
+
+
+class CompactAI(CompactObject):
+    __slots__ = ()
+
+
+class CompactFolder(CompactObject):
+    __slots__ = ()
+
+
+class CompactChat(CompactObject):
+    __slots__ = ()
+
+
+class CompactSpeak(CompactObject):
+    __slots__ = ()
+
+
+class CompactTraining(CompactObject):
+    __slots__ = ()
\ No newline at end of file
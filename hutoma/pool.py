@@ -0,0 +1,118 @@
+"""HTTP connection pools shared by the handlers of a process."""
+
+from __future__ import print_function, unicode_literals
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from threading import Lock
+from timeit import default_timer as timer
+
+
+class ConnectionPool(object):
+    """A ``requests.Session`` whose connection pools are tuned and counted.
+
+    :param pool_connections: The number of hosts to keep connection pools
+        for.
+    :param pool_maxsize: The maximum number of connections kept open per
+        host.
+    :param pool_block: If True, wait for a free connection when pool_maxsize
+        connections to a host are in use rather than opening extra connections
+        that are discarded after use.
+    :param max_retries: The number of times the adapter retries failed
+        connections. Requests that reached the server are never retried here.
+    :param keep_alive: If False, connections are closed after each request.
+    :param idle_timeout: The seconds after which idle pooled connections are
+        closed, or 0 to keep them open.
+
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False,
+                 max_retries=0, keep_alive=True, idle_timeout=0):
+        """Construct a ConnectionPool. Connections are opened when needed."""
+        self.settings = {'pool_connections': pool_connections,
+                         'pool_maxsize': pool_maxsize,
+                         'pool_block': pool_block,
+                         'max_retries': max_retries,
+                         'keep_alive': keep_alive,
+                         'idle_timeout': idle_timeout}
+        self.keep_alive = keep_alive
+        self.idle_timeout = idle_timeout
+        self.lock = Lock()
+        self.last_used = timer()
+        self.closed_connections = self.closed_requests = 0
+        self.adapter = HTTPAdapter(pool_connections=pool_connections,
+                                   pool_maxsize=pool_maxsize,
+                                   max_retries=max_retries,
+                                   pool_block=pool_block)
+        pools = self.adapter.poolmanager.pools
+        dispose = pools.dispose_func
+
+        def count_and_dispose(pool):
+            """Keep the counters of host pools dropped by the manager."""
+            with self.lock:
+                self.closed_connections += pool.num_connections
+                self.closed_requests += pool.num_requests
+            if dispose is not None:  # urllib3 2 leaves dropped pools open
+                dispose(pool)
+        pools.dispose_func = count_and_dispose
+        self.http = Session()
+        self.http.mount('https://', self.adapter)
+        self.http.mount('http://', self.adapter)
+
+    def send(self, request, **kwargs):
+        """Send a ``requests.PreparedRequest`` using the pooled connections.
+
+        The keyword arguments are those of ``requests.Session.send``.
+
+        """
+        if not self.keep_alive:
+            request.headers['Connection'] = 'close'
+        now = timer()
+        with self.lock:
+            idle = now - self.last_used
+            self.last_used = now
+        if self.idle_timeout and idle > self.idle_timeout:
+            # The server has likely closed them by now
+            self.adapter.poolmanager.clear()
+        return self.http.send(request, **kwargs)
+
+    def close(self):
+        """Close all pooled connections."""
+        self.http.close()
+
+    def stats(self):
+        """Return a dictionary counting the connections opened and reused."""
+        pools = self.adapter.poolmanager.pools
+        with pools.lock:
+            host_pools = list(pools._container.values())  # pylint: disable=W0212
+        with self.lock:
+            opened = self.closed_connections
+            requests = self.closed_requests
+        for pool in host_pools:
+            opened += pool.num_connections
+            requests += pool.num_requests
+        if not self.keep_alive:
+            # Closed connections are reopened without being counted
+            opened = requests
+        return {'hosts': len(host_pools),
+                'connections_opened': opened,
+                'connections_reused': max(0, requests - opened),
+                'requests': requests}
+
+
+_pools = {}  # settings -> ConnectionPool
+_pools_lock = Lock()
+
+
+def shared_pool(**settings):
+    """Return the ConnectionPool shared by the callers using `settings`.
+
+    The settings are the keyword arguments of :class:`ConnectionPool`.
+
+    """
+    key = tuple(sorted(settings.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(**settings)
+        return pool
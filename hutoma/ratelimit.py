@@ -0,0 +1,156 @@
+"""Rate limiters used by the handlers to pace requests to a domain.
+
+A limiter only reserves a slot for a request: :meth:`reserve` returns how
+long the caller must wait before sending it. No lock is held while waiting
+or while the request is in flight, so several requests can be outstanding at
+once within the limiter's quota.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+from threading import Lock
+from timeit import default_timer as timer
+
+
+class TokenBucket(object):
+    """A limiter allowing bursts of requests at a sustained rate.
+
+    The bucket holds up to `burst` tokens and is refilled at `rate` tokens per
+    second. Each request takes a token; when none are left the request is
+    scheduled for when its token will have been refilled.
+
+    """
+
+    def __init__(self, rate, burst=1):
+        """Construct a full TokenBucket.
+
+        :param rate: The sustained number of requests per second, or 0 for no
+            limit.
+        :param burst: The number of requests that may be made at once.
+
+        """
+        self.rate = rate
+        self.burst = burst
+        self.lock = Lock()
+        self.tokens = float(burst)
+        self.updated = timer()
+
+    def reserve(self):
+        """Reserve a slot and return the seconds to wait before using it."""
+        if not self.rate:
+            return 0
+        with self.lock:
+            now = timer()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0, -self.tokens / self.rate)
+
+    def tighten(self, rate, burst):
+        """Apply `rate` and `burst` where they are stricter than the current.
+
+        The tokens already refilled are kept, up to the new burst.
+
+        """
+        with self.lock:
+            if self.rate:
+                now = timer()
+                self.tokens = min(self.burst, self.tokens +
+                                  (now - self.updated) * self.rate)
+                self.updated = now
+            self.rate, self.burst = _stricter(self.rate, self.burst,
+                                              rate, burst)
+            self.tokens = min(self.tokens, self.burst)
+
+
+class LeakyBucket(object):
+    """A limiter spacing requests evenly, with a tolerance for bursts.
+
+    This is the leaky bucket as a meter (the generic cell rate algorithm):
+    requests are scheduled every 1 / `rate` seconds, but up to `burst`
+    requests may be sent ahead of their schedule.
+
+    """
+
+    def __init__(self, rate, burst=1):
+        """Construct an empty LeakyBucket.
+
+        :param rate: The sustained number of requests per second, or 0 for no
+            limit.
+        :param burst: The number of requests that may be made at once.
+
+        """
+        self.rate = rate
+        self.burst = burst
+        self.lock = Lock()
+        self.arrival = 0  # The theoretical arrival time of the next request
+
+    def reserve(self):
+        """Reserve a slot and return the seconds to wait before using it."""
+        if not self.rate:
+            return 0
+        interval = 1.0 / self.rate
+        with self.lock:
+            now = timer()
+            arrival = max(self.arrival, now)
+            self.arrival = arrival + interval
+            return max(0, arrival - (self.burst - 1) * interval - now)
+
+    def tighten(self, rate, burst):
+        """Apply `rate` and `burst` where they are stricter than the current.
+
+        The requests already scheduled keep their schedule.
+
+        """
+        with self.lock:
+            self.rate, self.burst = _stricter(self.rate, self.burst,
+                                              rate, burst)
+
+
+def _stricter(rate, burst, other_rate, other_burst):
+    """Return the stricter of two settings, where a rate of 0 is no limit.
+
+    The lowest rate is kept with the lowest burst of the limited settings.
+
+    """
+    if not other_rate:
+        return rate, burst
+    if not rate:
+        return other_rate, other_burst
+    return min(rate, other_rate), min(burst, other_burst)
+
+
+LIMITERS = {'token_bucket': TokenBucket,
+            'leaky_bucket': LeakyBucket}
+
+_limiters = {}  # domain -> limiter
+_limiters_lock = Lock()
+
+
+def limiter_for(domain, delay, burst=1, kind='token_bucket'):
+    """Return the limiter shared by all the requests to `domain`.
+
+    :param domain: The domain the requests are made to.
+    :param delay: The sustained number of seconds between requests.
+    :param burst: The number of requests that may be made at once.
+    :param kind: The name of the limiter class in :data:`LIMITERS`, used
+        when the domain has no limiter yet.
+
+    All the clients of the process share the quota of a domain, so the
+    limiter keeps to the strictest settings any of them asked for: the
+    longest delay and the smallest burst. A limiter is tightened in place
+    rather than replaced, which would grant a full burst to the next
+    request.
+
+    """
+    rate = 1.0 / delay if delay > 0 else 0
+    with _limiters_lock:
+        limiter = _limiters.get(domain)
+        if limiter is None:
+            limiter = _limiters[domain] = LIMITERS[kind](rate, burst)
+        elif _stricter(limiter.rate, limiter.burst, rate, burst) != \
+                (limiter.rate, limiter.burst):
+            limiter.tighten(rate, burst)
+        return limiter
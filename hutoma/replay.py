@@ -0,0 +1,271 @@
+"""Record the traffic of a client and replay it without the network.
+
+A :class:`RecordingHandler` used in place of the :class:`.DefaultHandler`
+writes every request it sends and the response it receives to an
+:class:`Archive`. A :class:`ReplayHandler` then serves those responses, at
+the recorded latency or faster, so that the client can be profiled or load
+tested offline and deterministically::
+
+    recording = HutomaUserKey('my-app', handler=RecordingHandler(path))
+    ...
+    recording.handler.archive.close()
+    replaying = HutomaUserKey('my-app', handler=ReplayHandler(path, 0.1))
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import time
+from hutoma.cache import (ResponseCache, deserialize_response,
+                          serialize_response)
+from hutoma.errors import ClientException
+from hutoma.handlers import DefaultHandler
+from hutoma.ratelimit import TokenBucket
+from six import binary_type, text_type
+from threading import Lock
+from timeit import default_timer as timer
+
+BOUNDARY_RE = re.compile(r'boundary=([^;\s]+)')
+_UNLIMITED = TokenBucket(0)
+
+
+def _unlimited(*_):
+    """Return a limiter that never waits."""
+    return _UNLIMITED
+
+
+def request_key(request):
+    """Return the key of a ``requests.PreparedRequest`` in an archive.
+
+    It is a hash of the method, url and body of the request. The boundary of
+    a multipart body, which is random, is left out.
+
+    """
+    body = request.body or b''
+    if isinstance(body, text_type):
+        body = body.encode('utf-8')
+    elif not isinstance(body, binary_type):
+        body = b''  # A file or generator; it cannot be read twice
+    match = BOUNDARY_RE.search(request.headers.get('Content-Type', ''))
+    if match:
+        body = body.replace(match.group(1).encode('ascii'), b'')
+    digest = hashlib.sha1('{0} {1}\n'.format(request.method, request.url)
+                          .encode('utf-8'))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class Archive(object):
+    """Request and response pairs recorded in a JSON lines file.
+
+    Each line holds the key (see :func:`request_key`), method and url of a
+    request, the response received and the seconds it took. The offsets of
+    the lines are indexed by key in a JSON file next to the archive,
+    ``<path>.index``, written by :meth:`close`, so that a response is found
+    in constant time without reading the archive. The index is rebuilt when
+    it is missing or does not match the archive, e.g. after a recording was
+    interrupted; a line left incomplete is then cut off.
+
+    When several responses were recorded for a request they are served in
+    turn.
+
+    :param path: The path of the archive. It is created when needed.
+
+    """
+
+    def __init__(self, path):
+        """Construct an Archive. The file is opened when first used."""
+        self.path = path
+        self.index_path = path + '.index'
+        self.lock = Lock()
+        self._file = None
+        self._offsets = None  # key -> list of line offsets
+        self._served = {}  # key -> number of responses served
+        self._changed = False
+
+    def __len__(self):
+        with self.lock:
+            self._open()
+            return sum(len(offsets) for offsets in self._offsets.values())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _open(self):
+        """Open the archive and load its index. The lock must be held."""
+        if self._file is not None:
+            return self._file
+        self._file = io.open(self.path, 'a+b')
+        size = os.path.getsize(self.path)
+        try:
+            with io.open(self.index_path, encoding='utf-8') as index_file:
+                index = json.load(index_file)
+            if index['size'] == size:
+                self._offsets = index['offsets']
+                return self._file
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+        self._offsets = {}
+        end = 0
+        self._file.seek(0)
+        for line in self._file:
+            if not line.endswith(b'\n'):
+                break
+            key = json.loads(line.decode('utf-8'))['key']
+            self._offsets.setdefault(key, []).append(end)
+            end += len(line)
+        if end != size:
+            self._file.truncate(end)
+        self._changed = True
+        return self._file
+
+    def record(self, request, response, elapsed):
+        """Append a request and its response, received in `elapsed` seconds.
+
+        The body of the response is read if it was not already.
+
+        """
+        meta, body = serialize_response(response).split(b'\n', 1)
+        key = request_key(request)
+        entry = {'key': key, 'method': request.method, 'url': request.url,
+                 'elapsed': elapsed, 'response': json.loads(
+                     meta.decode('utf-8'))}
+        try:
+            entry['body'] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            entry['body_base64'] = base64.b64encode(body).decode('ascii')
+        line = json.dumps(entry).encode('utf-8') + b'\n'
+        with self.lock:
+            archive = self._open()
+            archive.seek(0, os.SEEK_END)
+            offset = archive.tell()
+            archive.write(line)
+            archive.flush()
+            self._offsets.setdefault(key, []).append(offset)
+            self._changed = True
+
+    def find(self, request):
+        """Return the next recorded response to `request` and its latency.
+
+        :returns: A tuple of the ``requests.Response`` and the seconds it
+            took to receive, or None when no response was recorded.
+
+        """
+        key = request_key(request)
+        with self.lock:
+            archive = self._open()
+            offsets = self._offsets.get(key)
+            if not offsets:
+                return None
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            archive.seek(offsets[served % len(offsets)])
+            line = archive.readline()
+        entry = json.loads(line.decode('utf-8'))
+        if 'body_base64' in entry:
+            body = base64.b64decode(entry['body_base64'])
+        else:
+            body = entry['body'].encode('utf-8')
+        data = json.dumps(entry['response']).encode('utf-8') + b'\n' + body
+        return deserialize_response(data, request), entry['elapsed']
+
+    def close(self):
+        """Write the index of the archive and close it."""
+        with self.lock:
+            if self._file is None:
+                return
+            if self._changed:
+                self._file.seek(0, os.SEEK_END)
+                index = {'size': self._file.tell(), 'offsets': self._offsets}
+                temp_path = self.index_path + '.tmp'
+                with io.open(temp_path, 'w', encoding='utf-8') as index_file:
+                    index_file.write(text_type(json.dumps(index)))
+                getattr(os, 'replace', os.rename)(temp_path, self.index_path)
+                self._changed = False
+            self._file.close()
+            self._file = None
+            self._offsets = None
+
+
+class RecordingHandler(DefaultHandler):
+    """A DefaultHandler recording the responses it receives in an archive.
+
+    Responses served from the cache are not recorded. Unless a `cache` is
+    given, the handler has an in-memory cache of its own rather than the one
+    shared by the process, so that responses cached by other clients are
+    still requested and recorded. The bodies of streamed responses are read
+    before they are returned.
+
+    :param archive: The :class:`Archive`, or its path, to record into.
+
+    The other keyword arguments are those of :class:`.DefaultHandler`.
+
+    """
+
+    def __init__(self, archive, cache=None, **kwargs):
+        """Construct a RecordingHandler."""
+        super(RecordingHandler, self).__init__(
+            cache=ResponseCache() if cache is None else cache, **kwargs)
+        self.archive = (archive if isinstance(archive, Archive) else
+                        Archive(archive))
+
+    def send(self, request, **kwargs):
+        """Send a request and record it with its response."""
+        started = timer()
+        response = super(RecordingHandler, self).send(request, **kwargs)
+        self.archive.record(request, response, timer() - started)
+        return response
+
+
+class ReplayHandler(DefaultHandler):
+    """A DefaultHandler serving the responses recorded in an archive.
+
+    No request reaches the network. A request for which no response was
+    recorded raises :class:`.ClientException`.
+
+    Unless a `cache` is given, the handler has an in-memory cache of its own,
+    so that a replay is not answered by responses cached in the process,
+    e.g. by the recording. The rate limit is not applied either, since the
+    pace of a replay is set by `time_scale`, unless `rate_limit` is True.
+
+    :param archive: The :class:`Archive`, or its path, to replay.
+    :param time_scale: The factor applied to the recorded latencies: 1 to
+        wait as long as the responses took, 0.1 to wait ten times less, or 0
+        not to wait at all.
+    :param rate_limit: If True wait on the rate limiter of the domain like
+        the other handlers.
+
+    The other keyword arguments are those of :class:`.DefaultHandler`.
+
+    """
+
+    def __init__(self, archive, time_scale=1.0, rate_limit=False, cache=None,
+                 **kwargs):
+        """Construct a ReplayHandler."""
+        super(ReplayHandler, self).__init__(
+            cache=ResponseCache() if cache is None else cache, **kwargs)
+        self.archive = (archive if isinstance(archive, Archive) else
+                        Archive(archive))
+        self.time_scale = time_scale
+        if not rate_limit:
+            self.limiter_for = _unlimited
+
+    def send(self, request, **kwargs):
+        """Return the recorded response to a request."""
+        found = self.archive.find(request)
+        if found is None:
+            raise ClientException('No response to {0} {1} was recorded'
+                                  .format(request.method, request.url))
+        response, elapsed = found
+        if self.time_scale > 0:
+            time.sleep(elapsed * self.time_scale)
+        return response
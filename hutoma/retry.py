@@ -0,0 +1,159 @@
+"""Retry policies deciding whether and when failed requests are retried."""
+
+from __future__ import print_function, unicode_literals
+
+import random
+import time
+from collections import deque
+from email.utils import mktime_tz, parsedate_tz
+from hutoma.errors import HTTPException
+from requests.exceptions import (ConnectionError,  # pylint: disable=W0622
+                                 ConnectTimeout, Timeout)
+from threading import Lock
+from timeit import default_timer as timer
+
+IDEMPOTENT_METHODS = frozenset(['DELETE', 'GET', 'HEAD', 'OPTIONS', 'PUT'])
+
+
+class RetryBudget(object):
+    """Limit retries to a fraction of the requests made recently.
+
+    Within the last `window` seconds, at most `min_retries` plus `ratio`
+    times the number of requests may be retried. A backend that fails every
+    request thus receives at most ``1 + ratio`` times the usual traffic
+    rather than as many times as there are attempts.
+
+    """
+
+    def __init__(self, ratio=0.2, min_retries=10, window=10):
+        """Construct an unused RetryBudget."""
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self.lock = Lock()
+        self.seconds = deque()  # [second, requests, retries]
+
+    def _current(self):
+        now = int(timer())
+        while self.seconds and self.seconds[0][0] <= now - self.window:
+            self.seconds.popleft()
+        if not self.seconds or self.seconds[-1][0] != now:
+            self.seconds.append([now, 0, 0])
+        return self.seconds[-1]
+
+    def deposit(self):
+        """Count a request."""
+        with self.lock:
+            self._current()[1] += 1
+
+    def withdraw(self):
+        """Count a retry and return True, or return False if over budget."""
+        with self.lock:
+            current = self._current()
+            requests = sum(second[1] for second in self.seconds)
+            retries = sum(second[2] for second in self.seconds)
+            if retries >= self.min_retries + self.ratio * requests:
+                return False
+            current[2] += 1
+            return True
+
+
+class RetryPolicy(object):
+    """Decide whether a failed attempt is retried and how long to wait.
+
+    The wait doubles with every attempt, from `backoff` seconds up to
+    `max_backoff` seconds, and a random fraction of it is used ("full
+    jitter") so that clients failing together do not retry together. When
+    the server says how long to wait, in a `Retry-After` header or in the
+    `ratelimit` field of the response (see :class:`.RateLimitExceeded`),
+    that wait is used instead; if it is longer than `max_backoff` the error
+    is raised rather than blocking.
+
+    :param attempts: The maximum number of attempts per request.
+    :param backoff: The base wait in seconds.
+    :param max_backoff: The longest wait in seconds.
+    :param codes: The HTTP status codes that are retried.
+    :param budget: The fraction of requests that may be retried, see
+        :class:`RetryBudget`, or None for no limit.
+    :param connection_errors: If True retry connection errors and timeouts.
+        Requests that may have reached the server are only retried when
+        their method is idempotent.
+
+    """
+
+    def __init__(self, attempts=3, backoff=0.5, max_backoff=30.0,
+                 codes=(429, 502, 503, 504), budget=0.2,
+                 connection_errors=True):
+        """Construct a RetryPolicy."""
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.codes = frozenset(codes)
+        self.budget = None if budget is None else RetryBudget(budget)
+        self.connection_errors = connection_errors
+        self.random = random  # Any object with a `uniform` method
+
+    def started(self):
+        """Count a request against the budget before its first attempt."""
+        if self.budget is not None:
+            self.budget.deposit()
+
+    def delay(self, error, method, attempt):
+        """Return the seconds to wait before retrying, or None to give up.
+
+        :param error: The exception raised by the attempt.
+        :param method: The HTTP method of the request.
+        :param attempt: The number of the attempt that failed, from 1.
+
+        """
+        if attempt >= self.attempts:
+            return None
+        wait = None
+        if isinstance(error, HTTPException):
+            # pylint: disable=W0212
+            if error._raw.status_code not in self.codes:
+                return None
+            wait = server_delay(error._raw)
+        elif isinstance(error, (ConnectionError, Timeout)):
+            if not self.connection_errors or (
+                    method not in IDEMPOTENT_METHODS and
+                    not isinstance(error, ConnectTimeout)):
+                return None
+        else:
+            return None
+        if wait is None:
+            ceiling = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+            wait = self.random.uniform(0, ceiling)
+        elif wait > self.max_backoff:
+            return None
+        if self.budget is not None and not self.budget.withdraw():
+            return None
+        return max(0, wait)
+
+
+def server_delay(response):
+    """Return the seconds the server asks to wait before retrying, or None.
+
+    The `Retry-After` header, in seconds or as an HTTP date, is used first,
+    then the `ratelimit` field of a JSON response.
+
+    """
+    retry_after = response.headers.get('Retry-After')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            date = parsedate_tz(retry_after)
+            if date is not None:
+                return mktime_tz(date) - time.time()
+    if 'json' in response.headers.get('Content-Type', ''):
+        try:
+            data = response.json()
+        except ValueError:
+            return None
+        if isinstance(data, dict) and 'ratelimit' in data:
+            try:
+                return float(data['ratelimit'])
+            except (TypeError, ValueError):
+                return None
+    return None
@@ -1,16 +1,23 @@
+"""The settings read from the hutoma.ini files.
+
+The files are only read when the settings are first used, so that importing
+the package stays cheap.
+
+"""
+
 from __future__ import print_function, unicode_literals
 
 import os
 import sys
-
-try:
-    import ConfigParser as config_parser
-except ImportError:
-    import configparser  # NOQA pylint: disable=F0401
+from threading import Lock
 
 
 def _load_configuration():
     """Attempt to load settings from various hutoma.ini files."""
+    try:
+        import ConfigParser as config_parser
+    except ImportError:
+        import configparser as config_parser  # NOQA pylint: disable=F0401
     config = config_parser.RawConfigParser()
     module_dir = os.path.dirname(sys.modules[__name__].__file__)
     if 'APPDATA' in os.environ:  # Windows
@@ -28,5 +35,35 @@ def _load_configuration():
         raise Exception('Could not find config file in any of: {0}'
                         .format(locations))
     return config
-CONFIG = _load_configuration()
-del _load_configuration
\ No newline at end of file
+
+
+_config = None
+_sites = {}  # site name -> dict of settings
+_lock = Lock()
+
+
+def get_config():
+    """Return the parsed hutoma.ini files, reading them on first use."""
+    global _config  # pylint: disable=W0603
+    if _config is None:
+        with _lock:
+            if _config is None:
+                _config = _load_configuration()
+    return _config
+
+
+def site_settings(site_name):
+    """Return a new dictionary of the settings of `site_name`."""
+    settings = _sites.get(site_name)
+    if settings is None:
+        settings = _sites[site_name] = dict(get_config().items(site_name))
+    return dict(settings)
+
+
+class _LazyConfig(object):
+    """Forwards to the parsed hutoma.ini files, reading them on first use."""
+
+    def __getattr__(self, name):
+        return getattr(get_config(), name)
+
+CONFIG = _LazyConfig()
@@ -0,0 +1,149 @@
+"""Timing statistics collected by the clients.
+
+Every request made by a client records the duration of its phases, per
+route of ``Config.API_PATHS``:
+
+- ``prepare``: building the request
+- ``cache_lookup``: looking the response up in the handler's cache
+- ``rate_limit_wait``: waiting for the rate limiter
+- ``network``: sending the request and receiving the response
+- ``redirect``: each redirect hop followed
+- ``retry``: each failed attempt that is retried
+- ``decode``: parsing the JSON response
+- ``first_byte``: from the start of a streamed request to the first bytes
+  of its body
+- ``total``: the request as a whole, including redirects and retries
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import json
+import math
+from threading import Lock
+
+
+class Histogram(object):
+    """A histogram of durations with bounded memory.
+
+    Durations are counted in logarithmic buckets, so percentiles are
+    estimated within `precision` (relative) whatever the number of samples.
+
+    """
+
+    def __init__(self, precision=0.05, smallest=1e-6):
+        """Construct an empty Histogram."""
+        self.growth = math.log(1 + precision)
+        self.smallest = smallest
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        """Count a duration in seconds."""
+        index = int(math.log(max(value, self.smallest) / self.smallest) /
+                    self.growth)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """Return the estimated duration below which `percent` % fall."""
+        if not self.count:
+            return 0.0
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # The middle of the bucket, capped by the largest duration
+                return min(self.max, self.smallest *
+                           math.exp((index + 0.5) * self.growth))
+        return self.max
+
+    def snapshot(self):
+        """Return a dictionary summarizing the histogram."""
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else 0.0,
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99),
+                'max': self.max}
+
+
+class ClientStats(object):
+    """Collects the durations of the phases of a client's requests.
+
+    Callbacks registered with :meth:`subscribe` are called with the route,
+    phase and duration of every recorded event, e.g. to forward them to a
+    metrics system.
+
+    """
+
+    def __init__(self):
+        """Construct empty statistics."""
+        self.lock = Lock()
+        self.histograms = {}  # (route, phase) -> Histogram
+        self.callbacks = []
+
+    def subscribe(self, callback):
+        """Call `callback(route, phase, duration)` for every event."""
+        with self.lock:
+            self.callbacks = self.callbacks + [callback]
+
+    def unsubscribe(self, callback):
+        """Stop calling `callback`."""
+        with self.lock:
+            callbacks = list(self.callbacks)
+            callbacks.remove(callback)
+            self.callbacks = callbacks
+
+    def record(self, route, phase, duration):
+        """Record that `phase` of a request to `route` took `duration`."""
+        with self.lock:
+            histogram = self.histograms.get((route, phase))
+            if histogram is None:
+                histogram = self.histograms[(route, phase)] = Histogram()
+            histogram.record(duration)
+        for callback in self.callbacks:
+            callback(route, phase, duration)
+
+    def record_timings(self, route, timings):
+        """Record the phases in a dictionary of phase -> duration."""
+        for phase, duration in timings.items():
+            self.record(route, phase, duration)
+
+    def reset(self):
+        """Forget all recorded events."""
+        with self.lock:
+            self.histograms = {}
+
+    def snapshot(self):
+        """Return a dictionary of route -> phase -> histogram summary."""
+        with self.lock:
+            histograms = list(self.histograms.items())
+        retval = {}
+        for (route, phase), histogram in histograms:
+            retval.setdefault(route, {})[phase] = histogram.snapshot()
+        return retval
+
+    def dump(self, stream):
+        """Write the snapshot to `stream` as JSON."""
+        json.dump(self.snapshot(), stream, indent=2, sort_keys=True)
+
+    def format(self):
+        """Return the snapshot as a table in milliseconds."""
+        lines = ['{0:<12} {1:<16} {2:>8} {3:>9} {4:>9} {5:>9} {6:>9}'.format(
+            'route', 'phase', 'count', 'p50', 'p95', 'p99', 'max')]
+        for route, phases in sorted(self.snapshot().items()):
+            for phase, summary in sorted(phases.items()):
+                lines.append(
+                    '{0:<12} {1:<16} {2:>8} {3:>9.2f} {4:>9.2f} {5:>9.2f} '
+                    '{6:>9.2f}'.format(route, phase, summary['count'],
+                                       summary['p50'] * 1e3,
+                                       summary['p95'] * 1e3,
+                                       summary['p99'] * 1e3,
+                                       summary['max'] * 1e3))
+        return '\n'.join(lines)
@@ -0,0 +1,146 @@
+"""Incremental parsing of large JSON responses.
+
+:func:`iter_json_items` parses the body of a streamed response as it is
+downloaded and yields the items of one of its top-level lists, such as the
+AIs of an ``ai_list`` response, as soon as each item is complete. Only the
+item being parsed and about one chunk of the body are held in memory, rather
+than the whole body, its text and the parsed document.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import codecs
+import json
+import re
+import six
+from hutoma.internal import _unescape, _unescape_hook
+
+CHUNK_SIZE = 64 * 1024
+NUMBER_RE = re.compile(r'[0-9.eE+-]*')
+NUMBER_TYPES = six.integer_types + (float,)
+WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+
+
+class _Reader(object):
+    """The text of a body read chunk by chunk and consumed from the left."""
+
+    def __init__(self, chunks, encoding):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.text = ''
+        self.pos = 0
+        self.exhausted = False
+
+    def fill(self, size=0):
+        """Read until `size` characters are unconsumed or the body ends.
+
+        Return False if nothing could be read.
+
+        """
+        if self.exhausted:
+            return False
+        parts = [self.text[self.pos:]]
+        length = len(parts[0])
+        while True:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.exhausted = True
+                parts.append(self.decoder.decode(b'', True))
+                break
+            parts.append(self.decoder.decode(chunk))
+            length += len(parts[-1])
+            if length > size:
+                break
+        self.text = ''.join(parts)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next character that is not whitespace, or ''."""
+        while True:
+            self.pos = WHITESPACE_RE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        """Consume and return the next character, which must be in `chars`."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('Expecting one of {0!r} at {1!r}'.format(
+                chars, self.text[self.pos:self.pos + 20]))
+        self.pos += 1
+        return char
+
+    def value(self, decoder):
+        """Consume and return the JSON value at the position."""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.pos)
+            except ValueError:
+                # Incomplete; wait for twice as much text, so that a large
+                # value is not parsed again for every chunk
+                if not self.fill(2 * (len(self.text) - self.pos)):
+                    raise
+                continue
+            if isinstance(value, NUMBER_TYPES) and \
+                    NUMBER_RE.match(self.text, end).end() == len(self.text) \
+                    and self.fill():
+                continue  # The number may go on in the next chunk
+            self.pos = end
+            return value
+
+
+def iter_json_items(response, key, fields=None, object_hook=None,
+                    chunk_size=CHUNK_SIZE):
+    """Yield the items of the list `key` of a streamed JSON response.
+
+    The response body must be a JSON object. Its other members are parsed
+    too, wherever they are, and stored in the `fields` dictionary when it is
+    given. Like :func:`._decode_json`, HTML entities are replaced in the
+    strings of responses that are not declared as JSON.
+
+    Raise ValueError if the body is not valid JSON. An empty body has no
+    items.
+
+    :param response: A ``requests.Response`` requested with ``stream=True``.
+    :param key: The name of the list whose items are yielded.
+    :param fields: A dictionary receiving the other members of the object.
+    :param object_hook: The hook called with every decoded JSON object.
+    :param chunk_size: The number of bytes read at once.
+
+    """
+    content_type = response.headers.get('content-type', '')
+    unescape = 'json' not in content_type
+    if unescape:
+        object_hook = _unescape_hook(object_hook)
+    decoder = json.JSONDecoder(object_hook=object_hook)
+    reader = _Reader(response.iter_content(chunk_size),
+                     response.encoding or 'utf-8')
+    if not reader.peek():
+        return  # Like the empty bodies of some successful v1 responses
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.value(decoder)
+        reader.expect(':')
+        if name == key and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    item = reader.value(decoder)
+                    yield _unescape(item) if unescape else item
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            value = reader.value(decoder)
+            if fields is not None:
+                fields[name] = _unescape(value) if unescape else value
+        if reader.expect(',}') == '}':
+            return
@@ -0,0 +1,463 @@
+"""Streaming uploads of training material.
+
+Training material is a pair of files, like those in ``training_material/``:
+line n of the source file is a question and line n of the target file is its
+answer. The files are read lazily and uploaded in chunks no larger than
+``MAX_FILE_SIZE``, so corpora of any size can be uploaded in bounded memory.
+A :class:`DeltaTrainingUpload` keeps a manifest of the pairs it uploaded,
+and only uploads what changed when it is run again after an edit.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import heapq
+import io
+import json
+import os
+import shutil
+import struct
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from hutoma import MAX_FILE_SIZE
+from hutoma.errors import (ClientException, TrainingDataMismatch,
+                           TrainingPairsRemoved)
+from six.moves import zip_longest  # pylint: disable=F0401
+
+BLOCK_SIZE = 1024 * 1024
+DIGEST_SIZE = 20  # SHA-1
+OFFSETS = struct.Struct(str('>QQ'))  # Of a question and of its answer
+RECORD_SIZE = DIGEST_SIZE + OFFSETS.size
+SORT_RUN_PAIRS = 256 * 1024  # The records sorted in memory at once
+
+
+def iter_training_pairs(source_path, target_path):
+    """Yield the (question, answer) pairs of a source and target file.
+
+    Raise :class:`.TrainingDataMismatch` as soon as the files are found not
+    to be aligned: when one has more lines than the other, or when a line is
+    blank in one file but not in the other.
+
+    """
+    with io.open(source_path, encoding='utf-8') as source, \
+            io.open(target_path, encoding='utf-8') as target:
+        for number, (question, answer) in enumerate(
+                zip_longest(source, target), 1):
+            if question is None or answer is None:
+                raise TrainingDataMismatch(number)
+            question = question.rstrip('\r\n')
+            answer = answer.rstrip('\r\n')
+            if bool(question.strip()) != bool(answer.strip()):
+                raise TrainingDataMismatch(number)
+            yield question, answer
+
+
+def iter_training_chunks(pairs, max_size=MAX_FILE_SIZE):
+    """Yield training files, as bytes, of at most `max_size` bytes.
+
+    Each pair is written as the question and answer lines followed by a
+    blank line. Pairs are never split across chunks.
+
+    """
+    chunk = []
+    size = 0
+    for question, answer in pairs:
+        if not question.strip():
+            continue
+        data = '{0}\n{1}\n\n'.format(question, answer).encode('utf-8')
+        if len(data) > max_size:
+            raise ClientException('Training pair `{0}` is larger than {1} '
+                                  'bytes'.format(question, max_size))
+        if size + len(data) > max_size:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+        chunk.append(data)
+        size += len(data)
+    if chunk:
+        yield b''.join(chunk)
+
+
+class TrainingUpload(object):
+    """Upload a source and target file pair to an AI in chunks.
+
+    Chunks are uploaded concurrently. When `state_path` is given, the indices
+    of the uploaded chunks are recorded there after every chunk, so that an
+    interrupted or failed upload resumes where it left off when it is run
+    again with the same files.
+
+    :param session: The :class:`.BaseHutoma` client to upload with.
+    :param aiid: The id of the AI to train.
+    :param source_path: The path of the file of questions.
+    :param target_path: The path of the file of answers.
+    :param concurrency: The maximum number of chunks uploaded at once.
+    :param state_path: The path of the file recording the upload progress.
+    :param max_size: The maximum size of a chunk in bytes.
+
+    """
+
+    def __init__(self, session, aiid, source_path, target_path, concurrency=2,
+                 state_path=None, max_size=MAX_FILE_SIZE):
+        """Construct a TrainingUpload. Nothing is uploaded until it is run."""
+        self.session = session
+        self.aiid = aiid
+        self.source_path = source_path
+        self.target_path = target_path
+        self.concurrency = max(1, concurrency)
+        self.state_path = state_path
+        self.max_size = max_size
+        self.chunks = self.uploaded = self.skipped = 0
+
+    def _fingerprint(self):
+        """Return what identifies the chunks of this upload."""
+        stats = [os.stat(path) for path in (self.source_path,
+                                            self.target_path)]
+        return [self.aiid, self.max_size] + [
+            [stat.st_size, stat.st_mtime] for stat in stats]
+
+    def _load_state(self):
+        """Return the indices of the chunks uploaded by a previous run."""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return set()
+        with io.open(self.state_path, encoding='utf-8') as state_file:
+            state = json.load(state_file)
+        if state.get('fingerprint') != self._fingerprint():
+            return set()  # The files or settings have changed; start over
+        return set(state['done'])
+
+    def _save_state(self, done):
+        if not self.state_path:
+            return
+        temp_path = self.state_path + '.tmp'
+        with io.open(temp_path, 'w', encoding='utf-8') as state_file:
+            state_file.write(json.dumps({'fingerprint': self._fingerprint(),
+                                         'done': sorted(done)}))
+        getattr(os, 'replace', os.rename)(temp_path, self.state_path)
+
+    def _upload(self, index, chunk):
+        url = self.session.config['training'].format(aiid=self.aiid)
+        name = 'training-{0:06d}.txt'.format(index)
+        self.session._request(  # pylint: disable=W0212
+            url, files={'file': (name, chunk, 'text/plain')})
+        return index
+
+    def _pairs(self):
+        """Return an iterator over the pairs to upload."""
+        return iter_training_pairs(self.source_path, self.target_path)
+
+    def run(self):
+        """Upload the chunks that were not uploaded yet.
+
+        If a chunk fails to upload, no further chunks are started and the
+        error is raised once the chunks in flight have finished.
+
+        :returns: The number of chunks uploaded by this run.
+
+        """
+        done = self._load_state()
+        chunks = enumerate(iter_training_chunks(self._pairs(), self.max_size))
+        pending = deque()
+        error = None
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            def submit():
+                for index, chunk in chunks:
+                    self.chunks += 1
+                    if index in done:
+                        self.skipped += 1
+                        continue
+                    pending.append(executor.submit(self._upload, index, chunk))
+                    if len(pending) >= self.concurrency:
+                        break
+
+            submit()
+            while pending:
+                try:
+                    done.add(pending.popleft().result())
+                except Exception as exc:  # pylint: disable=W0703
+                    error = error or exc
+                    continue
+                self.uploaded += 1
+                self._save_state(done)
+                if error is None:
+                    submit()
+        if error is not None:
+            raise error
+        return self.uploaded
+
+
+def file_digest(path, block_size=BLOCK_SIZE):
+    """Return the SHA-1 hex digest of the content of a file.
+
+    The file is read in blocks of `block_size` bytes, so that it is hashed at
+    disk speed in bounded memory.
+
+    """
+    digest = hashlib.sha1()
+    with io.open(path, 'rb') as stream:
+        for block in iter(partial(stream.read, block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_pair_digests(source_path, target_path):
+    """Yield the digest and the offsets of the lines of every training pair.
+
+    Like :func:`iter_training_pairs`, but the lines are read as bytes and
+    not decoded, and blank pairs are skipped. The digest is the SHA-1 digest
+    of the question and answer lines, and the offsets are those of the
+    question in the source file and of the answer in the target file.
+
+    """
+    source_offset = target_offset = 0
+    with io.open(source_path, 'rb') as source, \
+            io.open(target_path, 'rb') as target:
+        for number, (source_line, target_line) in enumerate(
+                zip_longest(source, target), 1):
+            if source_line is None or target_line is None:
+                raise TrainingDataMismatch(number)
+            question = source_line.rstrip(b'\r\n')
+            answer = target_line.rstrip(b'\r\n')
+            blank = not question.strip()
+            if blank != (not answer.strip()):
+                raise TrainingDataMismatch(number)
+            if not blank:
+                yield (hashlib.sha1(question + b'\n' + answer).digest(),
+                       source_offset, target_offset)
+            source_offset += len(source_line)
+            target_offset += len(target_line)
+
+
+def _iter_records(stream, size):
+    """Yield the records of `size` bytes of a binary stream, read in blocks."""
+    for block in iter(partial(stream.read, BLOCK_SIZE - BLOCK_SIZE % size),
+                      b''):
+        for index in range(0, len(block), size):
+            yield block[index:index + size]
+
+
+def _write_runs(records, directory, name):
+    """Write `records` to files of SORT_RUN_PAIRS sorted records each.
+
+    :returns: The paths of the files, in `directory`.
+
+    """
+    records = iter(records)
+    paths = []
+    while True:
+        run = sorted(islice(records, SORT_RUN_PAIRS))
+        if not run:
+            return paths
+        paths.append(os.path.join(directory,
+                                  '{0}-{1}'.format(name, len(paths))))
+        with io.open(paths[-1], 'wb') as stream:
+            stream.write(b''.join(run))
+
+
+def _merge_runs(paths, size):
+    """Yield the records of the files written by _write_runs, sorted."""
+    streams = [io.open(path, 'rb') for path in paths]
+    try:
+        for record in heapq.merge(*[_iter_records(stream, size)
+                                    for stream in streams]):
+            yield record
+    finally:
+        for stream in streams:
+            stream.close()
+
+
+class TrainingManifest(object):
+    """The digests of the training pairs last uploaded to an AI.
+
+    The file starts with a JSON line holding the `aiid`, the digests of the
+    source and target `files` (see :func:`file_digest`) and the number of
+    `pairs`. The digests of the pairs follow in binary and in order,
+    DIGEST_SIZE bytes each, so that the manifest of a large corpus stays
+    small and can be compared with the pairs of the files as a stream.
+
+    :param path: The path of the manifest. It is created when saved.
+
+    """
+
+    def __init__(self, path):
+        """Construct a TrainingManifest. The file is read when used."""
+        self.path = path
+
+    def files(self, aiid):
+        """Return the digests of the files last uploaded to `aiid`, or None.
+
+        None is returned when there is no manifest or when it is that of
+        another AI.
+
+        """
+        if not os.path.exists(self.path):
+            return None
+        with io.open(self.path, 'rb') as stream:
+            header = json.loads(stream.readline().decode('utf-8'))
+        return header['files'] if header.get('aiid') == aiid else None
+
+    def iter_pairs(self):
+        """Yield the digests of the pairs last uploaded, in order."""
+        with io.open(self.path, 'rb') as stream:
+            stream.readline()
+            for digest in _iter_records(stream, DIGEST_SIZE):
+                yield digest
+
+    def save(self, aiid, files, pairs, digests):
+        """Record that `pairs` pairs were uploaded.
+
+        :param digests: An iterable of the digests of the pairs, in order
+            and concatenated, in blocks of any size.
+
+        """
+        temp_path = self.path + '.tmp'
+        with io.open(temp_path, 'wb') as stream:
+            stream.write(json.dumps({'aiid': aiid, 'files': files,
+                                     'pairs': pairs}).encode('utf-8') + b'\n')
+            for block in digests:
+                stream.write(block)
+        getattr(os, 'replace', os.rename)(temp_path, self.path)
+
+
+class DeltaTrainingUpload(TrainingUpload):
+    """Upload only the training pairs added since the last upload.
+
+    The pairs uploaded are recorded in a :class:`TrainingManifest`. When the
+    upload is run:
+
+    - if the files have not changed since the last upload, they are only
+      hashed, and nothing is uploaded;
+    - if there is no manifest for the AI, all the pairs are uploaded;
+    - if pairs were added and none removed, the added pairs alone are
+      uploaded, in chunks like a :class:`TrainingUpload`;
+    - if pairs were removed, which includes editing a question or an
+      answer, nothing is uploaded and :class:`.TrainingPairsRemoved` is
+      raised: the API cannot remove pairs, and uploading the pairs again
+      would train the AI with the ones that were kept twice. The manifest is
+      left as it is; remove it to upload all the pairs again, e.g. to an AI
+      retrained from scratch.
+
+    The digests of the pairs and the offsets of their lines are sorted in
+    runs written to temporary files, then merged and compared with the
+    digests of the manifest as a stream, so the memory used does not grow
+    with the corpus. The offsets of the added pairs are sorted the same way,
+    and their lines read again to upload them. The manifest is updated once
+    the upload succeeds. After a run, `mode` is `unchanged`, `delta`, `full`
+    or `removed`, and `added` and `removed` are the numbers of pairs added
+    and removed since the last upload.
+
+    :param manifest_path: The path of the manifest.
+
+    The other parameters are those of :class:`TrainingUpload`.
+
+    """
+
+    def __init__(self, session, aiid, source_path, target_path, manifest_path,
+                 concurrency=2, state_path=None, max_size=MAX_FILE_SIZE):
+        """Construct a DeltaTrainingUpload. Nothing is read until it is run."""
+        super(DeltaTrainingUpload, self).__init__(
+            session, aiid, source_path, target_path, concurrency, state_path,
+            max_size)
+        self.manifest = TrainingManifest(manifest_path)
+        self.base = None  # The digests of the files last uploaded
+        self.mode = None
+        self.added = self.removed = 0
+        self._added_runs = None  # The runs of offsets of the added pairs
+
+    def _fingerprint(self):
+        """Return what identifies the chunks of this upload."""
+        return super(DeltaTrainingUpload, self)._fingerprint() + [self.base]
+
+    def _pairs(self):
+        """Return an iterator over the pairs to upload."""
+        if self.mode != 'delta':
+            return super(DeltaTrainingUpload, self)._pairs()
+        return self._iter_delta()
+
+    def _iter_delta(self):
+        with io.open(self.source_path, 'rb') as source, \
+                io.open(self.target_path, 'rb') as target:
+            for record in _merge_runs(self._added_runs, OFFSETS.size):
+                source_offset, target_offset = OFFSETS.unpack(record)
+                source.seek(source_offset)
+                target.seek(target_offset)
+                yield (source.readline().rstrip(b'\r\n').decode('utf-8'),
+                       target.readline().rstrip(b'\r\n').decode('utf-8'))
+
+    def _iter_added(self, old, new, sorted_file):
+        """Compare the sorted digests of the manifest with the pair records.
+
+        The digests of the records are written to `sorted_file`, and the
+        `added` and `removed` pairs counted.
+
+        :returns: A generator of the offsets of the added pairs.
+
+        """
+        old_digest = next(old, None)
+        for record in new:
+            digest = record[:DIGEST_SIZE]
+            while old_digest is not None and old_digest < digest:
+                self.removed += 1
+                old_digest = next(old, None)
+            sorted_file.write(digest)
+            if old_digest == digest:
+                old_digest = next(old, None)
+            else:
+                self.added += 1
+                yield record[DIGEST_SIZE:]
+        if old_digest is not None:
+            self.removed += 1 + sum(1 for _ in old)
+
+    def run(self):
+        """Upload the pairs added since the last upload, or all of them.
+
+        :returns: The number of chunks uploaded by this run.
+        :raises: :class:`.TrainingPairsRemoved` when pairs were removed
+            since the last upload; `mode` is then `removed`, and nothing is
+            uploaded.
+
+        """
+        files = [file_digest(self.source_path), file_digest(self.target_path)]
+        self.base = self.manifest.files(self.aiid)
+        if files == self.base:
+            self.mode = 'unchanged'
+            return 0
+        directory = tempfile.mkdtemp()
+        try:
+            return self._run(files, directory)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _run(self, files, directory):
+        runs = _write_runs(
+            (digest + OFFSETS.pack(source_offset, target_offset)
+             for digest, source_offset, target_offset in
+             iter_pair_digests(self.source_path, self.target_path)),
+            directory, 'pairs')
+        old = iter(()) if self.base is None else self.manifest.iter_pairs()
+        sorted_path = os.path.join(directory, 'sorted')
+        with io.open(sorted_path, 'wb') as sorted_file:
+            self._added_runs = _write_runs(
+                self._iter_added(old, _merge_runs(runs, RECORD_SIZE),
+                                 sorted_file),
+                directory, 'added')
+        pairs = os.path.getsize(sorted_path) // DIGEST_SIZE
+        if self.base is None:
+            self.mode = 'full'
+        elif self.removed:
+            self.mode = 'removed'
+            raise TrainingPairsRemoved(self.added, self.removed)
+        elif self.added:
+            self.mode = 'delta'
+        else:
+            self.mode = 'unchanged'  # Only the order or blank lines changed
+        if self.mode != 'unchanged':
+            super(DeltaTrainingUpload, self).run()
+        with io.open(sorted_path, 'rb') as sorted_file:
+            self.manifest.save(self.aiid, files, pairs,
+                               iter(partial(sorted_file.read, BLOCK_SIZE),
+                                    b''))
+        return self.uploaded
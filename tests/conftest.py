@@ -0,0 +1,38 @@
+"""Fixtures shared by the tests."""
+
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'benchmarks'))
+
+from mock_server import MockHutomaServer  # NOQA pylint: disable=C0413
+
+if sys.version_info < (3, 7):
+    collect_ignore = ['test_aio.py']  # Coroutines and aiohttp
+
+SETTINGS = {'api_request_delay': 0, 'log_requests': 0, 'user_key': 'test',
+            'retry_backoff': 0.001, 'retry_budget': -1,
+            'circuit_failure_rate': 0}
+
+
+@pytest.fixture
+def server(request):
+    """Return a running MockHutomaServer answering at once."""
+    mock = MockHutomaServer().start()
+    request.addfinalizer(mock.stop)
+    return mock
+
+
+@pytest.fixture
+def session(server):
+    """Return a HutomaUserKey talking to `server`, with an empty cache."""
+    from hutoma import HutomaUserKey
+    client = HutomaUserKey('test', **dict(SETTINGS,
+                                          **server.client_settings()))
+    client.handler.clear_cache()
+    return client
@@ -0,0 +1,166 @@
+"""Tests of the asyncio client and handlers."""
+
+from __future__ import print_function, unicode_literals
+
+import asyncio
+from timeit import default_timer as timer
+
+import pytest
+from requests.exceptions import ConnectionError  # pylint: disable=W0622
+
+from hutoma.aio import (AsyncDefaultHandler, AsyncHutomaUserKey,
+                        AsyncRateLimitHandler, AsyncSingleFlight)
+from hutoma.circuit import HALF_OPEN, OPEN, CircuitBreaker
+from hutoma.errors import CircuitOpen, HTTPException
+
+from conftest import SETTINGS
+
+
+def run(coroutine):
+    """Run `coroutine` on a new event loop and return its result."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def client(server):
+    session = AsyncHutomaUserKey('test', **dict(SETTINGS,
+                                                **server.client_settings()))
+    session.handler.clear_cache()
+    return session
+
+
+def test_client(server):
+    async def main():
+        async with client(server) as session:
+            ais = await session.get_ai_list()
+            ai = await session.get_ai('ai-1')
+            answer = await session.chat('ai-1', 'Is the sky blue?')
+            audio = await session.speak('ai-1', 'The sky is blue.')
+            await session.get_ai_list()
+            return ais, ai, answer, audio
+
+    ais, ai, answer, audio = run(main())
+    assert len(ais['ai_list']) == 10
+    assert ai['ai']['aiid'] == 'ai-1'
+    assert answer['result']['query'] == 'Is the sky blue?'
+    assert len(audio) == 10 * 1024
+    # The second AI list came from the cache
+    assert server.counts == {'ai_list': 1, 'ai': 1, 'chat': 1, 'speak': 1}
+
+
+def test_client_retries(server):
+    server.error_rate = 1.0
+    session = client(server)
+    session.retry_policy.attempts = 2
+
+    async def main():
+        async with session:
+            await session.get_ai('ai-1')
+
+    with pytest.raises(HTTPException):
+        run(main())
+    assert server.counts['ai'] == 2
+
+
+def test_client_has_no_blocking_methods():
+    for name in ('get_ais', 'chat_many', 'hydrate_ais', 'evaluate',
+                 'upload_training_files', 'stream_content'):
+        assert not hasattr(AsyncHutomaUserKey, name)
+
+
+def test_single_flight_coalesces_identical_calls():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    async def main():
+        return await asyncio.gather(flight.do('a', fetch, 1),
+                                    flight.do('a', fetch, 2),
+                                    flight.do('b', fetch, 3))
+
+    assert run(main()) == [1, 1, 3]
+    assert calls == [1, 3]
+    assert flight.stats() == {'calls': 2, 'coalesced': 1, 'in_flight': 0}
+
+
+def test_single_flight_shares_errors():
+    flight = AsyncSingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('failed')
+
+    async def main():
+        return await asyncio.gather(flight.do('a', fail),
+                                    flight.do('a', fail),
+                                    return_exceptions=True)
+
+    errors = run(main())
+    assert [type(error) for error in errors] == [ValueError, ValueError]
+    assert flight.stats()['calls'] == 1
+
+
+def test_handlers_coalesce_their_own_requests():
+    handlers = [AsyncDefaultHandler() for _ in range(2)]
+    assert handlers[0].cache is handlers[1].cache
+    assert handlers[0].in_flight is not handlers[1].in_flight
+    assert handlers[0].refreshing is not handlers[1].refreshing
+
+
+class Limiter(object):
+    """A limiter asking every request to wait `delay` seconds."""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def reserve(self):
+        return self.delay
+
+
+def handler(delay, error=None):
+    """Return a rate limited handler whose requests fail with `error`."""
+    async def request(_, **kwargs):
+        if error is not None:
+            raise error
+        return kwargs
+
+    instance = AsyncRateLimitHandler()
+    instance.limiter_for = lambda *_: Limiter(delay)
+    return instance, AsyncRateLimitHandler.rate_limit(request)
+
+
+def test_rate_limit_waits_on_the_limiter():
+    instance, request = handler(0.05)
+    timings = {}
+    started = timer()
+    assert run(request(instance, 'example.com', 2.0, _timings=timings,
+                       value=1)) == {'_timings': timings, 'value': 1}
+    assert timer() - started >= 0.05
+    assert timings['rate_limit_wait'] == 0.05
+
+
+def test_rate_limit_records_failures_in_the_circuit():
+    instance, request = handler(0, ConnectionError())
+    breaker = CircuitBreaker('ai', min_calls=1, window=1)
+    with pytest.raises(ConnectionError):
+        run(request(instance, 'example.com', 0, _circuit=breaker))
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        run(request(instance, 'example.com', 0, _circuit=breaker))
+
+
+def test_rate_limit_releases_the_probe_of_cancelled_requests():
+    breaker = CircuitBreaker('ai', min_calls=1, window=1, reset_timeout=0)
+    breaker.record(False, 0, breaker.acquire())
+    instance, request = handler(0, asyncio.CancelledError())
+    with pytest.raises(asyncio.CancelledError):
+        run(request(instance, 'example.com', 0, _circuit=breaker))
+    assert breaker.state == HALF_OPEN
+    assert breaker.acquire() is True
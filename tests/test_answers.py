@@ -0,0 +1,69 @@
+"""Tests of the answer cache."""
+
+from __future__ import print_function, unicode_literals
+
+import pytest
+
+from hutoma import HutomaUserKey
+from hutoma.answers import AnswerCache, normalize_question, training_version
+
+from conftest import SETTINGS
+
+
+@pytest.mark.parametrize('question', ['Hello!', 'hello', '  HELLO ?',
+                                      'hello...', 'Hello ?!\n', 'hello;:,'])
+def test_normalize_question_ignores_case_spacing_and_end(question):
+    assert normalize_question(question) == 'hello'
+
+
+def test_normalize_question_keeps_inner_text():
+    assert normalize_question('What  is\tthe sky?') == 'what is the sky'
+    assert normalize_question('Is 3.5 big?') == 'is 3.5 big'
+    assert normalize_question('\xbfQu\xe9 tal, AMIGO?') == \
+        '\xbfqu\xe9 tal, amigo'
+    assert normalize_question('?!') == ''
+
+
+class Answer(object):
+    """An object made of a chat answer, which JSON cannot serialize."""
+
+    def __init__(self, json_dict):
+        self.json_dict = json_dict
+
+
+def hook(json_dict):
+    return Answer(json_dict) if 'answer' in json_dict else json_dict
+
+
+def test_answer_cache_versions():
+    answers = AnswerCache(60)
+    key = answers.key('ai-1', 'Hello!')
+    assert answers.set(key, {'answer': 'Hi'}) == {'answer': 'Hi'}
+    assert answers.get(answers.key('ai-1', 'hello')) == {'answer': 'Hi'}
+    assert answers.set_version('ai-1', 'v2') == 1
+    assert answers.get(answers.key('ai-1', 'hello')) is None
+    # An answer asked for before the new version is not stored
+    answers.set(key, {'answer': 'Hi'})
+    assert answers.stats()['entries'] == 0
+    assert training_version({'status': 1, 'a': 1}) == \
+        training_version({'status': 2, 'a': 1})
+
+
+def test_answer_cache_stores_json_and_returns_objects():
+    answers = AnswerCache(60)
+    key = answers.key('ai-1', 'Hello!')
+    answer = answers.set(key, {'result': {'answer': 'Hi'}}, hook)
+    assert answer['result'].json_dict == {'answer': 'Hi'}
+    assert answers.get(key, hook)['result'].json_dict == {'answer': 'Hi'}
+
+
+def test_client_caches_answers_made_into_objects(server, monkeypatch):
+    session = HutomaUserKey('test', chat_cache_timeout=60, **dict(
+        SETTINGS, **server.client_settings()))
+    session.handler.clear_cache()
+    monkeypatch.setattr(session, '_json_hutoma_objecter', hook)
+    answers = [session.chat('ai-1', question)['result']
+               for question in ('Hello?', 'hello')]
+    assert [type(answer) for answer in answers] == [Answer, Answer]
+    assert answers[1].json_dict['query'] == 'Hello?'
+    assert server.counts['chat'] == 1
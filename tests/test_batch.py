@@ -0,0 +1,77 @@
+"""Tests of the batches of chat questions."""
+
+from __future__ import print_function, unicode_literals
+
+from threading import Event, Lock
+
+from hutoma import HutomaUserKey
+from hutoma.batch import ChatBatch
+
+from conftest import SETTINGS
+
+
+class Session(object):
+    """A session whose first question is answered after `release` is set."""
+
+    def __init__(self, errors=()):
+        self.errors = errors
+        self.release = Event()
+        self.lock = Lock()
+        self.answered = 0
+
+    def chat(self, aiid, question, retry_on_error=True):
+        if question == 'first':
+            self.release.wait(5)
+        elif question in self.errors:
+            raise ValueError(question)
+        with self.lock:
+            self.answered += 1
+            if self.answered == 3:
+                self.release.set()
+        return {'aiid': aiid, 'question': question,
+                'retried': retry_on_error}
+
+
+def test_ordered_batch_keeps_its_window_full():
+    session = Session()
+    questions = ['first', 'a', 'b', 'c']
+    results = list(ChatBatch(session, 'ai-1', questions, concurrency=2))
+    # The three later questions were answered while the first was waiting
+    assert session.release.is_set()
+    assert [result.index for result in results] == [0, 1, 2, 3]
+    assert [result.answer['question'] for result in results] == questions
+
+
+def test_unordered_batch_yields_as_completed():
+    session = Session()
+    batch = ChatBatch(session, 'ai-1', ['first', 'a', 'b', 'c'],
+                      concurrency=2, ordered=False, retry_on_error=False)
+    results = list(batch)
+    # The first question waits until the others are answered
+    assert results[0].index == 1
+    assert sorted(result.index for result in results) == [0, 1, 2, 3]
+    assert not results[0].answer['retried']
+    assert batch.stats.submitted == batch.stats.completed == 4
+
+
+def test_batch_reports_errors():
+    session = Session(errors=('b',))
+    session.release.set()
+    batch = ChatBatch(session, 'ai-1', ['a', 'b', 'c'], concurrency=2)
+    results = list(batch)
+    assert [result.error is None for result in results] == [True, False, True]
+    assert results[1].answer is None
+    assert isinstance(results[1].error, ValueError)
+    assert batch.stats.errors == 1
+
+
+def test_batch_uses_the_answer_cache(server):
+    session = HutomaUserKey('test', chat_cache_timeout=60, **dict(
+        SETTINGS, **server.client_settings()))
+    session.handler.clear_cache()
+    session.chat('ai-1', 'Hello?')
+    results = list(session.chat_many('ai-1', ['hello', 'Bye']))
+    assert [result.answer['result']['query'] for result in results] == \
+        ['Hello?', 'Bye']
+    assert server.counts['chat'] == 2
+    assert session.answer_cache.stats()['hits'] == 1
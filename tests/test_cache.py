@@ -0,0 +1,222 @@
+"""Tests of the response cache."""
+
+from __future__ import print_function, unicode_literals
+
+import pytest
+
+from hutoma import HutomaUserKey, cache
+from hutoma.cache import KeyValueCache, ResponseCache, SQLiteCache
+from hutoma.handlers import DefaultHandler
+
+from conftest import SETTINGS
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache, 'timer', lambda: now[0])
+    return now
+
+
+def key(url, params=''):
+    return (url, params)
+
+
+def indices(responses):
+    """Return the urls and tags indexed by `responses`."""
+    # pylint: disable=W0212
+    return sorted(responses._by_url), sorted(responses._by_tag)
+
+
+def test_get_and_set(clock):
+    responses = ResponseCache()
+    assert responses.get(key('a')) is None
+    responses.set(key('a'), b'A', 10)
+    assert responses.get(key('a')) == b'A'
+    assert responses.stats()['hits'] == 1
+    assert responses.stats()['misses'] == 1
+
+
+def test_entries_expire(clock):
+    responses = ResponseCache()
+    responses.set(key('a'), b'A', 10)
+    clock[0] += 10
+    assert key('a') not in responses
+    assert responses.stats()['expirations'] == 1
+
+
+def test_replaced_entry_keeps_its_new_timeout(clock):
+    responses = ResponseCache()
+    responses.set(key('a'), b'A', 10)
+    responses.set(key('a'), b'B', 20)
+    clock[0] += 15
+    assert responses.get(key('a')) == b'B'
+
+
+def test_least_recently_used_evicted_first(clock):
+    responses = ResponseCache(max_entries=2)
+    responses.set(key('a'), b'A', 10)
+    responses.set(key('b'), b'B', 10)
+    responses.get(key('a'))
+    responses.set(key('c'), b'C', 10)
+    assert key('b') not in responses
+    assert key('a') in responses and key('c') in responses
+    assert responses.stats()['evictions'] == 1
+
+
+def test_max_bytes(clock):
+    responses = ResponseCache(max_bytes=5)
+    responses.set(key('a'), b'AAA', 10)
+    responses.set(key('b'), b'BBB', 10)
+    assert len(responses) == 1 and responses.size == 3
+    responses.resize(max_bytes=2)
+    assert len(responses) == 0 and responses.size == 0
+
+
+def test_evict_urls_uses_the_url_of_the_key(clock):
+    responses = ResponseCache()
+    responses.set(key('a', 'page=1'), b'1', 10)
+    responses.set(key('a', 'page=2'), b'2', 10)
+    responses.set(key('b'), b'B', 10)
+    assert responses.evict_urls(['a', 'missing']) == 2
+    assert len(responses) == 1 and responses.size == 1
+    assert indices(responses) == (['b'], [])
+
+
+def test_evict_tags(clock):
+    responses = ResponseCache()
+    responses.set(key('a'), b'A', 10, tags=['ai:1'])
+    responses.set(key('b'), b'B', 10, tags=['ai:1', 'ai:2'])
+    responses.set(key('c'), b'C', 10, tags=['ai:2'])
+    assert responses.evict_tags(['ai:1']) == 2
+    assert indices(responses) == (['c'], ['ai:2'])
+    assert responses.evict_tags(['ai:2']) == 1
+    assert indices(responses) == ([], [])
+
+
+def test_evict_prefix(clock):
+    responses = ResponseCache()
+    responses.set(key('http://h/ai/1'), b'1', 10)
+    responses.set(key('http://h/ai/1/chat'), b'2', 10)
+    responses.set(key('http://h/ai/2'), b'3', 10)
+    assert responses.evict_prefix('http://h/ai/1') == 2
+    assert indices(responses) == (['http://h/ai/2'], [])
+
+
+def test_tag_index_follows_evictions_and_expiry(clock):
+    responses = ResponseCache(max_entries=1)
+    responses.set(key('a'), b'A', 10, tags=['t'])
+    responses.set(key('b'), b'B', 10, tags=['t'])
+    assert responses.evict_tags(['t']) == 1
+    responses.set(key('c'), b'C', 10, tags=['u'])
+    clock[0] += 10
+    assert responses.get(key('c')) is None
+    assert indices(responses) == ([], [])
+
+
+def test_index_follows_evictions_and_expiry(clock):
+    responses = ResponseCache(max_entries=1)
+    responses.set(key('a'), b'A', 10)
+    responses.set(key('b'), b'B', 10)
+    assert indices(responses) == (['b'], [])
+    clock[0] += 10
+    assert responses.get(key('b')) is None
+    assert indices(responses) == ([], [])
+
+
+def test_clear(clock):
+    responses = ResponseCache()
+    responses.set(key('a'), b'A', 10)
+    responses.clear()
+    assert len(responses) == 0 and responses.size == 0
+    assert responses.evict_urls(['a']) == 0
+
+
+class MemcacheClient(object):
+    """A memcached style client storing its values in a dictionary."""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, timeout):  # pylint: disable=W0613
+        self.values[key] = value
+
+    def add(self, key, value, timeout):
+        if key in self.values:
+            return False
+        self.set(key, value, timeout)
+        return True
+
+    def append(self, key, value):
+        if key not in self.values:
+            return False
+        self.values[key] += value
+        return True
+
+    def incr(self, key, delta):
+        if key not in self.values:
+            return None
+        self.values[key] = str(int(self.values[key]) + delta)
+        return int(self.values[key])
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+def test_key_value_cache():
+    responses = KeyValueCache(MemcacheClient())
+    responses.set(key('a', 'page=1'), b'1', 10, ['ai'])
+    responses.set(key('a', 'page=1'), b'1', 10, ['ai'])
+    responses.set(key('a', 'page=2'), b'2', 10)
+    responses.set(key('b'), b'B', 10, ['ai'])
+    assert responses.get(key('a', 'page=2')) == b'2'
+    assert responses.evict_urls(['a']) == 2
+    assert responses.get(key('a', 'page=1')) is None
+    # The index of a tag still lists the entries since evicted by url
+    assert responses.evict_tags(['ai']) == 2
+    assert responses.get(key('b')) is None
+    responses.set(key('c'), b'C', 10)
+    responses.clear()
+    responses.clear()
+    assert responses.get(key('c')) is None
+    assert responses.client.get('hutoma:generation') == '2'
+
+
+def test_sqlite_cache_keeps_to_max_bytes(tmpdir):
+    path = str(tmpdir.join('cache.sqlite'))
+    responses = SQLiteCache(path, max_bytes=5)
+    responses.set(key('a'), b'AA', 10)
+    responses.set(key('a'), b'AAA', 10)
+    responses.set(key('b'), b'BB', 20)
+    assert responses.stats()['bytes'] == 5
+    responses.set(key('c'), b'CC', 30)
+    assert responses.get(key('a')) is None
+    assert responses.stats()['bytes'] == 4
+    # Another process opening the database shares the total
+    assert SQLiteCache(path).stats()['bytes'] == 4
+    responses.evict_urls(['b'])
+    assert responses.stats()['bytes'] == 2
+    responses.clear()
+    assert responses.stats()['bytes'] == 0
+
+
+def test_client_caches_responses(server, session):
+    session.get_ai_list()
+    session.get_ai_list()
+    assert server.counts['ai_list'] == 1
+    DefaultHandler.clear_cache()  # The cache shared by the clients
+    session.get_ai_list()
+    assert server.counts['ai_list'] == 2
+
+
+def test_clients_share_responses_by_user_key(server, session):
+    session.get_ai_list()
+    settings = dict(SETTINGS, **server.client_settings())
+    HutomaUserKey('test', **settings).get_ai_list()
+    assert server.counts['ai_list'] == 1
+    settings['user_key'] = 'other'
+    HutomaUserKey('test', **settings).get_ai_list()
+    assert server.counts['ai_list'] == 2
@@ -0,0 +1,143 @@
+"""Tests of the circuit breakers."""
+
+from __future__ import print_function, unicode_literals
+
+import pytest
+
+from hutoma import circuit
+from hutoma.circuit import (CLOSED, HALF_OPEN, OPEN, CircuitBreaker,
+                            CircuitBreakers)
+from hutoma.errors import CircuitOpen
+from hutoma.handlers import RateLimitHandler
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit, 'timer', lambda: now[0])
+    return now
+
+
+def fail(breaker, times, duration=0.1):
+    for _ in range(times):
+        breaker.record(False, duration, breaker.acquire())
+
+
+def test_opens_at_failure_rate(clock):
+    breaker = CircuitBreaker('ai', failure_rate=0.5, min_calls=4, window=4)
+    breaker.record(True, 0.1, breaker.acquire())
+    fail(breaker, 1)
+    breaker.record(True, 0.1, breaker.acquire())
+    assert breaker.state == CLOSED  # Fewer than min_calls
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.acquire()
+    assert breaker.snapshot()['rejected'] == 1
+
+
+def test_slow_calls_count_as_failures(clock):
+    breaker = CircuitBreaker('ai', slow_call_duration=1, min_calls=2,
+                             window=2)
+    breaker.record(True, 2, breaker.acquire())
+    breaker.record(True, 2, breaker.acquire())
+    assert breaker.state == OPEN
+
+
+def test_half_open_probe_closes_on_success(clock):
+    breaker = CircuitBreaker('ai', min_calls=1, window=1, reset_timeout=30)
+    fail(breaker, 1)
+    clock[0] += 31
+    probe = breaker.acquire()
+    assert probe is True and breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.acquire()  # Only one probe at a time
+    breaker.record(True, 0.1, probe)
+    assert breaker.state == CLOSED
+    assert breaker.acquire() is False
+
+
+def test_half_open_probe_reopens_on_failure(clock):
+    breaker = CircuitBreaker('ai', min_calls=1, window=1, reset_timeout=30)
+    fail(breaker, 1)
+    clock[0] += 31
+    breaker.record(False, 0.1, breaker.acquire())
+    assert breaker.state == OPEN
+    assert breaker.snapshot()['opened'] == 2
+
+
+def test_calls_started_before_opening_are_ignored(clock):
+    breaker = CircuitBreaker('ai', min_calls=1, window=1)
+    late = breaker.acquire()
+    fail(breaker, 1)
+    breaker.record(True, 0.1, late)
+    assert breaker.state == OPEN
+
+
+def test_breakers_per_route():
+    breakers = CircuitBreakers(failure_rate=0.5)
+    assert breakers.get('ai') is breakers.get('ai')
+    assert breakers.get('ai') is not breakers.get('chat')
+    assert sorted(breakers.snapshot()) == ['ai', 'chat']
+    assert CircuitBreakers(failure_rate=0).get('ai') is None
+
+
+def test_check_does_not_claim_a_probe(clock):
+    breaker = CircuitBreaker('ai', min_calls=1, window=1, reset_timeout=30)
+    fail(breaker, 1)
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    clock[0] += 31
+    breaker.check()
+    breaker.check()
+    assert breaker.acquire() is True
+
+
+def test_cancelled_probe_is_released(clock):
+    breaker = CircuitBreaker('ai', min_calls=1, window=1, reset_timeout=30)
+    fail(breaker, 1)
+    clock[0] += 31
+    breaker.cancel(breaker.acquire())
+    assert breaker.state == HALF_OPEN
+    assert breaker.acquire() is True
+
+
+class Limiter(object):
+    """A limiter letting every request through at once."""
+
+    @staticmethod
+    def reserve():
+        return 0
+
+
+def handler(error):
+    """Return a rate limited handler whose requests raise `error`."""
+    def request(_, **__):
+        raise error
+
+    instance = RateLimitHandler()
+    instance.limiter_for = lambda *_: Limiter()
+    return instance, RateLimitHandler.rate_limit(request)
+
+
+def test_interrupted_request_releases_its_probe(clock):
+    breaker = CircuitBreaker('ai', min_calls=1, window=1, reset_timeout=30)
+    fail(breaker, 1)
+    clock[0] += 31
+    instance, request = handler(KeyboardInterrupt())
+    with pytest.raises(KeyboardInterrupt):
+        request(instance, 'example.com', 0, _circuit=breaker)
+    assert breaker.state == HALF_OPEN
+    instance, request = handler(ValueError())
+    with pytest.raises(ValueError):
+        request(instance, 'example.com', 0, _circuit=breaker)
+    assert breaker.state == OPEN
+
+
+def test_open_circuit_fails_before_the_limiter(clock):
+    breaker = CircuitBreaker('ai', min_calls=1, window=1)
+    fail(breaker, 1)
+    instance, request = handler(ValueError())
+    instance.limiter_for = None  # Not called
+    with pytest.raises(CircuitOpen):
+        request(instance, 'example.com', 0, _circuit=breaker)
@@ -0,0 +1,55 @@
+"""Tests of the evaluation of AIs against training material."""
+
+from __future__ import print_function, unicode_literals
+
+import io
+import json
+
+from hutoma.evaluation import (Evaluation, chat_answer, edit_similarity,
+                               score, token_overlap)
+
+
+def test_scores():
+    assert score('The sky is  BLUE', 'the sky is blue') == {
+        'exact': 1.0, 'token_overlap': 1.0, 'edit_similarity': 1.0}
+    assert token_overlap('blue sky', 'grey sea') == 0.0
+    assert abs(token_overlap('the blue sky', 'the sky') - 0.8) < 1e-9
+    assert edit_similarity('the blue sky', 'the sky') == 1.0 - 1.0 / 3
+    assert token_overlap('', '') == edit_similarity('', '') == 1.0
+
+
+def test_chat_answer():
+    assert chat_answer({'result': {'answer': 'Blue.'}}) == 'Blue.'
+    assert chat_answer({'result': None}) == chat_answer('') == ''
+
+
+def files(tmpdir, questions, answers):
+    paths = []
+    for name, lines in (('source.txt', questions), ('target.txt', answers)):
+        path = tmpdir.join(name)
+        path.write_text(''.join(line + '\n' for line in lines), 'utf-8')
+        paths.append(str(path))
+    return paths + [str(tmpdir.join('results.jsonl'))]
+
+
+def test_evaluation_resumes(tmpdir, server, session):
+    source, target, results = files(tmpdir, ['Sky?', '', 'Sea?'],
+                                    ['Blue.', '', 'Deep blue.'])
+    summary = session.evaluate('ai-1', source, target, results)
+    assert summary['questions'] == summary['scored'] == 2
+    assert summary['exact'] == 0.5
+    with io.open(results, encoding='utf-8') as lines:
+        records = sorted((json.loads(line) for line in lines),
+                         key=lambda record: record['line'])
+    assert [record['line'] for record in records] == [1, 3]
+    assert records[1]['answer'] == 'Blue.'
+    summary = Evaluation(session, 'ai-1', source, target, results).run()
+    assert summary['skipped'] == 2
+    assert server.counts['chat'] == 2
+
+
+def test_evaluation_in_processes(tmpdir, session):
+    source, target, results = files(tmpdir, ['Sky?', 'Sea?'],
+                                    ['Blue.', 'Deep blue.'])
+    summary = session.evaluate('ai-1', source, target, results, processes=1)
+    assert summary['scored'] == 2 and summary['exact'] == 0.5
@@ -0,0 +1,45 @@
+"""Tests of the request handlers."""
+
+from __future__ import print_function, unicode_literals
+
+from threading import Thread
+
+from hutoma import HutomaUserKey
+from hutoma.cache import ResponseCache
+from hutoma.handlers import DefaultHandler
+
+from conftest import SETTINGS
+
+
+def fetch_together(sessions, aiid='ai-1'):
+    """Fetch the same AI from every session at once."""
+    threads = [Thread(target=session.get_ai, args=(aiid,))
+               for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def client(server, cache=None):
+    return HutomaUserKey('test', handler=DefaultHandler(cache=cache),
+                         **dict(SETTINGS, **server.client_settings()))
+
+
+def test_concurrent_requests_coalesce(server):
+    server.latency = 0.1
+    session = client(server, ResponseCache())
+    fetch_together([session] * 4)
+    assert server.counts['ai'] == 1
+    assert session.handler.in_flight.stats()['coalesced'] == 3
+
+
+def test_handlers_do_not_coalesce_with_each_other(server):
+    server.latency = 0.1
+    sessions = [client(server, ResponseCache()) for _ in range(2)]
+    fetch_together(sessions)
+    # Each handler caches in its own backend so each needs the response
+    assert server.counts['ai'] == 2
+    assert sessions[0].handler.in_flight is not sessions[1].handler.in_flight
+    for session in sessions:
+        assert session.handler.in_flight.stats()['coalesced'] == 0
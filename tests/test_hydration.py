@@ -0,0 +1,62 @@
+"""Tests of fetching the details of many AIs at once."""
+
+from __future__ import print_function, unicode_literals
+
+from threading import Thread
+
+import pytest
+
+from hutoma import hydration
+from hutoma.hydration import hydrate
+from hutoma.errors import HTTPException
+
+
+def test_first_access_hydrates_the_group(server, session):
+    ais = session.get_ais()
+    assert server.counts == {'ai_list': 1}
+    assert ais[3].language == 'en-US'
+    assert server.counts['ai'] == 10
+    assert all(ai.timezone == 'Europe/London' for ai in ais)
+    assert server.counts['ai'] == 10
+
+
+def test_hydrate_reports_errors(server, session):
+    ais = session.get_ais()
+    server.error_rate = 1.0
+    session.retry_policy.attempts = 1
+    errors = hydrate(session, ais[:2])
+    assert [type(error) for error in errors] == [HTTPException] * 2
+    with pytest.raises(HTTPException):
+        session.hydrate_ais(ais[:2])
+
+
+def test_failed_ai_is_fetched_again(server, session):
+    ais = session.get_ais()
+    server.error_rate = 1.0
+    session.retry_policy.attempts = 1
+    with pytest.raises(HTTPException):
+        ais[0].language  # pylint: disable=W0104
+    server.error_rate = 0.0
+    assert ais[0].language == 'en-US'
+
+
+def test_group_is_not_locked_while_fetching(server, session, monkeypatch):
+    server.latency = 0.05
+    ais = session.get_ais(concurrency=2)
+    prefetch = ais[0]._prefetch  # pylint: disable=W0212
+    locked = []
+
+    def checked_hydrate(*args):
+        locked.append(prefetch.lock.locked())
+        return hydrate(*args)
+    monkeypatch.setattr(hydration, 'hydrate', checked_hydrate)
+    threads = [Thread(target=getattr, args=(ais[index], 'language'))
+               for index in (0, 5, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert locked and not any(locked)
+    # Every AI was claimed once, whichever thread needed it
+    assert server.counts['ai'] == 10
+    assert all('language' in ai.__dict__ for ai in ais)
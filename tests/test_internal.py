@@ -0,0 +1,57 @@
+"""Tests of the internal helpers."""
+
+from __future__ import print_function, unicode_literals
+
+from requests import Response
+
+from hutoma.internal import _decode_entities, _decode_json
+
+
+def response(body, content_type='text/html', encoding=None):
+    """Return a Response with `body`, as bytes, and headers."""
+    retval = Response()
+    retval._content = body  # pylint: disable=W0212
+    retval.headers['content-type'] = content_type
+    retval.encoding = encoding
+    return retval
+
+
+def test_decode_entities():
+    assert _decode_entities('Fish &amp; chips') == 'Fish & chips'
+    assert _decode_entities('&unknown; &amp') == '&unknown; &amp'
+
+
+def test_decode_json_unescapes_strings_only():
+    body = b'{"a&amp;b": "c &lt; d", "e": ["&gt;", 1, {"f": "&quot;"}]}'
+    assert _decode_json(response(body)) == \
+        {'a&amp;b': 'c < d', 'e': ['>', 1, {'f': '"'}]}
+    assert _decode_json(response(b'"&amp;"')) == '&'
+
+
+def test_decode_json_leaves_json_responses_as_they_are():
+    body = b'{"a": "c &lt; d"}'
+    assert _decode_json(response(body, 'application/json')) == \
+        {'a': 'c &lt; d'}
+
+
+def test_decode_json_hook_sees_unescaped_objects():
+    objects = []
+
+    def hook(obj):
+        objects.append(dict(obj))
+        return obj
+    _decode_json(response(b'{"a": {"b": "&amp;"}}'), hook)
+    assert objects == [{'b': '&'}, {'a': {'b': '&'}}]
+
+
+def test_decode_json_decodes_the_body():
+    body = '{"a": "caf\xe9"}'.encode('latin-1')
+    assert _decode_json(response(body, 'application/json', 'ISO-8859-1')) \
+        == {'a': 'caf\xe9'}
+    body = '{"a": "caf\xe9"}'.encode('utf-8')
+    assert _decode_json(response(body, 'application/json', 'utf-8')) == \
+        {'a': 'caf\xe9'}
+
+
+def test_decode_json_empty_body():
+    assert _decode_json(response(b'')) == ''
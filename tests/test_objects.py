@@ -0,0 +1,63 @@
+"""Tests of the objects built from API responses."""
+
+from __future__ import print_function, unicode_literals
+
+import pickle
+
+import pytest
+
+from hutoma import HutomaUserKey
+from hutoma.objects import AI, CompactAI, CompactChat
+
+
+def test_compact_object_reads_the_dict():
+    ai = CompactAI(None, {'aiid': 'ai-1', 'name': 'Sky'})
+    assert ai.name == 'Sky'
+    ai.json_dict['name'] = 'Sea'
+    assert ai.name == 'Sea'
+    assert not hasattr(ai, '__dict__')
+    assert 'name' in dir(ai)
+    with pytest.raises(AttributeError):
+        ai.missing  # pylint: disable=W0104
+
+
+def test_compact_object_converts_keys_once():
+    ai = CompactAI(None, {'aiid': 'ai-1', 'AIID': 'ai-2'})
+    related = ai.AIID
+    assert isinstance(related, CompactAI) and related.aiid == 'ai-2'
+    assert ai.AIID is related
+    assert CompactAI(None, {'AIID': '[deleted]'}).AIID is None
+
+
+def test_compact_object_equality():
+    ai = CompactAI(None, {'aiid': 'ai-1'})
+    assert ai == CompactAI(None, {'aiid': 'ai-1'})
+    assert ai != CompactAI(None, {'aiid': 'ai-2'})
+    assert ai != CompactChat(None, {'aiid': 'ai-1'})
+
+
+def test_compact_object_pickles_without_its_session():
+    ai = CompactAI(object(), {'aiid': 'ai-1', 'AIID': 'ai-2'})
+    ai.AIID  # pylint: disable=W0104
+    copy = pickle.loads(pickle.dumps(ai))
+    assert copy == ai and copy.session is None
+    assert copy.AIID.aiid == 'ai-2'
+
+
+def test_client_builds_compact_objects():
+    session = HutomaUserKey('test', user_key='test', compact_objects=True)
+    ai = session._json_hutoma_objecter(  # pylint: disable=W0212
+        {'kind': 'ai', 'data': {'aiid': 'ai-1'}})
+    assert isinstance(ai, CompactAI) and ai.session is session
+
+
+def test_delete_evicts_the_ai(server, session):
+    session.get_ai('ai-1')
+    session.get_ai('ai-2')
+    session.get_ai_list()
+    AI(session, {'aiid': 'ai-1'}).delete()
+    assert server.counts['ai'] == 3
+    session.get_ai('ai-1')
+    session.get_ai('ai-2')
+    session.get_ai_list()
+    assert server.counts == {'ai': 4, 'ai_list': 2}
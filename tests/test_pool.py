@@ -0,0 +1,47 @@
+"""Tests of the connection pools."""
+
+from __future__ import print_function, unicode_literals
+
+from requests import Request
+
+from hutoma import pool
+from hutoma.pool import ConnectionPool, shared_pool
+
+
+def get(connections, server, times):
+    for _ in range(times):
+        request = Request('GET', 'http://{0}/v1/ai'.format(server.domain))
+        connections.send(request.prepare()).close()
+
+
+def test_shared_pool_per_settings():
+    connections = shared_pool(pool_maxsize=3)
+    assert shared_pool(pool_maxsize=3) is connections
+    assert shared_pool(pool_maxsize=4) is not connections
+
+
+def test_connections_are_reused(server):
+    connections = ConnectionPool()
+    get(connections, server, 3)
+    assert connections.stats() == {'hosts': 1, 'connections_opened': 1,
+                                   'connections_reused': 2, 'requests': 3}
+
+
+def test_connections_closed_without_keep_alive(server):
+    connections = ConnectionPool(keep_alive=False)
+    get(connections, server, 3)
+    stats = connections.stats()
+    assert stats['connections_opened'] == 3
+    assert stats['connections_reused'] == 0
+
+
+def test_idle_connections_are_dropped(server, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(pool, 'timer', lambda: now[0])
+    connections = ConnectionPool(idle_timeout=10)
+    get(connections, server, 2)
+    now[0] += 11
+    get(connections, server, 1)
+    # The counters of the dropped host pool are kept
+    assert connections.stats() == {'hosts': 1, 'connections_opened': 2,
+                                   'connections_reused': 1, 'requests': 3}
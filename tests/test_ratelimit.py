@@ -0,0 +1,99 @@
+"""Tests of the rate limiters."""
+
+from __future__ import print_function, unicode_literals
+
+import pytest
+
+from hutoma import ratelimit
+from hutoma.ratelimit import LeakyBucket, TokenBucket, limiter_for
+
+
+class Clock(object):
+    """A clock advanced by hand, standing in for timeit's default_timer."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, 'timer', clock)
+    return clock
+
+
+def test_token_bucket_allows_burst_then_paces(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    assert round(bucket.reserve(), 6) == 0.5
+    assert round(bucket.reserve(), 6) == 1.0
+
+
+def test_token_bucket_refills_up_to_burst(clock):
+    bucket = TokenBucket(rate=1, burst=2)
+    bucket.reserve()
+    bucket.reserve()
+    clock.now += 10
+    assert [bucket.reserve() for _ in range(2)] == [0, 0]
+    assert round(bucket.reserve(), 6) == 1.0
+
+
+def test_leaky_bucket_spaces_requests(clock):
+    bucket = LeakyBucket(rate=4, burst=1)
+    assert bucket.reserve() == 0
+    assert round(bucket.reserve(), 6) == 0.25
+    assert round(bucket.reserve(), 6) == 0.5
+    clock.now += 1
+    assert bucket.reserve() == 0
+
+
+def test_leaky_bucket_tolerates_burst(clock):
+    bucket = LeakyBucket(rate=1, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    assert round(bucket.reserve(), 6) == 1.0
+
+
+@pytest.mark.parametrize('kind', sorted(ratelimit.LIMITERS))
+def test_zero_rate_means_no_limit(clock, kind):
+    limiter = ratelimit.LIMITERS[kind](0)
+    assert [limiter.reserve() for _ in range(100)] == [0] * 100
+
+
+def test_tighten_keeps_the_tokens_refilled(clock):
+    bucket = TokenBucket(rate=1, burst=4)
+    bucket.reserve()
+    bucket.tighten(0.5, 2)
+    assert (bucket.rate, bucket.burst) == (0.5, 2)
+    assert [bucket.reserve() for _ in range(2)] == [0, 0]
+    assert round(bucket.reserve(), 6) == 2.0
+    # Looser settings are ignored
+    bucket.tighten(0, 8)
+    assert (bucket.rate, bucket.burst) == (0.5, 2)
+
+
+def test_limiter_for_is_shared_per_domain(clock):
+    limiter = limiter_for('test-shared.example', 2.0)
+    assert limiter_for('test-shared.example', 2.0) is limiter
+    assert limiter_for('test-shared.example', 1.0, 2) is limiter
+    assert limiter_for('test-other.example', 2.0) is not limiter
+    assert isinstance(limiter_for('test-leaky.example', 2.0,
+                                  kind='leaky_bucket'), LeakyBucket)
+
+
+def test_limiter_for_keeps_the_strictest_settings(clock):
+    limiter = limiter_for('test-strict.example', 1.0, 3)
+    limiter_for('test-strict.example', 2.0, 4)
+    limiter_for('test-strict.example', 0)
+    assert (limiter.rate, limiter.burst) == (0.5, 3)
+    limiter = limiter_for('test-unlimited.example', 0)
+    limiter_for('test-unlimited.example', 4.0)
+    assert limiter.rate == 0.25
+
+
+def test_limiter_for_keeps_its_state(clock):
+    limiter_for('test-state.example', 1.0).reserve()
+    # Tightening the limiter does not grant a fresh burst
+    assert round(limiter_for('test-state.example', 2.0).reserve(), 6) == 2.0
@@ -0,0 +1,78 @@
+"""Tests of recording and replaying the traffic of a client."""
+
+from __future__ import print_function, unicode_literals
+
+import os
+from timeit import default_timer as timer
+
+import pytest
+
+from hutoma import HutomaUserKey
+from hutoma.errors import ClientException
+from hutoma.replay import Archive, RecordingHandler, ReplayHandler
+
+from conftest import SETTINGS
+
+
+def client(server, handler, **settings):
+    return HutomaUserKey('test', handler=handler, **dict(
+        SETTINGS, **dict(server.client_settings(), **settings)))
+
+
+def use(session):
+    """Make requests of every kind and return what they returned."""
+    return (session.get_ai_list(), session.get_ai('ai-1'),
+            session.chat('ai-1', 'Is the sky blue?'),
+            b''.join(session.speak('ai-1', 'Blue.')))
+
+
+def test_record_and_replay(tmpdir, server):
+    path = str(tmpdir.join('archive.jsonl'))
+    recording = client(server, RecordingHandler(path))
+    recorded = use(recording)
+    # Cached responses are not recorded again; streamed ones are not cached
+    use(recording)
+    recording.handler.archive.close()
+    assert len(Archive(path)) == 5
+    assert os.path.exists(path + '.index')
+    counts = dict(server.counts)
+
+    # Without a rate limit, despite the delay between requests
+    replaying = client(server, ReplayHandler(path, time_scale=0),
+                       api_request_delay=60)
+    started = timer()
+    assert use(replaying) == recorded
+    assert timer() - started < 5
+    assert server.counts == counts
+    with pytest.raises(ClientException):
+        replaying.get_ai('ai-2')
+
+
+def test_responses_to_a_request_served_in_turn(tmpdir, server):
+    path = str(tmpdir.join('archive.jsonl'))
+    recording = client(server, RecordingHandler(path))
+    for answer in ('Blue.', 'Grey.'):
+        server.payloads['chat'] = server.payloads['chat'].replace(
+            b'Blue.', answer.encode('utf-8'))
+        recording.chat('ai-1', 'Sky?')
+        recording.handler.clear_cache()
+    recording.handler.archive.close()
+    replaying = client(server, ReplayHandler(path, time_scale=0))
+    answers = []
+    for _ in range(3):
+        answers.append(replaying.chat('ai-1', 'Sky?')['result']['answer'])
+        replaying.handler.clear_cache()
+    assert answers == ['Blue.', 'Grey.', 'Blue.']
+
+
+def test_incomplete_archive_is_cut(tmpdir, server):
+    path = str(tmpdir.join('archive.jsonl'))
+    recording = client(server, RecordingHandler(path))
+    recording.get_ai('ai-1')
+    recording.handler.archive.close()
+    with open(path, 'ab') as archive:
+        archive.write(b'{"key": "interrupted')
+    assert len(Archive(path)) == 1
+    assert os.path.getsize(path) > 0
+    replaying = client(server, ReplayHandler(path, time_scale=0))
+    assert replaying.get_ai('ai-1')['ai']['aiid'] == 'ai-1'
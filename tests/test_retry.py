@@ -0,0 +1,108 @@
+"""Tests of the retry policy."""
+
+from __future__ import print_function, unicode_literals
+
+import json
+import time
+from email.utils import formatdate
+
+from requests import Response
+from requests.exceptions import ConnectionError  # pylint: disable=W0622
+from requests.exceptions import ConnectTimeout, ReadTimeout
+
+from hutoma.errors import HTTPException
+from hutoma.retry import RetryPolicy, server_delay
+
+
+class Ceiling(object):
+    """A `random` returning the upper bound of the range."""
+
+    @staticmethod
+    def uniform(_, high):
+        return high
+
+
+def response(status=503, headers=None, body=None):
+    raw = Response()
+    raw.status_code = status
+    raw.headers.update(headers or {})
+    if body is not None:
+        # pylint: disable=W0212
+        raw.headers['Content-Type'] = 'application/json'
+        raw._content = json.dumps(body).encode('utf-8')
+    return raw
+
+
+def policy(**kwargs):
+    kwargs.setdefault('budget', None)
+    retry = RetryPolicy(**kwargs)
+    retry.random = Ceiling()
+    return retry
+
+
+def test_backoff_doubles_up_to_max():
+    retry = policy(attempts=10, backoff=0.5, max_backoff=3)
+    error = HTTPException(response())
+    assert [retry.delay(error, 'GET', attempt) for attempt in
+            range(1, 6)] == [0.5, 1, 2, 3, 3]
+
+
+def test_gives_up_after_attempts():
+    retry = policy(attempts=2)
+    assert retry.delay(HTTPException(response()), 'GET', 1) is not None
+    assert retry.delay(HTTPException(response()), 'GET', 2) is None
+
+
+def test_only_retries_codes():
+    retry = policy()
+    assert retry.delay(HTTPException(response(404)), 'GET', 1) is None
+    assert retry.delay(HTTPException(response(429)), 'GET', 1) is not None
+    assert retry.delay(ValueError(), 'GET', 1) is None
+
+
+def test_connection_errors_of_non_idempotent_requests():
+    retry = policy()
+    assert retry.delay(ConnectionError(), 'GET', 1) is not None
+    assert retry.delay(ReadTimeout(), 'GET', 1) is not None
+    assert retry.delay(ConnectionError(), 'POST', 1) is None
+    assert retry.delay(ReadTimeout(), 'POST', 1) is None
+    # The request never reached the server
+    assert retry.delay(ConnectTimeout(), 'POST', 1) is not None
+    assert policy(connection_errors=False).delay(
+        ConnectionError(), 'GET', 1) is None
+
+
+def test_server_delay_is_used_unless_too_long():
+    retry = policy(max_backoff=30)
+    assert retry.delay(HTTPException(response(headers={
+        'Retry-After': '7'})), 'GET', 1) == 7
+    assert retry.delay(HTTPException(response(headers={
+        'Retry-After': '60'})), 'GET', 1) is None
+
+
+def test_budget_limits_retries():
+    retry = RetryPolicy(attempts=5, budget=0)
+    retry.budget.min_retries = 2
+    error = HTTPException(response())
+    assert [retry.delay(error, 'GET', 1) is not None
+            for _ in range(3)] == [True, True, False]
+
+
+def test_server_delay_retry_after_seconds():
+    assert server_delay(response(headers={'Retry-After': '2.5'})) == 2.5
+
+
+def test_server_delay_retry_after_date():
+    date = formatdate(time.time() + 60, usegmt=True)
+    assert 55 < server_delay(response(headers={'Retry-After': date})) <= 60
+
+
+def test_server_delay_ratelimit_field():
+    assert server_delay(response(body={'ratelimit': '3'})) == 3
+    assert server_delay(response(body={'ratelimit': 'soon'})) is None
+
+
+def test_server_delay_none():
+    assert server_delay(response()) is None
+    assert server_delay(response(headers={'Retry-After': 'never'})) is None
+    assert server_delay(response(body=['not', 'a', 'dict'])) is None
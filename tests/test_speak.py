@@ -0,0 +1,40 @@
+"""Tests of streaming the audio of the speak route."""
+
+from __future__ import print_function, unicode_literals
+
+import io
+
+from hutoma.replay import RecordingHandler, ReplayHandler
+
+
+def test_speak_streams_chunks(server, session):
+    chunks = list(session.speak('ai-1', 'Blue.', chunk_size=4000))
+    assert [len(chunk) for chunk in chunks] == [4000, 4000, 2240]
+    assert b''.join(chunks) == server.audio
+    assert session.stats.snapshot()['speak']['first_byte']['count'] == 1
+
+
+def test_speak_to_a_file(server, session):
+    output = io.BytesIO()
+    assert session.speak('ai-1', 'Blue.', output) == len(server.audio)
+    assert output.getvalue() == server.audio
+
+
+def test_stream_content_is_not_cached(server, session):
+    url = session.config['speak'].format(aiid='ai-1')
+    for _ in range(2):
+        assert b''.join(session.stream_content(url, {'q': 'Hi'})) == \
+            server.audio
+    assert server.counts['speak'] == 2
+
+
+def test_replayed_speak(tmpdir, server, session):
+    path = str(tmpdir.join('archive.jsonl'))
+    session.handler = RecordingHandler(path)
+    recorded = b''.join(session.speak('ai-1', 'Blue.'))
+    session.handler.archive.close()
+    session.handler = ReplayHandler(path, time_scale=0)
+    chunks = list(session.speak('ai-1', 'Blue.', chunk_size=4000))
+    assert [len(chunk) for chunk in chunks] == [4000, 4000, 2240]
+    assert b''.join(chunks) == recorded == server.audio
+    assert server.counts['speak'] == 1
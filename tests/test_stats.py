@@ -0,0 +1,57 @@
+"""Tests of the client statistics."""
+
+from __future__ import print_function, unicode_literals
+
+import io
+import json
+
+from hutoma.stats import ClientStats, Histogram
+
+
+def test_histogram_percentiles_within_precision():
+    histogram = Histogram(precision=0.05)
+    for value in range(1, 1001):
+        histogram.record(value / 1000.0)
+    for percent, expected in ((50, 0.5), (95, 0.95), (99, 0.99)):
+        assert abs(histogram.percentile(percent) - expected) <= \
+            0.05 * expected
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 1000 and snapshot['max'] == 1.0
+    assert abs(snapshot['mean'] - 0.5005) < 1e-9
+
+
+def test_histogram_is_capped_by_its_maximum():
+    histogram = Histogram(precision=1.0, smallest=1.0)
+    histogram.record(0)
+    histogram.record(2.5)  # In the bucket from 2 to 4
+    assert histogram.percentile(100) == 2.5
+    assert abs(histogram.percentile(50) - 2 ** 0.5) < 1e-9
+    assert Histogram().snapshot()['p99'] == 0.0
+
+
+def test_client_stats_per_route_and_phase():
+    stats = ClientStats()
+    events = []
+    stats.subscribe(lambda *event: events.append(event))
+    stats.record('ai', 'total', 0.5)
+    stats.record_timings('ai', {'network': 0.25})
+    stats.unsubscribe(stats.callbacks[0])
+    stats.record('chat', 'total', 0.125)
+    assert events == [('ai', 'total', 0.5), ('ai', 'network', 0.25)]
+    snapshot = stats.snapshot()
+    assert sorted(snapshot) == ['ai', 'chat']
+    assert sorted(snapshot['ai']) == ['network', 'total']
+    stream = io.StringIO()
+    stats.dump(stream)
+    assert json.loads(stream.getvalue()) == snapshot
+    assert len(stats.format().splitlines()) == 4
+    stats.reset()
+    assert stats.snapshot() == {}
+
+
+def test_client_records_its_requests(session):
+    session.get_ai('ai-1')
+    phases = session.stats.snapshot()['ai']
+    for phase in ('prepare', 'cache_lookup', 'rate_limit_wait', 'network',
+                  'decode', 'total'):
+        assert phases[phase]['count'] == 1
@@ -0,0 +1,90 @@
+"""Tests of the incremental parsing of JSON responses."""
+
+from __future__ import print_function, unicode_literals
+
+import json
+
+import pytest
+
+from hutoma.streaming import iter_json_items
+
+DOCUMENT = {'status': {'code': 200, 'info': 'caf\xe9 \u2603'},
+            'ai_list': [{'aiid': 'a', 'name': 'First', 'score': 1.5e-3},
+                        {'aiid': 'b', 'name': 'Second "quoted"',
+                         'tags': [], 'nested': {'list': [1, 2, {}]}},
+                        12345678901234567890, None, True, 'text'],
+            'count': 6}
+
+
+class StreamedResponse(object):
+    """A streamed ``requests.Response`` whose body arrives in chunks."""
+
+    def __init__(self, body, chunk_size,
+                 content_type='application/json'):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.headers = {'content-type': content_type}
+        self.encoding = 'utf-8'
+
+    def iter_content(self, _):
+        for index in range(0, len(self.body), self.chunk_size):
+            yield self.body[index:index + self.chunk_size]
+
+
+def items(body, chunk_size, key='ai_list', **kwargs):
+    return list(iter_json_items(StreamedResponse(body, chunk_size), key,
+                                **kwargs))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 100000])
+def test_items_across_chunk_boundaries(chunk_size):
+    body = json.dumps(DOCUMENT, ensure_ascii=False).encode('utf-8')
+    fields = {}
+    assert items(body, chunk_size, fields=fields) == DOCUMENT['ai_list']
+    assert fields == {'status': DOCUMENT['status'], 'count': 6}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5])
+def test_whitespace_and_numbers_split_across_chunks(chunk_size):
+    body = b'{ "n" : 123456 ,\n "ai_list" : [ 1 , -2.5e3 ,\t3 ] }'
+    fields = {}
+    assert items(body, chunk_size, fields=fields) == [1, -2500.0, 3]
+    assert fields == {'n': 123456}
+
+
+def test_empty_list_body_and_object():
+    assert items(b'{"ai_list": []}', 1) == []
+    assert items(b'{}', 1) == []
+    assert items(b'', 1) == []
+
+
+def test_other_lists_are_fields():
+    fields = {}
+    assert items(b'{"other": [1], "ai_list": [2]}', 2,
+                 fields=fields) == [2]
+    assert fields == {'other': [1]}
+
+
+def test_object_hook():
+    assert items(b'{"ai_list": [{"a": 1}]}', 3,
+                 object_hook=lambda item: sorted(item)) == [['a']]
+
+
+def test_entities_unescaped_unless_json():
+    body = b'{"ai_list": ["a &amp; b"]}'
+    assert list(iter_json_items(StreamedResponse(body, 4, 'text/html'),
+                                'ai_list')) == ['a & b']
+    assert items(body, 4) == ['a &amp; b']
+
+
+@pytest.mark.parametrize('body', [b'[1, 2]', b'{"ai_list": [1, 2}',
+                                  b'{"ai_list": [1 2]}', b'{"ai_list"'])
+def test_invalid_json(body):
+    with pytest.raises(ValueError):
+        items(body, 3)
+
+
+def test_streamed_ai_list(session):
+    ais = list(session.get_ai_list(stream=True))
+    assert len(ais) == 10  # The payload_size of the server
+    assert len(set(ai.aiid for ai in ais)) == len(ais)
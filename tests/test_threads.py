@@ -0,0 +1,81 @@
+"""Stress test of one client shared by many threads.
+
+The threads share one client talking to a mock server that fails, redirects
+and sets cookies on a fraction of the requests. Each thread asks questions
+that no other thread asks, fetches AIs and lists AIs, so that cache misses,
+cache hits, retries, redirects and cookie updates all happen concurrently.
+The test fails when:
+
+- a chat answer echoes another thread's question,
+- an exception other than a failure after the retries is raised,
+- the client's stats did not record every request,
+- the cookies set by the server are missing from the client's jar.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import traceback
+from threading import Event, Lock, Thread
+
+from hutoma import HutomaUserKey
+from hutoma.errors import HutomaException
+from requests.exceptions import RequestException
+
+from conftest import SETTINGS
+from mock_server import MockHutomaServer
+
+THREADS = 16
+REQUESTS = 30
+
+
+def test_shared_client():
+    lock = Lock()
+    start = Event()
+    mismatches = []
+    unexpected = []
+    calls = [0]
+
+    def worker(session, number):
+        start.wait()
+        for index in range(REQUESTS):
+            question = 'question {0} of thread {1}'.format(index, number)
+            try:
+                if index % 3 == 0:
+                    answer = session.chat('ai-{0}'.format(number), question)
+                    if answer['result']['query'] != question:
+                        with lock:
+                            mismatches.append(question)
+                elif index % 3 == 1:
+                    session.get_ai('ai-{0}-{1}'.format(number, index))
+                else:
+                    session.get_ai_list()
+            except (HutomaException, RequestException):
+                pass  # Failed after the retries
+            except Exception:  # pylint: disable=W0703
+                with lock:
+                    unexpected.append(traceback.format_exc())
+            with lock:
+                calls[0] += 1
+
+    with MockHutomaServer(0.001, error_rate=0.05, redirect_rate=0.05,
+                          cookie_rate=0.05, seed=1) as server:
+        session = HutomaUserKey('test', **dict(
+            SETTINGS, pool_maxsize=THREADS, **server.client_settings()))
+        session.handler.clear_cache()
+        threads = [Thread(target=worker, args=(session, number))
+                   for number in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        cookies = server.cookies
+
+    assert not unexpected, unexpected[0]
+    assert not mismatches
+    assert calls[0] == THREADS * REQUESTS
+    recorded = sum(histograms['total']['count'] for histograms in
+                   session.stats.snapshot().values() if 'total' in histograms)
+    assert recorded == THREADS * REQUESTS
+    assert cookies and len(session.http.cookies)
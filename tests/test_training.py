@@ -0,0 +1,128 @@
+"""Tests of the uploads of training material."""
+
+from __future__ import print_function, unicode_literals
+
+import io
+
+import pytest
+
+from hutoma import training
+from hutoma.errors import (ClientException, TrainingDataMismatch,
+                           TrainingPairsRemoved)
+from hutoma.training import (DeltaTrainingUpload, iter_pair_digests,
+                             iter_training_chunks, iter_training_pairs)
+
+
+def write(tmpdir, questions, answers):
+    source = tmpdir.join('source.txt')
+    target = tmpdir.join('target.txt')
+    with io.open(str(source), 'w', encoding='utf-8', newline='') as stream:
+        stream.write(''.join(line + '\n' for line in questions))
+    with io.open(str(target), 'w', encoding='utf-8', newline='') as stream:
+        stream.write(''.join(line + '\n' for line in answers))
+    return str(source), str(target)
+
+
+def test_pairs(tmpdir):
+    paths = write(tmpdir, ['Hi', '', 'Caf\xe9?\r'], ['Hello', ' ', 'Yes'])
+    assert list(iter_training_pairs(*paths)) == [
+        ('Hi', 'Hello'), ('', ' '), ('Caf\xe9?', 'Yes')]
+    assert [pair[1:] for pair in iter_pair_digests(*paths)] == [
+        (0, 0), (4, 8)]
+
+
+@pytest.mark.parametrize('questions,answers,line', [
+    (['a', 'b', 'c'], ['A', 'B'], 3),
+    (['a'], ['A', 'B'], 2),
+    (['a', '', 'c'], ['A', 'B', 'C'], 2),
+    (['a', 'b'], ['A', '  '], 2),
+])
+def test_mismatched_files(tmpdir, questions, answers, line):
+    paths = write(tmpdir, questions, answers)
+    for iterator in (iter_training_pairs, iter_pair_digests):
+        with pytest.raises(TrainingDataMismatch) as error:
+            list(iterator(*paths))
+        assert error.value.line == line
+
+
+def test_mismatch_raised_after_the_aligned_pairs(tmpdir):
+    pairs = iter_training_pairs(*write(tmpdir, ['a', 'b'], ['A']))
+    assert next(pairs) == ('a', 'A')
+    with pytest.raises(TrainingDataMismatch):
+        next(pairs)
+
+
+def test_chunks_do_not_split_pairs():
+    pairs = [('q{0}'.format(index), 'a{0}'.format(index))
+             for index in range(5)] + [('', '')]
+    chunks = list(iter_training_chunks(pairs, max_size=14))
+    assert chunks == [b'q0\na0\n\nq1\na1\n\n', b'q2\na2\n\nq3\na3\n\n',
+                      b'q4\na4\n\n']
+    with pytest.raises(ClientException):
+        list(iter_training_chunks(pairs, max_size=5))
+
+
+class RecordingUpload(DeltaTrainingUpload):
+    """A DeltaTrainingUpload recording its chunks instead of uploading."""
+
+    def _upload(self, index, chunk):
+        self.sent.append(chunk)
+        return index
+
+
+def upload(tmpdir, questions, answers=None):
+    if answers is None:
+        answers = ['A ' + line if line else '' for line in questions]
+    paths = write(tmpdir, questions, answers)
+    delta = RecordingUpload(None, 'ai', paths[0], paths[1],
+                            str(tmpdir.join('manifest')))
+    delta.sent = []
+    delta.run()
+    return delta, sorted(line for chunk in delta.sent
+                         for line in chunk.decode('utf-8').split('\n')
+                         if line and not line.startswith('A '))
+
+
+@pytest.mark.parametrize('run_pairs', [2, training.SORT_RUN_PAIRS])
+def test_delta_upload(tmpdir, monkeypatch, run_pairs):
+    monkeypatch.setattr(training, 'SORT_RUN_PAIRS', run_pairs)
+    questions = ['q{0}'.format(index) for index in range(10)] + ['d', 'd']
+    delta, sent = upload(tmpdir, questions)
+    assert (delta.mode, delta.added, len(sent)) == ('full', 12, 12)
+
+    delta, sent = upload(tmpdir, questions)
+    assert (delta.mode, sent) == ('unchanged', [])
+
+    delta, sent = upload(tmpdir, ['new', ''] + questions[::-1] + ['d'])
+    assert (delta.mode, delta.added, delta.removed) == ('delta', 2, 0)
+    assert sent == ['d', 'new']
+
+    for _ in range(2):  # The manifest is kept, so they are still removed
+        with pytest.raises(TrainingPairsRemoved) as error:
+            upload(tmpdir, questions[1:])
+        assert (error.value.added, error.value.removed) == (0, 3)
+
+
+def test_delta_upload_of_an_edited_answer(tmpdir):
+    questions = ['q0', 'q1', 'q2']
+    answers = ['A q0', 'A q1', 'A q2']
+    upload(tmpdir, questions, answers)
+    answers[1] = 'A new q1'
+    delta = RecordingUpload(None, 'ai', *write(tmpdir, questions, answers),
+                            manifest_path=str(tmpdir.join('manifest')))
+    delta.sent = []
+    with pytest.raises(TrainingPairsRemoved) as error:
+        delta.run()
+    assert (delta.mode, delta.added, delta.removed) == ('removed', 1, 1)
+    assert (error.value.added, error.value.removed) == (1, 1)
+    assert delta.sent == []
+
+
+def test_delta_upload_to_another_ai(tmpdir):
+    upload(tmpdir, ['q'])
+    paths = write(tmpdir, ['q'], ['A q'])
+    other = RecordingUpload(None, 'other', paths[0], paths[1],
+                            str(tmpdir.join('manifest')))
+    other.sent = []
+    other.run()
+    assert other.mode == 'full' and len(other.sent) == 1